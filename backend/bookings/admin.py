@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Booking, BookedSeat, Payment
+from .models import Booking, BookedSeat, Payment, PaymentJob, WebhookEvent
+from .webhooks import requeue
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -17,4 +18,23 @@ class BookedSeatAdmin(admin.ModelAdmin):
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ['booking', 'payment_method', 'amount', 'status', 'created_at']
     list_filter = ['payment_method', 'status', 'created_at']
-    search_fields = ['transaction_id', 'booking__booking_reference']
\ No newline at end of file
+    search_fields = ['transaction_id', 'booking__booking_reference']
+
+
+@admin.register(PaymentJob)
+class PaymentJobAdmin(admin.ModelAdmin):
+    list_display = ['booking', 'kind', 'status', 'attempts', 'run_after', 'created_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['intent_id', 'idempotency_key', 'booking__booking_reference']
+    exclude = ['payment_source']
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'status', 'attempts', 'event_created', 'processed_at']
+    list_filter = ['status', 'event_type']
+    search_fields = ['event_id', 'object_id']
+    actions = ['requeue_dead']
+    
+    @admin.action(description='Requeue dead events')
+    def requeue_dead(self, request, queryset):
+        self.message_user(request, f'Requeued {requeue(queryset)} events')
@@ -0,0 +1,133 @@
+"""
+Payment gateways used by the payment job worker (see bookings.payments).
+
+A gateway turns one payment attempt into a GatewayResult. Every call takes
+the job's idempotency key, so a job retried after a timeout or a worker
+crash can never charge twice. Errors worth retrying (network trouble, rate
+limits, gateway outages) raise TransientGatewayError; a declined card or a
+bad request comes back as a result with status 'failed'.
+
+settings.PAYMENT_GATEWAY picks the gateway: StripeGateway in production,
+FakeGateway to run the whole pipeline offline.
+"""
+import hashlib
+import time
+from functools import lru_cache
+from typing import NamedTuple
+
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class GatewayResult(NamedTuple):
+    # 'succeeded', 'requires_action', 'requires_confirmation' (intent created,
+    # client confirms it) or 'failed'
+    status: str
+    intent_id: str = ''
+    client_secret: str = ''
+    error: str = ''
+
+
+class TransientGatewayError(Exception):
+    """The attempt may not have reached the gateway; retry with the same key"""
+
+
+# Network trouble, rate limiting and 5xx responses from Stripe
+TRANSIENT_ERRORS = (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+
+
+class StripeGateway:
+    def __init__(self):
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+
+    def create_intent(self, amount_cents, metadata, description, idempotency_key,
+                      payment_method=None, card_token=None):
+        """Create a PaymentIntent, confirming it when a payment method or card token is given"""
+        params = {
+            'amount': amount_cents,
+            'currency': 'eur',
+            'metadata': metadata,
+            'description': description,
+        }
+        if payment_method:
+            params.update(
+                payment_method=payment_method,
+                confirm=True,
+                automatic_payment_methods={'enabled': True, 'allow_redirects': 'never'},
+            )
+        elif card_token:
+            params.update(
+                payment_method_data={'type': 'card', 'card': {'token': card_token}},
+                confirm=True,
+            )
+
+        try:
+            intent = stripe.PaymentIntent.create(idempotency_key=idempotency_key, **params)
+        except stripe.error.CardError as e:
+            return GatewayResult('failed', error=e.user_message or 'Your card was declined')
+        except TRANSIENT_ERRORS as e:
+            raise TransientGatewayError(str(e)) from e
+        except stripe.error.StripeError as e:
+            return GatewayResult('failed', error=e.user_message or str(e))
+
+        if not params.get('confirm'):
+            return GatewayResult('requires_confirmation', intent.id, intent.client_secret)
+        if intent.status == 'succeeded':
+            return GatewayResult('succeeded', intent.id, intent.client_secret)
+        if intent.status == 'requires_action':
+            return GatewayResult('requires_action', intent.id, intent.client_secret)
+        return GatewayResult('failed', intent.id, error=f'Payment failed with status: {intent.status}')
+
+    def refund(self, intent_id, idempotency_key):
+        """Refund intent_id in full; refunding it again is a no-op"""
+        try:
+            stripe.Refund.create(payment_intent=intent_id, idempotency_key=idempotency_key)
+        except TRANSIENT_ERRORS as e:
+            raise TransientGatewayError(str(e)) from e
+        except stripe.error.InvalidRequestError as e:
+            if e.code != 'charge_already_refunded':
+                raise
+
+
+class FakeGateway:
+    """
+    Offline stand-in for Stripe. Payment methods (or card tokens) steer the
+    outcome like Stripe's test cards: 'pm_card_chargeDeclined' is declined,
+    'pm_card_authenticationRequired' needs 3D Secure, 'pm_card_unavailable'
+    fails transiently and anything else succeeds. Intent ids derive from the
+    idempotency key, so a retried attempt sees the same intent.
+    """
+    DECLINED = 'pm_card_chargeDeclined'
+    REQUIRES_ACTION = 'pm_card_authenticationRequired'
+    UNAVAILABLE = 'pm_card_unavailable'
+
+    def __init__(self):
+        self.latency = getattr(settings, 'FAKE_GATEWAY_LATENCY_SECONDS', 0)
+        self.refunded = set()
+
+    def create_intent(self, amount_cents, metadata, description, idempotency_key,
+                      payment_method=None, card_token=None):
+        if self.latency:
+            time.sleep(self.latency)
+
+        intent_id = 'pi_fake_' + hashlib.sha256(idempotency_key.encode()).hexdigest()[:24]
+        client_secret = f'{intent_id}_secret'
+        method = payment_method or card_token
+        if method is None:
+            return GatewayResult('requires_confirmation', intent_id, client_secret)
+        if method == self.UNAVAILABLE:
+            raise TransientGatewayError('Fake gateway unavailable')
+        if method == self.DECLINED:
+            return GatewayResult('failed', intent_id, error='Your card was declined')
+        if method == self.REQUIRES_ACTION:
+            return GatewayResult('requires_action', intent_id, client_secret)
+        return GatewayResult('succeeded', intent_id, client_secret)
+
+    def refund(self, intent_id, idempotency_key):
+        self.refunded.add(intent_id)
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    return import_string(getattr(settings, 'PAYMENT_GATEWAY', 'bookings.gateways.StripeGateway'))()
@@ -0,0 +1,80 @@
+"""
+Booking history for the user dashboard.
+
+GET /api/bookings/bookings/history/ lists the user's bookings as flat
+entries (movie, cinema, screen and seat labels inlined) instead of the
+nested BookingSerializer, read with one query for the page and one for its
+seats. ?when=upcoming keeps bookings whose showtime hasn't started yet,
+soonest first; ?when=past the others, latest first; without it every
+booking is listed, latest showtime first. All three are ranges over
+Booking.starts_at, a copy of the showtime's start time, on the
+booking_user_starts_idx index.
+
+Pages are not cached: checking a cached page is still current would cost a
+query per request, about what reading the page costs.
+"""
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Booking, BookedSeat
+
+
+FILTERS = ('upcoming', 'past')
+
+
+def showtime_moved(showtime):
+    """Carry a rescheduled showtime's start time over to its bookings"""
+    Booking.objects.filter(showtime=showtime).update(starts_at=showtime.start_time, updated_at=timezone.now())
+
+
+def history_queryset(user, when=None, now=None):
+    now = now or timezone.now()
+    bookings = Booking.objects.filter(user=user)
+    if when == 'upcoming':
+        bookings = bookings.filter(starts_at__gte=now)
+    elif when == 'past':
+        bookings = bookings.filter(starts_at__lt=now)
+
+    seats = BookedSeat.objects.select_related('seat').only('booking_id', 'seat__row', 'seat__number')
+    return (
+        bookings
+        .select_related('showtime__movie', 'showtime__screen__cinema')
+        .only(
+            'id', 'booking_reference', 'status', 'total_amount', 'expires_at', 'starts_at', 'created_at',
+            'showtime__id', 'showtime__end_time', 'showtime__is_3d',
+            'showtime__movie__id', 'showtime__movie__title', 'showtime__movie__poster_image',
+            'showtime__screen__id', 'showtime__screen__name',
+            'showtime__screen__cinema__id', 'showtime__screen__cinema__name',
+        )
+        .prefetch_related(Prefetch('booked_seats', queryset=seats.order_by('seat__row', 'seat__number')))
+    )
+
+
+def history_entry(booking, request=None):
+    showtime = booking.showtime
+    movie, screen = showtime.movie, showtime.screen
+
+    poster = movie.poster_image.name if movie.poster_image else None
+    if poster and not poster.startswith(('http://', 'https://')):
+        poster = request.build_absolute_uri(movie.poster_image.url) if request else movie.poster_image.url
+
+    return {
+        'id': booking.id,
+        'booking_reference': booking.booking_reference,
+        'status': booking.status,
+        'total_amount': str(booking.total_amount),
+        'expires_at': booking.expires_at,
+        'created_at': booking.created_at,
+        'showtime_id': showtime.id,
+        'start_time': booking.starts_at,
+        'end_time': showtime.end_time,
+        'is_3d': showtime.is_3d,
+        'movie_id': movie.id,
+        'movie_title': movie.title,
+        'poster_image': poster,
+        'cinema_id': screen.cinema.id,
+        'cinema_name': screen.cinema.name,
+        'screen_name': screen.name,
+        'seats': [f'{booked.seat.row}{booked.seat.number}' for booked in booking.booked_seats.all()],
+    }
+
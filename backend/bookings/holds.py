@@ -0,0 +1,104 @@
+"""
+Seat holds for PENDING bookings.
+
+A new booking holds its seats until Booking.expires_at. Nothing runs when a
+hold lapses; instead it is released
+
+    - lazily, when a seat map is read or a new booking collides with it
+      (release_lapsed_holds for one showtime), and
+    - by the expire_holds reaper, a chunk of bookings at a time.
+
+Releasing marks the bookings EXPIRED, frees their SeatInventory rows and
+moves the seats back to available, exactly as if each booking had been
+cancelled. Starting a payment extends the hold (extend_hold).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from cinema_project.db import immediate_atomic
+from movies.models import Showtime
+from movies.seat_events import publish_seat_changes
+from .models import Booking, SeatInventory
+
+
+def hold_expiry(now=None):
+    return (now or timezone.now()) + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+
+
+def extend_hold(booking, minutes=None):
+    """
+    Push booking's hold to at least minutes from now. Returns False when the
+    hold has already been released (or the booking isn't PENDING)
+    """
+    if booking.status != 'PENDING':
+        return False
+
+    minutes = minutes or settings.BOOKING_HOLD_EXTENSION_MINUTES
+    expires_at = max(booking.expires_at or timezone.now(), timezone.now() + timedelta(minutes=minutes))
+    # Conditional, so a hold released concurrently is never revived
+    if not Booking.objects.filter(pk=booking.pk, status='PENDING').update(
+        expires_at=expires_at, updated_at=timezone.now()
+    ):
+        return False
+    booking.expires_at = expires_at
+    return True
+
+
+def lapsed_holds(now=None):
+    return Booking.objects.filter(status='PENDING', expires_at__lte=now or timezone.now())
+
+
+def expire_bookings(booking_ids, now=None):
+    """
+    Release the holds of booking_ids that have lapsed by now, in bulk.
+    Returns the number of bookings expired.
+    """
+    now = now or timezone.now()
+    with immediate_atomic():
+        # Re-checked under lock: a payment may have extended a hold since it was picked
+        booking_ids = list(
+            lapsed_holds(now).select_for_update().filter(pk__in=list(booking_ids)).values_list('pk', flat=True)
+        )
+        if not booking_ids:
+            return 0
+
+        released = {}
+        for showtime_id, seat_id in SeatInventory.objects.filter(booking_id__in=booking_ids).values_list('showtime_id', 'seat_id'):
+            released.setdefault(showtime_id, []).append(seat_id)
+
+        # Bulk writes skip Booking.save: free the inventory and counters, and tell live seat maps, here
+        Booking.objects.filter(pk__in=booking_ids).update(status='EXPIRED', expires_at=None, updated_at=now)
+        SeatInventory.objects.filter(booking_id__in=booking_ids).delete()
+        for showtime in Showtime.objects.filter(pk__in=list(released)).only('id', 'screen_id', 'start_time'):
+            showtime.adjust_seat_counts(-len(released[showtime.pk]))
+            publish_seat_changes(showtime.pk, released=released[showtime.pk])
+    return len(booking_ids)
+
+
+def release_lapsed_holds(showtime, seat_ids=None):
+    """
+    Lazy expiry for one showtime (optionally only holds on seat_ids).
+    Returns the number of bookings expired.
+    """
+    now = timezone.now()
+    held = SeatInventory.objects.filter(
+        showtime=showtime, booking__status='PENDING', booking__expires_at__lte=now
+    )
+    if seat_ids is not None:
+        held = held.filter(seat_id__in=list(seat_ids))
+
+    booking_ids = set(held.values_list('booking_id', flat=True))
+    return expire_bookings(booking_ids, now) if booking_ids else 0
+
+
+def reap(batch_size=500, now=None):
+    """Expire every lapsed hold, batch_size bookings per transaction. Returns the number expired"""
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        booking_ids = list(lapsed_holds(now).order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+        if not booking_ids:
+            return expired
+        expired += expire_bookings(booking_ids, now)
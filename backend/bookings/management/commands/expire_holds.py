@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from bookings.holds import reap
+import time
+
+
+class Command(BaseCommand):
+    help = 'Release the seats of PENDING bookings whose hold has lapsed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Bookings expired per transaction'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep running, reaping every this many seconds'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            expired = reap(batch_size=options['batch_size'])
+            if expired or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Expired {expired} bookings'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from bookings.payments import process_due_jobs
+import time
+
+
+class Command(BaseCommand):
+    help = 'Run queued payment jobs against the payment gateway'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Payment jobs run concurrently'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Jobs claimed at a time'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep running, checking for due jobs every this many seconds'
+        )
+    
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payments') as executor:
+            while True:
+                processed = process_due_jobs(executor, batch_size=options['batch_size'])
+                if processed or not options['interval']:
+                    self.stdout.write(self.style.SUCCESS(f'Ran {processed} payment jobs'))
+                if not options['interval']:
+                    return
+                time.sleep(options['interval'])
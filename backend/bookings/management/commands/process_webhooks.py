@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from bookings.models import WebhookEvent
+from bookings.webhooks import process_pending, requeue
+import time
+
+
+class Command(BaseCommand):
+    help = 'Apply pending Stripe webhook events from the inbox, oldest first'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Events claimed at a time'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep running, checking for pending events every this many seconds'
+        )
+        parser.add_argument(
+            '--requeue-dead',
+            action='store_true',
+            help='Retry dead-lettered events first'
+        )
+    
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            requeued = requeue(WebhookEvent.objects.all())
+            self.stdout.write(f'Requeued {requeued} dead events')
+        
+        while True:
+            processed, failed = process_pending(batch_size=options['batch_size'])
+            if processed or failed or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Processed {processed} events, {failed} failed'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
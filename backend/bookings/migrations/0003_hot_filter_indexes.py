@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookedseat',
+            index=models.Index(fields=['seat', 'booking'], name='bookedseat_seat_booking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['showtime', 'status'], name='booking_showtime_status_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:46
+
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def populate_seat_inventory(apps, schema_editor):
+    BookedSeat = apps.get_model('bookings', 'BookedSeat')
+    Booking = apps.get_model('bookings', 'Booking')
+    SeatInventory = apps.get_model('bookings', 'SeatInventory')
+    Showtime = apps.get_model('movies', 'Showtime')
+    
+    held = (
+        BookedSeat.objects.filter(booking__status__in=['PENDING', 'CONFIRMED'])
+        .order_by('booking_id')
+        .values_list('booking_id', 'booking__showtime_id', 'seat_id')
+        .iterator(chunk_size=2000)
+    )
+    
+    # Seats double booked before the constraint existed go to the earliest
+    # booking. A later booking that shares any seat with it can't keep the
+    # rest of its seats either, so it is expired as a whole
+    taken = set()
+    inventory = []
+    losers = set()
+    affected = set()
+    for booking_id, seats in groupby(held, key=itemgetter(0)):
+        seats = [(showtime_id, seat_id) for _booking_id, showtime_id, seat_id in seats]
+        if taken.isdisjoint(seats):
+            taken.update(seats)
+            inventory.extend(
+                SeatInventory(showtime_id=showtime_id, seat_id=seat_id, booking_id=booking_id)
+                for showtime_id, seat_id in seats
+            )
+        else:
+            losers.add(booking_id)
+            affected.add(seats[0][0])
+    
+    SeatInventory.objects.bulk_create(inventory, batch_size=1000)
+    Booking.objects.filter(pk__in=losers).update(status='EXPIRED')
+    
+    # The seat counters counted the expired bookings; recount what is held now
+    for showtime in Showtime.objects.filter(pk__in=affected).select_related('screen'):
+        booked = SeatInventory.objects.filter(showtime_id=showtime.pk).count()
+        Showtime.objects.filter(pk=showtime.pk).update(
+            booked_count=booked,
+            available_count=showtime.screen.total_seats - booked,
+            seat_version=F('seat_version') + 1,
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0014_movie_tmdb_image_paths'),
+        ('bookings', '0003_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_inventory', to='bookings.booking')),
+                ('seat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.seat')),
+                ('showtime', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_inventory', to='movies.showtime')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='seatinventory',
+            constraint=models.UniqueConstraint(fields=('showtime', 'seat'), name='seat_inventory_showtime_seat_uniq'),
+        ),
+        migrations.RunPython(populate_seat_inventory, migrations.RunPython.noop),
+    ]
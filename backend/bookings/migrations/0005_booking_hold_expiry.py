@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:49
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_pending_holds(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    
+    # Holds count from when the booking was made, so abandoned checkouts
+    # left over from before expiry existed are reaped straight away
+    Booking.objects.filter(status='PENDING').update(
+        expires_at=F('created_at') + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_seat_inventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled'), ('REFUNDED', 'Refunded'), ('EXPIRED', 'Expired')], default='PENDING', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'expires_at'], name='booking_hold_expiry_idx'),
+        ),
+        migrations.RunPython(start_pending_holds, migrations.RunPython.noop),
+    ]
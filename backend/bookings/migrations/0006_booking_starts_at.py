@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_start_times(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    Showtime = apps.get_model('movies', 'Showtime')
+    
+    Booking.objects.update(
+        starts_at=Subquery(Showtime.objects.filter(pk=OuterRef('showtime_id')).values('start_time')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_booking_hold_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'starts_at', 'id'], name='booking_user_starts_idx'),
+        ),
+        migrations.RunPython(copy_start_times, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_booking_starts_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('CARD', 'Card payment method'), ('GOOGLE_PAY', 'Google Pay token'), ('INTENT', 'Payment intent for client-side confirmation')], max_length=20)),
+                ('idempotency_key', models.CharField(max_length=100, unique=True)),
+                ('payment_source', models.CharField(blank=True, max_length=500)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('SUCCEEDED', 'Succeeded'), ('REQUIRES_ACTION', 'Requires action'), ('FAILED', 'Failed')], default='QUEUED', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('intent_id', models.CharField(blank=True, max_length=100)),
+                ('client_secret', models.CharField(blank=True, max_length=200)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_jobs', to='bookings.booking')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='payment_job_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:19
+
+from django.db import migrations, models
+
+
+def unconfirmed_intents(apps, schema_editor):
+    PaymentJob = apps.get_model('bookings', 'PaymentJob')
+    # INTENT jobs used to be SUCCEEDED as soon as the intent existed
+    PaymentJob.objects.filter(kind='INTENT', status='SUCCEEDED').exclude(
+        booking__status='CONFIRMED'
+    ).update(status='AWAITING_CONFIRMATION')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_webhook_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentjob',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('SUCCEEDED', 'Succeeded'), ('REQUIRES_ACTION', 'Requires action'), ('AWAITING_CONFIRMATION', 'Awaiting confirmation'), ('FAILED', 'Failed')], default='QUEUED', max_length=30),
+        ),
+        migrations.RunPython(unconfirmed_intents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+def populate_object_id(apps, schema_editor):
+    WebhookEvent = apps.get_model('bookings', 'WebhookEvent')
+    events = []
+    for event in WebhookEvent.objects.only('id', 'payload').iterator(chunk_size=1000):
+        event.object_id = ((event.payload.get('data') or {}).get('object') or {}).get('id') or ''
+        events.append(event)
+    WebhookEvent.objects.bulk_update(events, ['object_id'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_payment_job_awaiting_confirmation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='object_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['object_id', 'status', 'event_created'], name='webhook_event_object_idx'),
+        ),
+        migrations.RunPython(populate_object_id, migrations.RunPython.noop),
+    ]
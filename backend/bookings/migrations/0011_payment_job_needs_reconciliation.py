@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_webhook_event_object_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentjob',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('SUCCEEDED', 'Succeeded'), ('REQUIRES_ACTION', 'Requires action'), ('AWAITING_CONFIRMATION', 'Awaiting confirmation'), ('NEEDS_RECONCILIATION', 'Needs reconciliation'), ('FAILED', 'Failed')], default='QUEUED', max_length=30),
+        ),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth.models import User
 from movies.models import Showtime, Seat
+from movies.seat_events import publish_seat_changes
 import random
 import string
 
@@ -10,24 +15,91 @@ class Booking(models.Model):
         ('CONFIRMED', 'Confirmed'),
         ('CANCELLED', 'Cancelled'),
         ('REFUNDED', 'Refunded'),
+        ('EXPIRED', 'Expired'),
     ]
     
+    # Statuses that hold their seats (and count towards Showtime.booked_count).
+    # save() and deletes (release_booking_seats) keep the counters in step;
+    # a queryset .update(status=...) does not, so code that changes statuses
+    # in bulk has to adjust them itself or run rebuild_seat_counters after
+    ACTIVE_STATUSES = ['PENDING', 'CONFIRMED']
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
     showtime = models.ForeignKey(Showtime, on_delete=models.CASCADE, related_name='bookings')
     booking_reference = models.CharField(max_length=20, unique=True)
     total_amount = models.DecimalField(max_digits=8, decimal_places=2)
     booking_fee = models.DecimalField(max_digits=5, decimal_places=2, default=1.00)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # End of the seat hold while PENDING (see bookings.holds); None once paid
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # Copy of showtime.start_time, so upcoming/past history is an index range
+    # (see bookings.history); moved along with the showtime
+    starts_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='booking_user_created_idx'),
+            # Active bookings of a showtime (seat availability, double booking checks)
+            models.Index(fields=['showtime', 'status'], name='booking_showtime_status_idx'),
+            # Lapsed holds, for the expire_holds reaper
+            models.Index(fields=['status', 'expires_at'], name='booking_hold_expiry_idx'),
+            # Upcoming/past booking history
+            models.Index(fields=['user', 'starts_at', 'id'], name='booking_user_starts_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.booking_reference} - {self.user.username}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so save() can spot transitions
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
+    @staticmethod
+    def new_reference():
+        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
+    
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+    
     def save(self, *args, **kwargs):
         if not self.booking_reference:
-            self.booking_reference = ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
-        super().save(*args, **kwargs)
+            self.booking_reference = self.new_reference()
+        if self.status != 'PENDING':
+            self.expires_at = None
+        if self.starts_at is None:
+            self.starts_at = self.showtime.start_time
+        
+        loaded_status = getattr(self, '_loaded_status', None)
+        was_active = loaded_status in self.ACTIVE_STATUSES
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            # Seats are only counted once BookedSeat rows exist, so a brand new
+            # booking is accounted for by whoever creates its seats
+            if loaded_status is not None and was_active != self.is_active:
+                if self.is_active:
+                    seat_ids = list(self.booked_seats.values_list('seat_id', flat=True))
+                    try:
+                        with transaction.atomic():
+                            SeatInventory.claim(self, seat_ids)
+                    except IntegrityError:
+                        # Someone else has taken a seat since; nothing of this save is kept
+                        raise ValidationError('Some seats are already booked', code='seats_taken')
+                    publish_seat_changes(self.showtime_id, taken=seat_ids)
+                else:
+                    seat_ids = list(self.seat_inventory.values_list('seat_id', flat=True))
+                    self.seat_inventory.all().delete()
+                    publish_seat_changes(self.showtime_id, released=seat_ids)
+                self.showtime.adjust_seat_counts(len(seat_ids) if self.is_active else -len(seat_ids))
+        
+        self._loaded_status = self.status
 
 class BookedSeat(models.Model):
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='booked_seats')
@@ -36,10 +108,41 @@ class BookedSeat(models.Model):
     
     class Meta:
         unique_together = ['booking', 'seat']
+        indexes = [
+            # "Is this seat already taken?" starts from the seat, not the booking
+            models.Index(fields=['seat', 'booking'], name='bookedseat_seat_booking_idx'),
+        ]
     
     def __str__(self):
         return f"{self.booking.booking_reference} - {self.seat}"
 
+class SeatInventory(models.Model):
+    """
+    One row per seat held by an active booking. The unique constraint is what
+    actually prevents double booking: claiming a taken seat fails on insert,
+    so bookings for different seats of a showtime never wait on each other.
+    Rows are deleted when their booking stops being active.
+    """
+    showtime = models.ForeignKey(Showtime, on_delete=models.CASCADE, related_name='seat_inventory')
+    seat = models.ForeignKey(Seat, on_delete=models.CASCADE)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='seat_inventory')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['showtime', 'seat'], name='seat_inventory_showtime_seat_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.showtime_id} - {self.seat_id}"
+    
+    @classmethod
+    def claim(cls, booking, seat_ids):
+        """Hold seat_ids for booking; raises IntegrityError if any is already held"""
+        return cls.objects.bulk_create([
+            cls(showtime_id=booking.showtime_id, seat_id=seat_id, booking=booking)
+            for seat_id in seat_ids
+        ])
+
 class Payment(models.Model):
     PAYMENT_METHODS = [
         ('CARD', 'Credit/Debit Card'),
@@ -62,4 +165,115 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"{self.booking.booking_reference} - {self.status}"
\ No newline at end of file
+        return f"{self.booking.booking_reference} - {self.status}"
+
+
+class PaymentJob(models.Model):
+    """
+    One payment attempt for a booking, queued by the payment endpoints and
+    run against the gateway by the process_payments worker (see
+    bookings.payments). Clients poll the job until it leaves QUEUED/RUNNING.
+    """
+    KINDS = [
+        ('CARD', 'Card payment method'),
+        ('GOOGLE_PAY', 'Google Pay token'),
+        ('INTENT', 'Payment intent for client-side confirmation'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('REQUIRES_ACTION', 'Requires action'),
+        ('AWAITING_CONFIRMATION', 'Awaiting confirmation'),
+        ('NEEDS_RECONCILIATION', 'Needs reconciliation'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    # Done with the gateway; REQUIRES_ACTION and AWAITING_CONFIRMATION are
+    # settled by the Stripe webhook once the client has confirmed, and
+    # NEEDS_RECONCILIATION once Stripe reports what became of the attempt
+    FINISHED_STATUSES = ['SUCCEEDED', 'REQUIRES_ACTION', 'AWAITING_CONFIRMATION', 'NEEDS_RECONCILIATION', 'FAILED']
+    
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='payment_jobs')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    # Sent to the gateway with every attempt, so retries never charge twice
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    # Payment method id or card token; cleared once the job has finished
+    payment_source = models.CharField(max_length=500, blank=True)
+    status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.IntegerField(default=0)
+    # Not picked up before this (retry backoff)
+    run_after = models.DateTimeField(default=timezone.now)
+    # A RUNNING job whose worker died is picked up again after this
+    locked_until = models.DateTimeField(null=True, blank=True)
+    intent_id = models.CharField(max_length=100, blank=True)
+    client_secret = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Due jobs, for the worker
+            models.Index(fields=['status', 'run_after'], name='payment_job_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.booking_id} - {self.kind} - {self.status}"
+    
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+class WebhookEvent(models.Model):
+    """
+    Inbox of Stripe webhook deliveries. The webhook endpoint only stores the
+    event (once: Stripe redelivers, sometimes concurrently) and the
+    process_webhooks worker applies it later (see bookings.webhooks).
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSED', 'Processed'),
+        ('DEAD', 'Dead letter'),
+    ]
+    
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    # Stripe's creation time; events are applied in this order
+    event_created = models.DateTimeField()
+    # The Stripe object the event is about (payload data.object.id), e.g. a
+    # PaymentIntent; an event waits while an earlier one for it is pending
+    object_id = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    # Not picked up before this: retry backoff, or the lease of the worker applying it
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Pending events in Stripe order, for the worker
+            models.Index(fields=['status', 'event_created', 'id'], name='webhook_event_queue_idx'),
+            # Earlier events for the same object
+            models.Index(fields=['object_id', 'status', 'event_created'], name='webhook_event_object_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_id} - {self.event_type} - {self.status}"
+
+@receiver(pre_delete, sender=Booking)
+def release_booking_seats(sender, instance, **kwargs):
+    """
+    Give a deleted booking's seats back to its showtime. A signal rather than
+    a delete() override so queryset deletes and cascades from Showtime or
+    User are counted too; pre_delete, while the SeatInventory rows still exist
+    """
+    if getattr(instance, '_loaded_status', instance.status) in Booking.ACTIVE_STATUSES:
+        seat_ids = list(instance.seat_inventory.values_list('seat_id', flat=True))
+        # Not instance.showtime: a cascade would load every booking's showtime
+        Showtime.move_seats(instance.showtime_id, -len(seat_ids))
+        publish_seat_changes(instance.showtime_id, released=seat_ids)
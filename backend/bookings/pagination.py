@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class BookingCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (created_at, id), newest first, for booking history.
+    Backed by the booking_user_created_idx index.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class BookingHistoryPagination(CursorPagination):
+    """
+    Keyset pagination for the booking history: soonest showtime first for
+    ?when=upcoming, latest first otherwise. Backed by booking_user_starts_idx.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('when') == 'upcoming':
+            return ('starts_at', 'id')
+        return ('-starts_at', '-id')
@@ -0,0 +1,219 @@
+"""
+Asynchronous payments.
+
+The payment endpoints don't call the gateway inside the request: they
+queue a PaymentJob (enqueue_payment) and answer 202 with it, and the client
+polls the job. The process_payments worker claims due jobs (claim_jobs) and
+runs them on a thread pool (run_job):
+
+    QUEUED -> RUNNING -> SUCCEEDED              booking CONFIRMED, Payment COMPLETED
+                      -> REQUIRES_ACTION        the client finishes 3D Secure and the
+                                                Stripe webhook confirms the booking
+                      -> AWAITING_CONFIRMATION  INTENT jobs: the client confirms the
+                                                intent, likewise settled by the webhook
+                      -> FAILED                 declined, refunded, or an error before
+                                                anything was charged
+                      -> QUEUED                 transient gateway error, retried later
+                      -> NEEDS_RECONCILIATION   out of attempts, or an error after a
+                                                charge: the Stripe webhook for the
+                                                job's intent settles it either way
+
+Only SUCCEEDED means the booking has been paid.
+
+A job left RUNNING by a worker that died is claimed again once its lease
+runs out; the idempotency key makes the repeated gateway call return the
+first call's outcome instead of charging again. A worker only records the
+outcome while it still holds the lease, so a slow worker can't overwrite
+the job after another one has taken it over.
+"""
+import logging
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from cinema_project.db import immediate_atomic
+
+from .gateways import TransientGatewayError, get_gateway
+from .models import Booking, Payment, PaymentJob
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_payment(booking, kind, payment_source='', idempotency_key=None):
+    """
+    Queue a payment attempt for booking. A client that resends the same
+    Idempotency-Key, or pays again while a job is still queued or running,
+    gets the existing job. Returns (job, created)
+    """
+    with immediate_atomic():
+        # Serializes payment attempts for the booking
+        Booking.objects.select_for_update().get(pk=booking.pk)
+
+        if idempotency_key:
+            job = PaymentJob.objects.filter(idempotency_key=f'booking-{booking.pk}:{idempotency_key}').first()
+        else:
+            job = booking.payment_jobs.filter(status__in=['QUEUED', 'RUNNING']).first()
+        if job is not None:
+            return job, False
+
+        return PaymentJob.objects.create(
+            booking=booking, kind=kind, payment_source=payment_source,
+            idempotency_key=f'booking-{booking.pk}:{idempotency_key or uuid.uuid4().hex}',
+        ), True
+
+
+def _due(now):
+    return Q(status='QUEUED', run_after__lte=now) | Q(status='RUNNING', locked_until__lte=now)
+
+
+def claim_jobs(limit, now=None):
+    """Lease up to limit due jobs to the calling worker"""
+    now = now or timezone.now()
+    lease = now + timedelta(seconds=settings.PAYMENT_JOB_LEASE_SECONDS)
+
+    claimed = []
+    for job_id in PaymentJob.objects.filter(_due(now)).order_by('run_after').values_list('pk', flat=True)[:limit]:
+        # Conditional, so a job is only ever leased to one worker
+        if PaymentJob.objects.filter(_due(now), pk=job_id).update(
+            status='RUNNING', locked_until=lease, attempts=F('attempts') + 1, updated_at=now
+        ):
+            claimed.append(job_id)
+    return list(PaymentJob.objects.filter(pk__in=claimed).select_related('booking').order_by('run_after'))
+
+
+UNCONFIRMED = 'We could not confirm your payment yet. If you were charged, your booking will be confirmed shortly'
+
+
+def run_job(job, gateway=None):
+    """Make the gateway call for a claimed job and advance the job, booking and payment"""
+    gateway = gateway or get_gateway()
+    booking = job.booking
+    result = None
+
+    metadata = {'booking_id': str(booking.id), 'user_id': str(booking.user_id), 'payment_job_id': str(job.id)}
+    if job.kind == 'GOOGLE_PAY':
+        metadata['payment_method'] = 'google_pay'
+    try:
+        result = gateway.create_intent(
+            amount_cents=int(Decimal(str(booking.total_amount)) * 100),
+            metadata=metadata,
+            description=f'OmniWatch Cinema - Booking #{booking.booking_reference}',
+            idempotency_key=job.idempotency_key,
+            payment_method=job.payment_source if job.kind == 'CARD' else None,
+            card_token=job.payment_source if job.kind == 'GOOGLE_PAY' else None,
+        )
+        if result.status == 'succeeded':
+            error = settle_payment(booking.pk, result.intent_id, gateway)
+            _finish(job, 'FAILED' if error else 'SUCCEEDED', intent_id=result.intent_id, error=error or '')
+        elif result.status == 'failed':
+            _finish(job, 'FAILED', intent_id=result.intent_id, error=result.error)
+        else:
+            # requires_action, or an unconfirmed intent for the client to confirm;
+            # the booking is still PENDING either way
+            status = 'REQUIRES_ACTION' if result.status == 'requires_action' else 'AWAITING_CONFIRMATION'
+            _finish(job, status, intent_id=result.intent_id, client_secret=result.client_secret)
+    except TransientGatewayError as e:
+        _retry(job, e)
+    except Exception:
+        # A bug, not an outage: retrying won't help
+        logger.exception('Payment job %s failed', job.pk)
+        if result is not None and result.status == 'succeeded':
+            # Charged but not recorded; the webhook for the intent settles it
+            _finish(job, 'NEEDS_RECONCILIATION', intent_id=result.intent_id, error=UNCONFIRMED)
+        else:
+            _finish(job, 'FAILED', error='The payment could not be processed, please try again')
+
+
+def settle_payment(booking_id, intent_id, gateway):
+    """
+    Record a succeeded payment intent against its booking: confirm the
+    booking and its Payment, or refund the charge when the booking can't
+    take it (its seats went to someone else, or it was already paid through
+    another intent). Idempotent. Returns None, or the error for the customer
+
+    The refund is decided under the booking lock but sent once the
+    outermost transaction commits, so the row isn't held across a gateway
+    call. If sending fails the exception reaches the caller after the
+    commit; the job or webhook is retried, comes to the same decision and
+    resends under the same refund key, which the gateway deduplicates.
+    """
+    with immediate_atomic():
+        booking = Booking.objects.select_for_update().get(pk=booking_id)
+        if booking.status in ('PENDING', 'EXPIRED'):
+            # An EXPIRED booking takes its seats back unless they've gone since
+            booking.status = 'CONFIRMED'
+            try:
+                with transaction.atomic():
+                    booking.save()
+            except ValidationError:
+                booking.status = 'EXPIRED'
+
+        if booking.status != 'CONFIRMED':
+            refund_reason = 'Your seats are no longer available'
+        elif Payment.objects.filter(booking=booking, status='COMPLETED').exclude(transaction_id=intent_id).exists():
+            refund_reason = 'This booking has already been paid'
+        else:
+            refund_reason = None
+
+        if refund_reason:
+            transaction.on_commit(lambda: gateway.refund(intent_id, f'{intent_id}:refund'))
+            return f'{refund_reason}; the payment has been refunded'
+
+        Payment.objects.update_or_create(booking=booking, defaults={
+            'payment_method': 'STRIPE',
+            'amount': booking.total_amount,
+            'transaction_id': intent_id,
+            'status': 'COMPLETED',
+        })
+        return None
+
+
+def _release(job, **fields):
+    """Write fields to job if this worker still holds its lease; returns whether it did"""
+    fields.update(locked_until=None, updated_at=timezone.now())
+    if not PaymentJob.objects.filter(pk=job.pk, status='RUNNING', locked_until=job.locked_until).update(**fields):
+        logger.warning('Payment job %s lost its lease; leaving it to the worker that holds it', job.pk)
+        return False
+    for name, value in fields.items():
+        setattr(job, name, value)
+    return True
+
+
+def _finish(job, status, **fields):
+    return _release(job, status=status, payment_source='', **fields)
+
+
+def _retry(job, error):
+    if job.attempts >= settings.PAYMENT_JOB_MAX_ATTEMPTS:
+        # The last attempt may have reached the gateway and charged
+        return _finish(job, 'NEEDS_RECONCILIATION', error=UNCONFIRMED)
+    # Exponential backoff: 2s, 4s, 8s... capped at a minute
+    return _release(
+        job, status='QUEUED', error=str(error),
+        run_after=timezone.now() + timedelta(seconds=min(2 ** job.attempts, 60)),
+    )
+
+
+def _run_in_thread(job):
+    try:
+        run_job(job)
+    finally:
+        close_old_connections()
+
+
+def process_due_jobs(executor, batch_size=50):
+    """Claim and run due jobs until none are left; returns how many ran"""
+    processed = 0
+    while True:
+        jobs = claim_jobs(batch_size)
+        if not jobs:
+            return processed
+        list(executor.map(_run_in_thread, jobs))
+        processed += len(jobs)
@@ -1,5 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Booking, BookedSeat, Payment
+from .models import Booking, BookedSeat, Payment, PaymentJob
 from movies.serializers import ShowtimeSerializer, SeatSerializer
 
 class BookedSeatSerializer(serializers.ModelSerializer):
@@ -19,40 +20,65 @@ class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = ['id', 'booking_reference', 'showtime', 'booked_seats', 
-                  'total_amount', 'booking_fee', 'status', 'created_at', 'user_email']
-        read_only_fields = ['booking_reference', 'total_amount', 'created_at']
+                  'total_amount', 'booking_fee', 'status', 'expires_at', 'created_at', 'user_email']
+        read_only_fields = ['booking_reference', 'total_amount', 'expires_at', 'created_at']
 
 class BookingCreateSerializer(serializers.Serializer):
     showtime_id = serializers.IntegerField()
     seat_ids = serializers.ListField(child=serializers.IntegerField())
     
     def validate(self, data):
-        from movies.models import Showtime, Seat
+        from movies.models import Showtime
+        from movies.layout_cache import get_seat_layout
         
         # Validate showtime exists
         try:
-            showtime = Showtime.objects.get(id=data['showtime_id'])
+            showtime = Showtime.objects.select_related('screen').get(id=data['showtime_id'])
         except Showtime.DoesNotExist:
             raise serializers.ValidationError("Showtime not found")
         
         # Validate seats exist and belong to showtime's screen
-        seats = Seat.objects.filter(id__in=data['seat_ids'], screen=showtime.screen)
-        if seats.count() != len(data['seat_ids']):
+        layout = get_seat_layout(showtime.screen)
+        seat_ids = data['seat_ids']
+        if len(set(seat_ids)) != len(seat_ids) or not all(seat_id in layout for seat_id in seat_ids):
             raise serializers.ValidationError("Invalid seat selection")
         
-        # Check if seats are already booked
-        booked_seats = BookedSeat.objects.filter(
-            booking__showtime=showtime,
-            booking__status__in=['PENDING', 'CONFIRMED'],
-            seat_id__in=data['seat_ids']
-        )
-        if booked_seats.exists():
-            raise serializers.ValidationError("Some seats are already booked")
+        # Seats already taken are detected when the booking claims them
+        # (SeatInventory), not here where the answer could change before insert
         
+        data['showtime'] = showtime
+        data['layout'] = layout
         return data
 
+class BookingBatchItemSerializer(serializers.Serializer):
+    showtime_id = serializers.IntegerField()
+    seat_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+class BookingBatchSerializer(serializers.Serializer):
+    # Seats and showtimes are checked per item by the booking service, so one
+    # bad item doesn't reject the whole batch
+    bookings = BookingBatchItemSerializer(many=True, allow_empty=False)
+    
+    def validate_bookings(self, value):
+        if len(value) > settings.BOOKING_BATCH_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f"At most {settings.BOOKING_BATCH_MAX_ITEMS} bookings per request"
+            )
+        return value
+
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
-        read_only_fields = ['transaction_id', 'created_at']
\ No newline at end of file
+        read_only_fields = ['transaction_id', 'created_at']
+
+
+class PaymentJobSerializer(serializers.ModelSerializer):
+    booking_status = serializers.CharField(source='booking.status', read_only=True)
+    booking_reference = serializers.CharField(source='booking.booking_reference', read_only=True)
+    
+    class Meta:
+        model = PaymentJob
+        fields = ['id', 'booking', 'kind', 'status', 'attempts', 'intent_id', 'client_secret', 'error',
+                  'booking_status', 'booking_reference', 'created_at', 'updated_at']
+        read_only_fields = fields
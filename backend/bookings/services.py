@@ -0,0 +1,150 @@
+"""
+Booking creation, shared by the single and batch booking endpoints.
+
+book_showtime() books any number of parties on one showtime in a single
+transaction: every booking, seat claim and BookedSeat row goes in with one
+bulk insert each, and the showtime counters are moved once. Seats are
+claimed optimistically through SeatInventory; only when that insert hits a
+conflict are the parties claimed one by one, so one party losing a seat
+doesn't fail the others.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from typing import NamedTuple
+
+from django.db import IntegrityError, transaction
+
+from cinema_project.db import immediate_atomic
+from movies.layout_cache import get_seat_layout
+from movies.models import Showtime
+from movies.seat_events import publish_seat_changes
+from .holds import hold_expiry, release_lapsed_holds
+from .models import Booking, BookedSeat, SeatInventory
+
+
+SEAT_TYPE_MULTIPLIERS = {
+    'VIP': Decimal('1.5'),
+    'RECLINE': Decimal('1.3'),
+}
+
+
+class Rejected(NamedTuple):
+    """A party that could not be booked, with the HTTP status that explains why"""
+    status: int
+    error: str
+
+
+INVALID_SEATS = Rejected(400, 'Invalid seat selection')
+SEATS_TAKEN = Rejected(409, 'Some seats are already booked')
+SHOWTIME_NOT_FOUND = Rejected(404, 'Showtime not found')
+
+
+def seat_price(base_price, seat):
+    """Price of one seat, by seat type, rounded to the cent"""
+    price = base_price * SEAT_TYPE_MULTIPLIERS.get(seat.seat_type, Decimal('1'))
+    return price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def book_showtime(user, showtime, layout, parties):
+    """
+    Book each list of seat ids in parties on showtime for user.
+
+    Returns one result per party, in order: the new Booking, or Rejected.
+    """
+    results = [None] * len(parties)
+    base_price = Decimal(str(showtime.base_price))
+    expires_at = hold_expiry()
+
+    # Validate against the cached layout; within the request the first party to ask for a seat gets it
+    requested = set()
+    bookings = {}
+    prices = {}
+    for index, seat_ids in enumerate(parties):
+        if not seat_ids or len(set(seat_ids)) != len(seat_ids) or not all(seat_id in layout for seat_id in seat_ids):
+            results[index] = INVALID_SEATS
+            continue
+        if requested.intersection(seat_ids):
+            results[index] = SEATS_TAKEN
+            continue
+        requested.update(seat_ids)
+
+        prices[index] = {seat_id: seat_price(base_price, layout.get(seat_id)) for seat_id in seat_ids}
+        booking = Booking(user=user, showtime=showtime, expires_at=expires_at, starts_at=showtime.start_time,
+                          booking_reference=Booking.new_reference())
+        # Booking fee as Decimal (the model default is a float)
+        booking.total_amount = (sum(prices[index].values(), Decimal('0.00')) + Decimal(str(booking.booking_fee))).quantize(
+            Decimal('0.01'), rounding=ROUND_HALF_UP
+        )
+        bookings[index] = booking
+
+    if not bookings:
+        return results
+
+    # No lock on the showtime: the seat inventory insert is what detects a
+    # seat taken by a concurrent booking, so different seats never wait
+    with immediate_atomic():
+        # bulk_create skips Booking.save, which only fills in the reference and
+        # start time for new rows
+        Booking.objects.bulk_create(bookings.values())
+        try:
+            with transaction.atomic():
+                SeatInventory.objects.bulk_create([
+                    SeatInventory(showtime=showtime, seat_id=seat_id, booking=bookings[index])
+                    for index in bookings for seat_id in parties[index]
+                ])
+        except IntegrityError:
+            # Somebody holds at least one of the seats, possibly a hold that has
+            # lapsed but not been released yet: claim party by party
+            release_lapsed_holds(showtime, requested)
+            for index in list(bookings):
+                try:
+                    with transaction.atomic():
+                        SeatInventory.claim(bookings[index], parties[index])
+                except IntegrityError:
+                    results[index] = SEATS_TAKEN
+                    Booking.objects.filter(pk=bookings.pop(index).pk).delete()
+
+        BookedSeat.objects.bulk_create([
+            BookedSeat(booking=bookings[index], seat_id=seat_id, price=price)
+            for index in bookings for seat_id, price in prices[index].items()
+        ])
+        taken = [seat_id for index in bookings for seat_id in parties[index]]
+        # Last, so the counter UPDATE holds the showtime row only until commit
+        showtime.adjust_seat_counts(len(taken))
+        publish_seat_changes(showtime.id, taken=taken)
+
+    for index, booking in bookings.items():
+        # As if loaded: saving the booking later must see it as holding its seats
+        booking._loaded_status = booking.status
+        results[index] = booking
+    return results
+
+
+def create_bookings(user, requests):
+    """
+    Book a list of {'showtime_id', 'seat_ids'} requests, one transaction per
+    showtime, so a failure on one showtime leaves the others booked.
+
+    Returns one result per request, in order: the new Booking, or Rejected.
+    """
+    showtimes = Showtime.objects.select_related('screen').in_bulk({request['showtime_id'] for request in requests})
+
+    by_showtime = defaultdict(list)
+    for index, request in enumerate(requests):
+        by_showtime[request['showtime_id']].append(index)
+
+    results = [None] * len(requests)
+    for showtime_id, indexes in by_showtime.items():
+        showtime = showtimes.get(showtime_id)
+        if showtime is None:
+            for index in indexes:
+                results[index] = SHOWTIME_NOT_FOUND
+            continue
+
+        booked = book_showtime(
+            user, showtime, get_seat_layout(showtime.screen),
+            [requests[index]['seat_ids'] for index in indexes]
+        )
+        for index, result in zip(indexes, booked):
+            results[index] = result
+    return results
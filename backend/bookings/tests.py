@@ -1,3 +1,660 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cinema_project.db import immediate_atomic
+from movies.layout_cache import get_seat_layout
+from movies.models import Cinema, Movie, Screen, Seat, Showtime
+from movies.tests import QueryPlanTestCase
+
+from .gateways import FakeGateway, TransientGatewayError, get_gateway
+from .holds import extend_hold, reap, release_lapsed_holds
+from .models import Booking, BookedSeat, Payment, PaymentJob, SeatInventory, WebhookEvent
+from .payments import claim_jobs, enqueue_payment, run_job, settle_payment
+from .services import book_showtime
+from .webhooks import apply_event, claim_events, process_pending, requeue, store_event
+
+
+class BookingsQueryPlanTests(QueryPlanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def free_seat_ids(self, count):
+        taken = SeatInventory.objects.filter(showtime=self.showtime).values_list('seat_id', flat=True)
+        seats = Seat.objects.filter(screen_id=self.showtime.screen_id).exclude(id__in=list(taken))
+        return list(seats.values_list('id', flat=True)[:count])
+
+    def test_booking_history(self):
+        self.assertIndexedQueries('get', '/api/bookings/bookings/', expected_indexes=['booking_user_created_idx'])
+
+    def test_booking_history_upcoming(self):
+        self.assertIndexedQueries(
+            'get', '/api/bookings/bookings/history/?when=upcoming', expected_indexes=['booking_user_starts_idx']
+        )
+
+    def test_booking_history_past(self):
+        self.assertIndexedQueries(
+            'get', '/api/bookings/bookings/history/?when=past', expected_indexes=['booking_user_starts_idx']
+        )
+
+    def test_booking_detail(self):
+        booking = Booking.objects.filter(user=self.user).first()
+        self.assertIndexedQueries('get', f'/api/bookings/bookings/{booking.id}/')
+
+    def test_create_booking(self):
+        self.assertIndexedQueries(
+            'post', '/api/bookings/bookings/',
+            {'showtime_id': self.showtime.id, 'seat_ids': self.free_seat_ids(2)},
+            format='json',
+        )
+
+    def test_cancel_booking(self):
+        booking = Booking.objects.create(user=self.user, showtime=self.showtime, total_amount=0)
+        seat_id = self.free_seat_ids(1)[0]
+        BookedSeat.objects.create(booking=booking, seat_id=seat_id, price=10)
+        SeatInventory.claim(booking, [seat_id])
+        self.assertIndexedQueries('post', f'/api/bookings/bookings/{booking.id}/cancel/')
+
+
+class BookingTestCase(TestCase):
+    """One showtime on a ten seat screen, and a customer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cinema = Cinema.objects.create(name='OmniWatch', location='Centre', address='1 Main Street', phone='01-0000000')
+        screen = Screen.objects.create(cinema=cinema, name='Screen 1', screen_type='STANDARD',
+                                       total_seats=10, rows=1, seats_per_row=10)
+        Seat.objects.bulk_create([
+            Seat(screen=screen, row='A', number=number, seat_type='STANDARD') for number in range(1, 11)
+        ])
+        movie = Movie.objects.create(title='Movie', description='', duration=100, rating='PG', genre='Drama',
+                                     release_date=date(2025, 1, 1), director='Director', cast='Cast')
+        start = timezone.now() + timedelta(days=1)
+        cls.showtime = Showtime.objects.create(movie=movie, screen=screen, start_time=start, base_price=Decimal('10.00'))
+        cls.other_showtime = Showtime.objects.create(movie=movie, screen=screen, start_time=start + timedelta(hours=3),
+                                                     base_price=Decimal('10.00'))
+        cls.seat_ids = list(Seat.objects.filter(screen=screen).order_by('number').values_list('id', flat=True))
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'password')
+
+    def book(self, seat_ids, showtime=None):
+        showtime = showtime or self.showtime
+        showtime.screen.refresh_from_db()
+        return book_showtime(self.user, showtime, get_seat_layout(showtime.screen), [seat_ids])[0]
+
+    def assertSeatCounts(self, booked, showtime=None):
+        showtime = showtime or self.showtime
+        showtime.refresh_from_db()
+        self.assertEqual((showtime.booked_count, showtime.available_count), (booked, 10 - booked))
+        self.assertEqual(SeatInventory.objects.filter(showtime=showtime).count(), booked)
+
+
+class SeatConflictTests(BookingTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_taken_seat_is_a_conflict(self):
+        path = '/api/bookings/bookings/'
+        response = self.client.post(path, {'showtime_id': self.showtime.id, 'seat_ids': self.seat_ids[:2]}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.post(path, {'showtime_id': self.showtime.id, 'seat_ids': self.seat_ids[1:3]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data, {'error': 'Some seats are already booked'})
+        self.assertSeatCounts(2)
+
+    def test_reactivating_a_booking_whose_seats_have_gone(self):
+        booking = self.book(self.seat_ids[:2])
+        booking.status = 'CANCELLED'
+        booking.save()
+        self.book(self.seat_ids[1:3])
+
+        response = self.client.patch(f'/api/bookings/bookings/{booking.id}/', {'status': 'PENDING'}, format='json')
+        self.assertEqual(response.status_code, 409)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'CANCELLED')
+        self.assertSeatCounts(2)
+
+
+class ImmediateTransactionTests(TransactionTestCase):
+    def begins(self, block):
+        with CaptureQueriesContext(connection) as captured:
+            with block():
+                User.objects.count()
+        return [query['sql'] for query in captured.captured_queries if query['sql'].startswith('BEGIN')]
+
+    def test_only_booking_paths_begin_immediate(self):
+        if not hasattr(connection, 'begin_immediate'):
+            self.skipTest('Not running on the cinema_project.sqlite3 backend')
+        self.assertEqual(self.begins(immediate_atomic), ['BEGIN IMMEDIATE'])
+        self.assertNotIn('BEGIN IMMEDIATE', self.begins(transaction.atomic))
+        self.assertFalse(connection.begin_immediate)
+
+
+class SeatCounterTests(BookingTestCase):
+    def test_cancel_releases_seats(self):
+        booking = self.book(self.seat_ids[:3])
+        booking.status = 'CANCELLED'
+        booking.save()
+
+        self.assertSeatCounts(0)
+
+    def test_queryset_delete_releases_seats(self):
+        self.book(self.seat_ids[:2])
+        cancelled = self.book(self.seat_ids[2:4])
+        cancelled.status = 'CANCELLED'
+        cancelled.save()
+        self.book(self.seat_ids[4:5])
+
+        Booking.objects.filter(showtime=self.showtime).delete()
+
+        self.assertSeatCounts(0)
+
+    def test_deleting_the_customer_releases_seats(self):
+        self.book(self.seat_ids[:2])
+        self.book(self.seat_ids[:3], showtime=self.other_showtime)
+
+        self.user.delete()
+
+        self.assertSeatCounts(0)
+        self.assertSeatCounts(0, self.other_showtime)
+
+    def test_rebuild_seat_counters(self):
+        self.book(self.seat_ids[:3])
+        Showtime.objects.filter(pk=self.showtime.pk).update(booked_count=7, available_count=1)
+        self.showtime.refresh_from_db()
+        seat_version = self.showtime.seat_version
+
+        call_command('rebuild_seat_counters', batch_size=1, stdout=StringIO())
+
+        self.assertSeatCounts(3)
+        self.assertSeatCounts(0, self.other_showtime)
+        self.assertEqual(self.showtime.seat_version, seat_version + 1)
+
+
+class HoldTests(BookingTestCase):
+    def lapse(self, booking):
+        Booking.objects.filter(pk=booking.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_new_booking_holds_its_seats(self):
+        booking = self.book(self.seat_ids[:2])
+
+        self.assertEqual(booking.status, 'PENDING')
+        self.assertGreater(booking.expires_at, timezone.now())
+        self.assertSeatCounts(2)
+
+    def test_release_lapsed_holds(self):
+        kept = self.book(self.seat_ids[:2])
+        lapsed = self.book(self.seat_ids[2:5])
+        self.lapse(lapsed)
+        self.showtime.refresh_from_db()
+        seat_version = self.showtime.seat_version
+
+        self.assertEqual(release_lapsed_holds(self.showtime), 1)
+
+        lapsed.refresh_from_db()
+        kept.refresh_from_db()
+        self.assertEqual((lapsed.status, lapsed.expires_at), ('EXPIRED', None))
+        self.assertEqual(kept.status, 'PENDING')
+        self.assertSeatCounts(2)
+        self.assertGreater(self.showtime.seat_version, seat_version)
+        self.assertEqual(release_lapsed_holds(self.showtime), 0)
+
+    def test_lapsed_seats_can_be_booked_again(self):
+        self.lapse(self.book(self.seat_ids[:2]))
+
+        booking = self.book(self.seat_ids[1:3])
+
+        self.assertIsInstance(booking, Booking)
+        self.assertSeatCounts(2)
+
+    def test_extend_hold(self):
+        booking = self.book(self.seat_ids[:1])
+        Booking.objects.filter(pk=booking.pk).update(expires_at=timezone.now() + timedelta(seconds=30))
+        booking.refresh_from_db()
+
+        self.assertTrue(extend_hold(booking, minutes=5))
+        booking.refresh_from_db()
+        self.assertGreater(booking.expires_at, timezone.now() + timedelta(minutes=4))
+
+    def test_extend_hold_after_release(self):
+        booking = self.book(self.seat_ids[:1])
+        self.lapse(booking)
+        release_lapsed_holds(self.showtime)
+
+        self.assertFalse(extend_hold(booking))
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'EXPIRED')
+
+    def test_confirmed_bookings_never_lapse(self):
+        booking = self.book(self.seat_ids[:2])
+        booking.status = 'CONFIRMED'
+        booking.save()
+
+        self.assertEqual(reap(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertSeatCounts(2)
+
+    def test_reap(self):
+        self.lapse(self.book(self.seat_ids[:2]))
+        self.lapse(self.book(self.seat_ids[:3], showtime=self.other_showtime))
+        self.book(self.seat_ids[5:6])
+
+        self.assertEqual(reap(batch_size=1), 2)
+        self.assertSeatCounts(1)
+        self.assertSeatCounts(0, self.other_showtime)
+
+
+class BookingHistoryTests(BookingTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.soon = self.book(self.seat_ids[:2])
+        self.later = self.book(self.seat_ids[:1], showtime=self.other_showtime)
+
+    def history(self, **params):
+        response = self.client.get('/api/bookings/bookings/history/', params)
+        self.assertEqual(response.status_code, 200)
+        return [entry['id'] for entry in response.data['results']]
+
+    def test_upcoming_and_past(self):
+        self.assertEqual(self.history(when='upcoming'), [self.soon.pk, self.later.pk])
+        self.assertEqual(self.history(when='past'), [])
+        self.assertEqual(self.history(), [self.later.pk, self.soon.pk])
+
+        entry = self.client.get('/api/bookings/bookings/history/').data['results'][1]
+        self.assertEqual((entry['movie_title'], entry['screen_name'], entry['seats']), ('Movie', 'Screen 1', ['A1', 'A2']))
+
+    def test_unknown_when(self):
+        response = self.client.get('/api/bookings/bookings/history/', {'when': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_moved_showtime_moves_its_bookings(self):
+        showtime = Showtime.objects.get(pk=self.other_showtime.pk)
+        showtime.start_time = timezone.now() - timedelta(hours=2)
+        showtime.save()
+
+        self.later.refresh_from_db()
+        self.assertEqual(self.later.starts_at, showtime.start_time)
+        self.assertEqual(self.history(when='upcoming'), [self.soon.pk])
+        self.assertEqual(self.history(when='past'), [self.later.pk])
+        self.assertEqual(self.history(), [self.soon.pk, self.later.pk])
+
+
+class BatchBookingTests(BookingTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_batch(self, *bookings):
+        return self.client.post('/api/bookings/bookings/batch/', {'bookings': list(bookings)}, format='json')
+
+    def test_all_booked(self):
+        response = self.post_batch(
+            {'showtime_id': self.showtime.id, 'seat_ids': self.seat_ids[:2]},
+            {'showtime_id': self.other_showtime.id, 'seat_ids': self.seat_ids[:3]},
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 0))
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 201])
+        self.assertEqual(len(response.data['results'][1]['booking']['booked_seats']), 3)
+        self.assertSeatCounts(2)
+        self.assertSeatCounts(3, self.other_showtime)
+
+    def test_per_item_results(self):
+        self.book(self.seat_ids[:2])
+
+        response = self.post_batch(
+            {'showtime_id': self.showtime.id, 'seat_ids': self.seat_ids[1:3]},
+            {'showtime_id': self.showtime.id, 'seat_ids': self.seat_ids[5:7]},
+            {'showtime_id': self.showtime.id, 'seat_ids': [0]},
+            {'showtime_id': 0, 'seat_ids': self.seat_ids[:1]},
+        )
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 3))
+        self.assertEqual([result['status'] for result in response.data['results']], [409, 201, 400, 404])
+        self.assertIn('error', response.data['results'][0])
+        # The party that lost a seat leaves nothing behind
+        self.assertEqual(Booking.objects.filter(user=self.user).count(), 2)
+        self.assertSeatCounts(4)
+
+    def test_parties_sharing_a_seat(self):
+        response = self.post_batch(
+            {'showtime_id': self.showtime.id, 'seat_ids': self.seat_ids[:2]},
+            {'showtime_id': self.showtime.id, 'seat_ids': self.seat_ids[1:3]},
+        )
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 409])
+        self.assertSeatCounts(2)
+
+    @override_settings(BOOKING_BATCH_MAX_ITEMS=2)
+    def test_too_many_items(self):
+        response = self.post_batch(*[
+            {'showtime_id': self.showtime.id, 'seat_ids': [seat_id]} for seat_id in self.seat_ids[:3]
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.exists())
+
+
+class PaymentJobTests(BookingTestCase):
+    def setUp(self):
+        self.gateway = FakeGateway()
+        self.booking = self.book(self.seat_ids[:2])
+
+    def run_next(self, now=None):
+        [job] = claim_jobs(10, now)
+        run_job(job, self.gateway)
+        job.refresh_from_db()
+        self.booking.refresh_from_db()
+        return job
+
+    def test_enqueue_is_idempotent(self):
+        job, created = enqueue_payment(self.booking, 'CARD', 'pm_card_visa', 'key-1')
+        self.assertTrue(created)
+        self.assertEqual(enqueue_payment(self.booking, 'CARD', 'pm_card_visa', 'key-1'), (job, False))
+        # Without a key, paying again while a job is queued gets that job
+        self.assertEqual(enqueue_payment(self.booking, 'CARD', 'pm_card_visa'), (job, False))
+
+    def test_claim_leases_the_job(self):
+        job, _ = enqueue_payment(self.booking, 'CARD', 'pm_card_visa')
+
+        self.assertEqual(claim_jobs(10), [job])
+        self.assertEqual(claim_jobs(10), [])
+
+        # The worker died: the job is claimed again once its lease runs out
+        job.refresh_from_db()
+        [reclaimed] = claim_jobs(10, job.locked_until + timedelta(seconds=1))
+        self.assertEqual((reclaimed.pk, reclaimed.status, reclaimed.attempts), (job.pk, 'RUNNING', 2))
+
+    def test_card_payment(self):
+        enqueue_payment(self.booking, 'CARD', 'pm_card_visa')
+
+        job = self.run_next()
+
+        self.assertEqual((job.status, job.payment_source, job.locked_until), ('SUCCEEDED', '', None))
+        self.assertEqual(self.booking.status, 'CONFIRMED')
+        payment = Payment.objects.get(booking=self.booking)
+        self.assertEqual((payment.status, payment.transaction_id), ('COMPLETED', job.intent_id))
+
+    def test_rerun_after_crash_settles_once(self):
+        job, _ = enqueue_payment(self.booking, 'CARD', 'pm_card_visa')
+        [claimed] = claim_jobs(10)
+        # A second worker that picked the job up when the first one's lease ran out
+        [reclaimed] = claim_jobs(10, claimed.locked_until + timedelta(seconds=1))
+        run_job(claimed, self.gateway)
+        run_job(reclaimed, self.gateway)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'SUCCEEDED')
+        self.assertEqual(Payment.objects.filter(booking=self.booking, status='COMPLETED').count(), 1)
+        self.assertEqual(self.gateway.refunded, set())
+
+    def test_declined(self):
+        enqueue_payment(self.booking, 'CARD', FakeGateway.DECLINED)
+
+        job = self.run_next()
+
+        self.assertEqual((job.status, job.error), ('FAILED', 'Your card was declined'))
+        self.assertEqual(self.booking.status, 'PENDING')
+        self.assertFalse(Payment.objects.exists())
+
+    @override_settings(PAYMENT_JOB_MAX_ATTEMPTS=2)
+    def test_transient_errors_are_retried_then_given_up(self):
+        enqueue_payment(self.booking, 'CARD', FakeGateway.UNAVAILABLE)
+
+        job = self.run_next()
+        self.assertEqual(job.status, 'QUEUED')
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(claim_jobs(10), [])
+
+        # The last attempt may have charged: the job waits for the intent's webhook
+        job = self.run_next(job.run_after)
+        self.assertEqual((job.status, job.attempts), ('NEEDS_RECONCILIATION', 2))
+        self.assertTrue(job.is_finished)
+        self.assertEqual(self.booking.status, 'PENDING')
+
+    def test_unexpected_errors_are_not_retried(self):
+        enqueue_payment(self.booking, 'CARD', 'pm_card_visa')
+
+        with mock.patch.object(self.gateway, 'create_intent', side_effect=ValueError('bug')), \
+                self.assertLogs('bookings.payments', 'ERROR'):
+            job = self.run_next()
+
+        self.assertEqual((job.status, job.attempts, job.locked_until), ('FAILED', 1, None))
+        self.assertEqual(self.booking.status, 'PENDING')
+
+    def test_charged_but_not_settled_needs_reconciliation(self):
+        enqueue_payment(self.booking, 'CARD', 'pm_card_visa')
+
+        with mock.patch('bookings.payments.settle_payment', side_effect=ValueError('bug')), \
+                self.assertLogs('bookings.payments', 'ERROR'):
+            job = self.run_next()
+
+        self.assertEqual(job.status, 'NEEDS_RECONCILIATION')
+        self.assertTrue(job.intent_id)
+
+    def test_worker_that_lost_its_lease_writes_nothing(self):
+        job, _ = enqueue_payment(self.booking, 'CARD', FakeGateway.DECLINED)
+        [stale] = claim_jobs(10)
+        [current] = claim_jobs(10, stale.locked_until + timedelta(seconds=1))
+
+        with self.assertLogs('bookings.payments', 'WARNING'):
+            run_job(stale, self.gateway)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_until), ('RUNNING', current.locked_until))
+
+    def test_intent_awaits_confirmation(self):
+        enqueue_payment(self.booking, 'INTENT')
+
+        job = self.run_next()
+
+        self.assertEqual(job.status, 'AWAITING_CONFIRMATION')
+        self.assertTrue(job.is_finished)
+        self.assertTrue(job.client_secret)
+        self.assertEqual(self.booking.status, 'PENDING')
+
+    def test_settle_is_idempotent(self):
+        self.assertIsNone(settle_payment(self.booking.pk, 'pi_first', self.gateway))
+        self.assertIsNone(settle_payment(self.booking.pk, 'pi_first', self.gateway))
+
+        # Paid twice through different intents: the second charge is refunded, once the booking is unlocked
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertIn('refunded', settle_payment(self.booking.pk, 'pi_second', self.gateway))
+        self.assertEqual(self.gateway.refunded, set())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.gateway.refunded, {'pi_second'})
+        self.assertEqual(Payment.objects.get(booking=self.booking).transaction_id, 'pi_first')
+        self.assertSeatCounts(2)
+
+
+class FlakyRefundGateway(FakeGateway):
+    def __init__(self):
+        super().__init__()
+        self.refund_calls = []
+
+    def refund(self, intent_id, idempotency_key):
+        self.refund_calls.append(idempotency_key)
+        if len(self.refund_calls) == 1:
+            raise TransientGatewayError('Refund timed out')
+        super().refund(intent_id, idempotency_key)
+
+
+class RefundAfterCommitTests(TransactionTestCase):
+    def setUp(self):
+        cinema = Cinema.objects.create(name='OmniWatch', location='Centre', address='1 Main Street', phone='01-0000000')
+        screen = Screen.objects.create(cinema=cinema, name='Screen 1', screen_type='STANDARD', total_seats=2)
+        Seat.objects.bulk_create([Seat(screen=screen, row='A', number=number) for number in (1, 2)])
+        movie = Movie.objects.create(title='Movie', description='', duration=100, rating='PG', genre='Drama',
+                                     release_date=date(2025, 1, 1), director='Director', cast='Cast')
+        self.showtime = Showtime.objects.create(movie=movie, screen=screen, base_price=Decimal('10.00'),
+                                                start_time=timezone.now() + timedelta(days=1))
+        self.seat_ids = list(Seat.objects.values_list('id', flat=True))
+        self.user = User.objects.create_user('customer')
+
+    def test_failed_refund_is_retried_under_the_same_key(self):
+        layout = get_seat_layout(self.showtime.screen)
+        booking = book_showtime(self.user, self.showtime, layout, [self.seat_ids])[0]
+        job, _ = enqueue_payment(booking, 'CARD', 'pm_card_visa')
+        # The hold lapses and the seats go to someone else before the worker charges
+        booking.status = 'EXPIRED'
+        booking.save()
+        book_showtime(User.objects.create_user('other'), self.showtime, layout, [self.seat_ids])
+        gateway = FlakyRefundGateway()
+
+        [claimed] = claim_jobs(10)
+        run_job(claimed, gateway)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'QUEUED')
+        self.assertEqual(gateway.refunded, set())
+
+        [claimed] = claim_jobs(10, job.run_after)
+        run_job(claimed, gateway)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIn('refunded', job.error)
+        self.assertEqual(gateway.refunded, {job.intent_id})
+        self.assertEqual(gateway.refund_calls, [f'{job.intent_id}:refund'] * 2)
+
+
+@override_settings(PAYMENT_GATEWAY='bookings.gateways.FakeGateway', STRIPE_WEBHOOK_SECRET='whsec_test')
+class WebhookInboxTests(BookingTestCase):
+    def setUp(self):
+        get_gateway.cache_clear()
+        self.addCleanup(get_gateway.cache_clear)
+        self.booking = self.book(self.seat_ids[:2])
+        self.created = int(time.time()) - 60
+
+    def event(self, event_id, event_type, intent_id, booking=None, offset=0):
+        metadata = {'booking_id': str(booking.pk)} if booking else {}
+        return {
+            'id': event_id,
+            'type': event_type,
+            'created': self.created + offset,
+            'data': {'object': {'id': intent_id, 'metadata': metadata}},
+        }
+
+    def broken_event(self, event_id, intent_id, offset=0):
+        # No metadata at all: the handler raises KeyError
+        event = self.event(event_id, 'payment_intent.succeeded', intent_id, offset=offset)
+        del event['data']['object']['metadata']
+        return event
+
+    def post(self, event, secret='whsec_test'):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post('/api/bookings/bookings/webhook/', payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}')
+
+    def test_redelivery_is_stored_once(self):
+        event = self.event('evt_1', 'payment_intent.succeeded', 'pi_1', self.booking)
+
+        self.assertEqual(self.post(event).status_code, 200)
+        self.assertEqual(self.post(event).status_code, 200)
+
+        self.assertEqual(WebhookEvent.objects.get().object_id, 'pi_1')
+        # Only the worker applies events
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'PENDING')
+
+    def test_bad_signature(self):
+        response = self.post(self.event('evt_1', 'payment_intent.succeeded', 'pi_1', self.booking), secret='whsec_other')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_payment_succeeded(self):
+        job, _ = enqueue_payment(self.booking, 'INTENT')
+        PaymentJob.objects.filter(pk=job.pk).update(status='AWAITING_CONFIRMATION', intent_id='pi_1')
+        store_event(self.event('evt_1', 'payment_intent.succeeded', 'pi_1', self.booking))
+        store_event(self.event('evt_2', 'customer.created', 'cus_1', offset=1))
+
+        self.assertEqual(process_pending(), (2, 0))
+
+        self.booking.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual(self.booking.status, 'CONFIRMED')
+        self.assertEqual(job.status, 'SUCCEEDED')
+        self.assertEqual(Payment.objects.get(booking=self.booking).transaction_id, 'pi_1')
+        self.assertEqual(set(WebhookEvent.objects.values_list('status', flat=True)), {'PROCESSED'})
+
+    def test_payment_succeeded_reconciles_a_job(self):
+        # The worker gave up without learning the intent id; the intent's metadata names the job
+        job, _ = enqueue_payment(self.booking, 'CARD', FakeGateway.UNAVAILABLE)
+        PaymentJob.objects.filter(pk=job.pk).update(status='NEEDS_RECONCILIATION')
+        event = self.event('evt_1', 'payment_intent.succeeded', 'pi_1', self.booking)
+        event['data']['object']['metadata']['payment_job_id'] = str(job.pk)
+        store_event(event)
+
+        self.assertEqual(process_pending(), (1, 0))
+
+        job.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertEqual((job.status, job.intent_id, job.error), ('SUCCEEDED', 'pi_1', ''))
+        self.assertEqual(self.booking.status, 'CONFIRMED')
+
+    def test_payment_failed_reconciles_a_job(self):
+        job, _ = enqueue_payment(self.booking, 'CARD', FakeGateway.UNAVAILABLE)
+        PaymentJob.objects.filter(pk=job.pk).update(status='NEEDS_RECONCILIATION', intent_id='pi_1')
+        store_event(self.event('evt_1', 'payment_intent.payment_failed', 'pi_1', self.booking))
+
+        self.assertEqual(process_pending(), (1, 0))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('FAILED', 'Payment failed'))
+
+    @override_settings(WEBHOOK_MAX_ATTEMPTS=2)
+    def test_failing_event_is_retried_then_dead_lettered(self):
+        store_event(self.broken_event('evt_1', 'pi_1'))
+
+        with self.assertLogs('bookings.webhooks', 'ERROR'):
+            self.assertEqual(process_pending(), (0, 1))
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('PENDING', 1))
+        self.assertIn('KeyError', event.last_error)
+        self.assertGreater(event.run_after, timezone.now())
+        # Backing off
+        self.assertEqual(process_pending(), (0, 0))
+
+        [event] = claim_events(10, event.run_after)
+        with self.assertLogs('bookings.webhooks', 'ERROR'):
+            self.assertFalse(apply_event(event))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('DEAD', 2))
+
+        self.assertEqual(requeue(WebhookEvent.objects.all()), 1)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('PENDING', 0))
+
+    def test_later_events_wait_for_a_retried_one(self):
+        store_event(self.broken_event('evt_1', 'pi_1'))
+        store_event(self.event('evt_2', 'payment_intent.succeeded', 'pi_1', self.booking, offset=1))
+        store_event(self.event('evt_3', 'payment_intent.succeeded', 'pi_2', self.booking, offset=2))
+
+        with self.assertLogs('bookings.webhooks', 'ERROR'):
+            self.assertEqual(process_pending(), (1, 1))
+
+        statuses = dict(WebhookEvent.objects.values_list('event_id', 'status'))
+        self.assertEqual(statuses, {'evt_1': 'PENDING', 'evt_2': 'PENDING', 'evt_3': 'PROCESSED'})
+        # Once the earlier event is out of the way the later one goes through
+        WebhookEvent.objects.filter(event_id='evt_1').update(status='DEAD')
+        self.assertEqual(process_pending(), (1, 0))
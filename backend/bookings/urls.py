@@ -6,9 +6,10 @@ router = DefaultRouter()
 router.register(r'bookings', BookingViewSet, basename='booking')
 
 urlpatterns = [
-    path('', include(router.urls)),
-    
-    # Additional payment endpoints (never ended up in bookings/views.py)
+    # Additional payment endpoints; ahead of the router, whose booking detail
+    # route would otherwise take 'webhook' and 'promo-code' for a pk
     path('bookings/webhook/', stripe_webhook, name='stripe_webhook'),
     path('bookings/promo-code/', apply_promo_code, name='apply_promo_code'),
+    
+    path('', include(router.urls)),
 ]
\ No newline at end of file
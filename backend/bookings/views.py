@@ -1,16 +1,23 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.permissions import IsAuthenticated
-from django.db import transaction
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from .models import Booking, BookedSeat, Payment
-from .serializers import BookingSerializer, BookingCreateSerializer, PaymentSerializer
-from movies.models import Showtime, Seat
-from decimal import Decimal, ROUND_HALF_UP
+from .history import FILTERS as HISTORY_FILTERS, history_entry, history_queryset
+from .holds import extend_hold
+from .models import Booking, Payment, PaymentJob
+from .pagination import BookingCursorPagination, BookingHistoryPagination
+from .payments import enqueue_payment
+from .serializers import (
+    BookingSerializer, BookingBatchSerializer, BookingCreateSerializer, PaymentJobSerializer, PaymentSerializer
+)
+from .services import Rejected, book_showtime, create_bookings
+from .webhooks import store_event
 import stripe
 import json
 import traceback
@@ -21,72 +28,38 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 class BookingViewSet(viewsets.ModelViewSet):
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BookingCursorPagination
     
     def get_queryset(self):
         return Booking.objects.filter(user=self.request.user).order_by('-created_at')
     
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except DjangoValidationError as e:
+            # Reactivating a booking whose seats have gone since (Booking.save)
+            if e.code != 'seats_taken':
+                raise
+            return Response({'error': e.message}, status=status.HTTP_409_CONFLICT)
+    
     def create(self, request):
         """Create a new booking"""
         serializer = BookingCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        showtime_id = serializer.validated_data['showtime_id']
-        seat_ids = serializer.validated_data['seat_ids']
-        
         try:
-            with transaction.atomic():
-                showtime = Showtime.objects.select_for_update().get(id=showtime_id)
-                seats = Seat.objects.filter(id__in=seat_ids)
-                
-                # Create booking
-                booking = Booking.objects.create(
-                    user=request.user,
-                    showtime=showtime,
-                    total_amount=Decimal('0.00')
-                )
-                
-                # Create booked seats and calculate total
-                total = Decimal('0.00')
-                
-                for seat in seats:
-                    # Convert base_price to Decimal
-                    if isinstance(showtime.base_price, Decimal):
-                        base_price = showtime.base_price
-                    else:
-                        base_price = Decimal(str(showtime.base_price))
-                    
-                    # Calculate price based on seat type using Decimal multiplication
-                    if seat.seat_type == 'VIP':
-                        price = base_price * Decimal('1.5')
-                    elif seat.seat_type == 'RECLINE':
-                        price = base_price * Decimal('1.3')
-                    else:
-                        price = base_price
-                    
-                    # Round to 2 decimal places
-                    price = price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                    
-                    BookedSeat.objects.create(
-                        booking=booking,
-                        seat=seat,
-                        price=price
-                    )
-                    total = total + price
-                
-                # Get booking fee as Decimal (it's already Decimal from the model default)
-                if isinstance(booking.booking_fee, Decimal):
-                    booking_fee = booking.booking_fee
-                else:
-                    booking_fee = Decimal(str(booking.booking_fee))
-                
-                # Calculate final total - both are now Decimals
-                final_total = total + booking_fee
-                booking.total_amount = final_total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                booking.save()
-                
-                response_serializer = BookingSerializer(booking, context={'request': request})
-                return Response(response_serializer.data, status=status.HTTP_201_CREATED)
-                
+            result, = book_showtime(
+                request.user,
+                serializer.validated_data['showtime'],
+                serializer.validated_data['layout'],
+                [serializer.validated_data['seat_ids']]
+            )
+            if isinstance(result, Rejected):
+                return Response({'error': result.error}, status=result.status)
+            
+            response_serializer = BookingSerializer(result, context={'request': request})
+            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        
         except Exception as e:
             
             print("=" * 80)
@@ -102,6 +75,59 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Book several parties in one request:
+        {"bookings": [{"showtime_id": 1, "seat_ids": [10, 11]}, ...]}
+        
+        Each party succeeds or fails on its own (one transaction per showtime);
+        results come back in request order. 201 when every party was booked,
+        207 otherwise.
+        """
+        serializer = BookingBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        results = create_bookings(request.user, serializer.validated_data['bookings'])
+        
+        bookings = Booking.objects.filter(
+            pk__in=[result.pk for result in results if isinstance(result, Booking)]
+        ).select_related(
+            'user', 'showtime__movie', 'showtime__screen__cinema'
+        ).prefetch_related('booked_seats__seat').in_bulk()
+        
+        data = []
+        for result in results:
+            if isinstance(result, Rejected):
+                data.append({'status': result.status, 'error': result.error})
+            else:
+                data.append({
+                    'status': status.HTTP_201_CREATED,
+                    'booking': BookingSerializer(bookings[result.pk], context={'request': request}).data,
+                })
+        
+        return Response(
+            {'created': len(bookings), 'failed': len(results) - len(bookings), 'results': data},
+            status=status.HTTP_201_CREATED if len(bookings) == len(results) else status.HTTP_207_MULTI_STATUS
+        )
+    
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """
+        Compact booking history for the dashboard, ?when=upcoming or ?when=past
+        (see bookings.history)
+        """
+        when = request.query_params.get('when')
+        if when and when not in HISTORY_FILTERS:
+            return Response(
+                {'error': f"when must be one of: {', '.join(HISTORY_FILTERS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        paginator = BookingHistoryPagination()
+        page = paginator.paginate_queryset(history_queryset(request.user, when), request, view=self)
+        return paginator.get_paginated_response([history_entry(booking, request) for booking in page])
+    
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel a booking"""
@@ -122,104 +148,51 @@ class BookingViewSet(viewsets.ModelViewSet):
         
         return Response({'status': 'Booking cancelled successfully'})
     
-    @action(detail=True, methods=['post'])
-    def process_payment(self, request, pk=None):
+    def queue_payment(self, request, booking, kind, payment_source=''):
         """
-        Process payment for a booking using Stripe
+        Queue a payment job for booking and answer 202 with it; the client
+        polls payment_job_url until the job has finished (bookings.payments)
         """
-        booking = self.get_object()
-        payment_method_id = request.data.get('payment_method_id')
-        
-        if not payment_method_id:
-            return Response(
-                {'error': 'Payment method required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if booking is already paid
         if booking.status == 'CONFIRMED':
             return Response(
                 {'error': 'This booking has already been paid'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            # Safely convert Decimal amount to cents for Stripe
-            total_amount = Decimal(str(booking.total_amount))
-            amount_cents = int(total_amount * 100)
-            
-            # Create Payment Intent with Stripe
-            intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency='eur',
-                payment_method=payment_method_id,
-                confirm=True,
-                metadata={
-                    'booking_id': str(booking.id),
-                    'user_id': str(request.user.id),
-                },
-                description=f'OmniWatch Cinema - Booking #{booking.booking_reference}',
-                automatic_payment_methods={
-                    'enabled': True,
-                    'allow_redirects': 'never'
-                }
-            )
-            
-            # Check payment status
-            if intent.status == 'succeeded':
-                # Create payment record
-                payment = Payment.objects.create(
-                    booking=booking,
-                    payment_method='STRIPE',
-                    amount=booking.total_amount,
-                    transaction_id=intent.id,
-                    status='COMPLETED'
-                )
-                
-                # Update booking status
-                booking.status = 'CONFIRMED'
-                booking.save()
-                
-                return Response({
-                    'success': True,
-                    'booking_id': booking.id,
-                    'booking_reference': booking.booking_reference,
-                    'transaction_id': payment.transaction_id,
-                    'message': 'Payment successful'
-                })
-            
-            elif intent.status == 'requires_action':
-                # 3D Secure authentication required
-                return Response({
-                    'success': False,
-                    'requires_action': True,
-                    'client_secret': intent.client_secret,
-                    'message': 'Additional authentication required'
-                })
-            
-            else:
-                return Response(
-                    {'error': f'Payment failed with status: {intent.status}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-        except stripe.error.CardError as e:
+        # Keep the seats held while the customer pays
+        if not extend_hold(booking):
             return Response(
-                {'error': e.user_message},
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'Your seat hold has expired, please book again'},
+                status=status.HTTP_409_CONFLICT
             )
         
-        except Exception as e:
-            print(f"Payment error: {str(e)}")
-            traceback.print_exc()
+        job, created = enqueue_payment(booking, kind, payment_source, request.headers.get('Idempotency-Key'))
+        data = PaymentJobSerializer(job).data
+        data['payment_job_url'] = reverse('booking-payment-job', kwargs={'job_id': job.id}, request=request)
+        return Response(data, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+    
+    @action(detail=True, methods=['post'])
+    def process_payment(self, request, pk=None):
+        """
+        Pay for a booking with a Stripe payment method, asynchronously
+        """
+        booking = self.get_object()
+        payment_method_id = request.data.get('payment_method_id')
+        
+        if not payment_method_id:
             return Response(
-                {'error': str(e)},
+                {'error': 'Payment method required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        return self.queue_payment(request, booking, 'CARD', payment_method_id)
     
     @action(detail=False, methods=['post'])
     def create_payment_intent(self, request):
-        
+        """
+        Create a payment intent for the client to confirm, asynchronously;
+        the job carries the client_secret once AWAITING_CONFIRMATION
+        """
         booking_id = request.data.get('booking_id')
         
         try:
@@ -230,44 +203,12 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        if booking.status == 'CONFIRMED':
-            return Response(
-                {'error': 'This booking has already been paid'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        try:
-            # Convert Decimal to cents
-            total_amount = Decimal(str(booking.total_amount))
-            amount_cents = int(total_amount * 100)
-            
-            intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency='eur',
-                metadata={
-                    'booking_id': str(booking.id),
-                    'user_id': str(request.user.id),
-                },
-                description=f'OmniWatch Cinema - Booking #{booking.booking_reference}',
-            )
-            
-            return Response({
-                'success': True,
-                'client_secret': intent.client_secret,
-                'payment_intent_id': intent.id,
-            })
-            
-        except Exception as e:
-            print(f"Payment intent creation error: {str(e)}")
-            return Response(
-                {'error': str(e)},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        return self.queue_payment(request, booking, 'INTENT')
     
     @action(detail=False, methods=['post'])
     def process_google_pay(self, request):
         """
-        Process Google Pay payment
+        Process Google Pay payment, asynchronously
         URL: /api/bookings/bookings/process_google_pay/
         """
         booking_id = request.data.get('booking_id')
@@ -281,72 +222,35 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        if booking.status == 'CONFIRMED':
+        if not payment_token:
             return Response(
-                {'error': 'This booking has already been paid'},
+                {'error': 'Payment token required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        return self.queue_payment(request, booking, 'GOOGLE_PAY', payment_token)
+    
+    @action(detail=False, methods=['get'], url_path=r'payment_jobs/(?P<job_id>\d+)', url_name='payment-job')
+    def payment_job(self, request, job_id=None):
+        """Progress of a queued payment; poll until status is no longer QUEUED or RUNNING"""
         try:
-            # Convert Decimal to cents
-            total_amount = Decimal(str(booking.total_amount))
-            amount_cents = int(total_amount * 100)
-            
-            # Create Payment Intent with Google Pay token
-            intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency='eur',
-                payment_method_data={
-                    'type': 'card',
-                    'card': {
-                        'token': payment_token,
-                    },
-                },
-                confirm=True,
-                metadata={
-                    'booking_id': str(booking.id),
-                    'user_id': str(request.user.id),
-                    'payment_method': 'google_pay',
-                },
-            )
-            
-            if intent.status == 'succeeded':
-                payment = Payment.objects.create(
-                    booking=booking,
-                    payment_method='STRIPE',
-                    amount=booking.total_amount,
-                    transaction_id=intent.id,
-                    status='COMPLETED'
-                )
-                
-                booking.status = 'CONFIRMED'
-                booking.save()
-                
-                return Response({
-                    'success': True,
-                    'booking_id': booking.id,
-                    'booking_reference': booking.booking_reference,
-                    'transaction_id': payment.transaction_id,
-                })
-            else:
-                return Response(
-                    {'error': 'Payment failed'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-        except Exception as e:
-            print(f"Google Pay error: {str(e)}")
+            job = PaymentJob.objects.select_related('booking').get(id=job_id, booking__user=request.user)
+        except PaymentJob.DoesNotExist:
             return Response(
-                {'error': str(e)},
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'Payment not found'},
+                status=status.HTTP_404_NOT_FOUND
             )
-
+        
+        response = Response(PaymentJobSerializer(job).data)
+        if not job.is_finished:
+            response['Retry-After'] = '1'
+        return response
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def stripe_webhook(request):
     """
-    Handle Stripe webhook events
+    Receive Stripe webhook events into the inbox (see bookings.webhooks)
     URL: /api/bookings/bookings/webhook/
     
     IMPORTANT: This endpoint must be accessible without authentication
@@ -366,57 +270,8 @@ def stripe_webhook(request):
         print(f"Webhook error: {str(e)}")
         return JsonResponse({'error': str(e)}, status=400)
     
-    # Handle different event types
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        booking_id = payment_intent['metadata'].get('booking_id')
-        
-        if booking_id:
-            try:
-                booking = Booking.objects.get(id=int(booking_id))
-                
-                # Create payment record if not exists
-                if not Payment.objects.filter(transaction_id=payment_intent['id']).exists():
-                    Payment.objects.create(
-                        booking=booking,
-                        payment_method='STRIPE',
-                        amount=booking.total_amount,
-                        transaction_id=payment_intent['id'],
-                        status='COMPLETED'
-                    )
-                
-                booking.status = 'CONFIRMED'
-                booking.save()
-                
-                print(f"Webhook: Payment successful for booking {booking.booking_reference}")
-                
-            except Booking.DoesNotExist:
-                print(f"Webhook: Booking {booking_id} not found")
-            except Exception as e:
-                print(f"Webhook processing error: {str(e)}")
-    
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event['data']['object']
-        booking_id = payment_intent['metadata'].get('booking_id')
-        
-        if booking_id:
-            try:
-                booking = Booking.objects.get(id=int(booking_id))
-                
-                Payment.objects.create(
-                    booking=booking,
-                    payment_method='STRIPE',
-                    amount=booking.total_amount,
-                    transaction_id=payment_intent['id'],
-                    status='FAILED'
-                )
-                
-                print(f"Webhook: Payment failed for booking {booking.booking_reference}")
-                
-            except Booking.DoesNotExist:
-                print(f"Webhook: Booking {booking_id} not found")
-            except Exception as e:
-                print(f"Webhook processing error: {str(e)}")
+    # Applied later by the process_webhooks worker; a redelivery is stored once
+    store_event(json.loads(payload))
     
     return JsonResponse({'status': 'success'})
 
@@ -0,0 +1,186 @@
+"""
+Stripe webhook inbox.
+
+stripe_webhook verifies the signature, stores the event (store_event) and
+answers 200 straight away; a redelivered event hits the unique event_id
+and is stored only once. The process_webhooks worker then applies pending
+events batch_size at a time, in the order Stripe created them, each in its
+own transaction (process_pending). An event is held back while an earlier
+event for the same Stripe object (the PaymentIntent) is still pending, so a
+retried event is never overtaken by the ones after it:
+
+    payment_intent.succeeded       settle the payment (bookings.payments)
+    payment_intent.payment_failed  record a FAILED payment, unless the
+                                   booking has been paid some other way
+
+Both also finish the intent's payment job if it was waiting on the client
+or, after an unclear outcome, on reconciliation.
+
+Other event types are marked processed and otherwise ignored. An event
+that fails is retried with backoff; after WEBHOOK_MAX_ATTEMPTS it becomes a
+dead letter (status DEAD) and stays there until requeued, from the admin
+or with process_webhooks --requeue-dead, once the cause is fixed.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from cinema_project.db import immediate_atomic
+
+from .gateways import get_gateway
+from .models import Booking, Payment, PaymentJob, WebhookEvent
+from .payments import settle_payment
+
+
+logger = logging.getLogger(__name__)
+
+
+def store_event(event):
+    """Add a verified Stripe event (parsed JSON) to the inbox; redeliveries are ignored"""
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(
+            event_id=event['id'],
+            event_type=event['type'],
+            payload=event,
+            event_created=datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
+            object_id=((event.get('data') or {}).get('object') or {}).get('id') or '',
+        )
+    ], ignore_conflicts=True)
+
+
+def intent_jobs(intent):
+    """
+    The payment jobs behind intent. A job that ran out of attempts may never
+    have learnt its intent id, but the intent's metadata names the job
+    """
+    job_id = intent['metadata'].get('payment_job_id')
+    reconciling = Q(pk=int(job_id), status='NEEDS_RECONCILIATION') if job_id else Q(pk__in=[])
+    return PaymentJob.objects.filter(Q(intent_id=intent['id']) | reconciling)
+
+
+WAITING_STATUSES = ['REQUIRES_ACTION', 'AWAITING_CONFIRMATION', 'NEEDS_RECONCILIATION']
+
+
+def payment_succeeded(intent, gateway):
+    booking_id = intent['metadata'].get('booking_id')
+    if not booking_id or not Booking.objects.filter(pk=int(booking_id)).exists():
+        return
+
+    jobs = intent_jobs(intent)
+    if jobs.filter(status='FAILED').exists():
+        # The payment worker has already turned this charge down and refunded it
+        return
+
+    error = settle_payment(int(booking_id), intent['id'], gateway)
+    # Jobs waiting on 3D Secure, the client's confirmation or reconciliation finish here
+    jobs.filter(status__in=WAITING_STATUSES).update(
+        status='FAILED' if error else 'SUCCEEDED', intent_id=intent['id'], error=error or '',
+        updated_at=timezone.now()
+    )
+
+
+def payment_failed(intent, gateway):
+    booking_id = intent['metadata'].get('booking_id')
+    if not booking_id:
+        return
+
+    error = (intent.get('last_payment_error') or {}).get('message') or 'Payment failed'
+    intent_jobs(intent).filter(status__in=['REQUIRES_ACTION', 'NEEDS_RECONCILIATION']).update(
+        status='FAILED', intent_id=intent['id'], error=error, updated_at=timezone.now()
+    )
+    # The client may confirm the same intent again with another card
+    PaymentJob.objects.filter(intent_id=intent['id'], status='AWAITING_CONFIRMATION').update(
+        error=error, updated_at=timezone.now()
+    )
+
+    booking = Booking.objects.select_for_update().filter(pk=int(booking_id)).first()
+    if booking is None or Payment.objects.filter(booking=booking, status='COMPLETED').exists():
+        return
+    Payment.objects.update_or_create(booking=booking, defaults={
+        'payment_method': 'STRIPE',
+        'amount': booking.total_amount,
+        'transaction_id': intent['id'],
+        'status': 'FAILED',
+    })
+
+
+HANDLERS = {
+    'payment_intent.succeeded': payment_succeeded,
+    'payment_intent.payment_failed': payment_failed,
+}
+
+
+def claim_events(limit, now=None):
+    """Lease up to limit pending events to the calling worker, oldest first"""
+    now = now or timezone.now()
+    lease = now + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS)
+
+    # Pending, including retries waiting out their backoff and events leased to other workers
+    earlier = WebhookEvent.objects.filter(
+        Q(event_created__lt=OuterRef('event_created'))
+        | Q(event_created=OuterRef('event_created'), id__lt=OuterRef('id')),
+        object_id=OuterRef('object_id'),
+        status='PENDING',
+    ).exclude(object_id='')
+    due = (
+        WebhookEvent.objects.filter(status='PENDING', run_after__lte=now)
+        .exclude(Exists(earlier))
+        .order_by('event_created', 'id')
+        .values_list('pk', flat=True)[:limit]
+    )
+    claimed = [
+        event_id for event_id in due
+        # Conditional, so an event is only ever leased to one worker
+        if WebhookEvent.objects.filter(pk=event_id, status='PENDING', run_after__lte=now).update(
+            run_after=lease, attempts=F('attempts') + 1
+        )
+    ]
+    return list(WebhookEvent.objects.filter(pk__in=claimed).order_by('event_created', 'id'))
+
+
+def apply_event(event, gateway=None):
+    """Apply one claimed event; returns True once it has been processed"""
+    handler = HANDLERS.get(event.event_type)
+    try:
+        # Settling locks the booking; refunds it decides on are sent after commit
+        with immediate_atomic():
+            if handler:
+                handler(event.payload['data']['object'], gateway or get_gateway())
+            event.status = 'PROCESSED'
+            event.processed_at = timezone.now()
+            event.last_error = ''
+            event.save(update_fields=['status', 'processed_at', 'last_error'])
+        return True
+    except Exception as e:
+        logger.exception('Webhook event %s failed', event.event_id)
+        event.last_error = f'{type(e).__name__}: {e}'
+        if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            event.status = 'DEAD'
+        else:
+            event.status = 'PENDING'
+            # Exponential backoff: 2s, 4s, 8s... capped at five minutes
+            event.run_after = timezone.now() + timedelta(seconds=min(2 ** event.attempts, 300))
+        event.save(update_fields=['status', 'run_after', 'last_error'])
+        return False
+
+
+def process_pending(batch_size=100):
+    """Apply pending events until none are due; returns (processed, failed)"""
+    processed = failed = 0
+    while True:
+        events = claim_events(batch_size)
+        if not events:
+            return processed, failed
+        for event in events:
+            if apply_event(event):
+                processed += 1
+            else:
+                failed += 1
+
+
+def requeue(events):
+    """Give dead letters (a WebhookEvent queryset) a fresh set of attempts"""
+    return events.filter(status='DEAD').update(status='PENDING', attempts=0, run_after=timezone.now())
@@ -27,6 +27,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-=t)5@guz!m0u#5v*#94b^%)je+k#=)pdr#ga2i!=@@zq^s_l+q'
 STRIPE_SECRET_KEY = 'pk_test_51SWmU22MSNu1lWenk7tfZX7GbFzQigJodkNEq6bjf6caG2tkVVnIcMv45B76MDQz4G219w0ew0eJrRnAjyVvYTWE00d0Xi65uq'
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DEBUG', 'False') == 'True'
@@ -98,6 +99,14 @@ DATABASES = {
     )
 }
 
+# SQLite-safe mode for concurrent bookings: booking transactions take the
+# write lock up front (see cinema_project/db.py) and wait up to
+# SQLITE_BUSY_TIMEOUT seconds for it rather than failing with "database is locked"
+if (DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' and
+        os.getenv('SQLITE_IMMEDIATE_TRANSACTIONS', 'True') == 'True'):
+    DATABASES['default']['ENGINE'] = 'cinema_project.sqlite3'
+    DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', '20'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -154,6 +163,10 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Default Cache-Control for catalogue responses that support conditional GET
+# (see movies/conditional.py); viewsets can override it per action
+CATALOGUE_CACHE_CONTROL = {'public': True, 'max_age': 0, 'must_revalidate': True}
+
 # JWT Settings
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -167,14 +180,70 @@ CORS_ALLOWED_ORIGINS = os.environ.get(
     'http://localhost:3000,http://127.0.0.1:3000'
 ).split(',')
 CORS_ALLOW_CREDENTIALS = True
+# Lets the frontend read seat_map ETags for conditional polling
+CORS_EXPOSE_HEADERS = ['ETag']
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploaded files are named by content hash so re-imported images are stored once
+DEFAULT_FILE_STORAGE = 'movies.storage.ContentAddressedStorage'
+
+# Cache for the per-cinema schedule grid (movies/schedule.py). Entries are
+# keyed by versions read from the database, so the per-process default is
+# never stale; a shared backend (e.g. django.core.cache.backends.redis.RedisCache
+# through CACHE_BACKEND/CACHE_LOCATION) lets workers share the work
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+SCHEDULE_CACHE_TIMEOUT = int(os.getenv('SCHEDULE_CACHE_TIMEOUT', '300'))
+
+# PENDING bookings hold their seats for BOOKING_HOLD_MINUTES; starting a
+# payment extends the hold to at least BOOKING_HOLD_EXTENSION_MINUTES from now
+BOOKING_HOLD_MINUTES = int(os.getenv('BOOKING_HOLD_MINUTES', '10'))
+BOOKING_HOLD_EXTENSION_MINUTES = int(os.getenv('BOOKING_HOLD_EXTENSION_MINUTES', '5'))
+
+# Most bookings accepted by one POST /api/bookings/bookings/batch/
+BOOKING_BATCH_MAX_ITEMS = int(os.getenv('BOOKING_BATCH_MAX_ITEMS', '100'))
+
+# Payments run as jobs (bookings/payments.py), executed by the process_payments
+# worker. bookings.gateways.FakeGateway runs the pipeline without Stripe
+PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'bookings.gateways.StripeGateway')
+PAYMENT_JOB_MAX_ATTEMPTS = int(os.getenv('PAYMENT_JOB_MAX_ATTEMPTS', '5'))
+# A RUNNING job is handed to another worker after this long
+PAYMENT_JOB_LEASE_SECONDS = int(os.getenv('PAYMENT_JOB_LEASE_SECONDS', '60'))
+
+# Stripe webhooks are stored in an inbox and applied by the process_webhooks
+# worker (bookings/webhooks.py); events failing this many times are dead-lettered
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', '8'))
+WEBHOOK_LEASE_SECONDS = int(os.getenv('WEBHOOK_LEASE_SECONDS', '60'))
+
+# Live seat maps (movies/seat_events.py), streamed by the ASGI application.
+# DatabaseBroker carries events from the WSGI workers through the database;
+# InProcessBroker only reaches clients connected to the publishing process
+SEAT_EVENTS_BROKER = os.getenv('SEAT_EVENTS_BROKER', 'movies.seat_events.DatabaseBroker')
+SEAT_EVENTS_MAX_SECONDS = int(os.getenv('SEAT_EVENTS_MAX_SECONDS', '120'))
+SEAT_EVENTS_KEEPALIVE_SECONDS = 15
+SEAT_EVENTS_POLL_SECONDS = float(os.getenv('SEAT_EVENTS_POLL_SECONDS', '1'))
+SEAT_EVENTS_RETENTION_SECONDS = 300
+
+# Memory-mapped seat layout files shared by all workers on this host
+SEAT_LAYOUT_CACHE_DIR = os.getenv('SEAT_LAYOUT_CACHE_DIR', '') or None
 
 # Email Configuration
 # TMDB API Configuration
 TMDB_API_KEY = config('TMDB_API_KEY', default='')
+# On-disk cache of TMDB API responses (movies/tmdb_cache.py). TMDB_CACHE_MODE
+# is live, record, replay (offline, serves recorded responses only) or off
+TMDB_CACHE_DIR = os.getenv('TMDB_CACHE_DIR', '') or None
+TMDB_CACHE_MODE = os.getenv('TMDB_CACHE_MODE', 'live')
+TMDB_CACHE_TTL = int(os.getenv('TMDB_CACHE_TTL', str(6 * 60 * 60)))
+TMDB_CACHE_MAX_BYTES = int(os.getenv('TMDB_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Where download_tmdb_images streams posters/backdrops before they are stored
+TMDB_IMAGE_DOWNLOAD_DIR = os.getenv('TMDB_IMAGE_DOWNLOAD_DIR', '') or None
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com' 
 EMAIL_PORT = 587
@@ -0,0 +1,23 @@
+"""
+SQLite backend that can start a transaction with BEGIN IMMEDIATE.
+
+A plain BEGIN takes no lock until the first write, so two transactions that
+read and then write can both get in, and the second one to write fails with
+"database is locked" instead of waiting. BEGIN IMMEDIATE takes the write
+lock up front, so concurrent bookings queue behind the busy timeout instead.
+Only blocks opened with cinema_project.db.immediate_atomic() ask for it;
+every other transaction keeps the plain BEGIN and doesn't queue readers.
+Selected in settings when SQLITE_IMMEDIATE_TRANSACTIONS is on.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Set by immediate_atomic() for the one transaction it opens
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        if self.begin_immediate:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
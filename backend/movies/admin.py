@@ -25,6 +25,7 @@ class SeatAdmin(admin.ModelAdmin):
 
 @admin.register(Showtime)
 class ShowtimeAdmin(admin.ModelAdmin):
-    list_display = ['movie', 'screen', 'start_time', 'base_price', 'available_seats']
+    list_display = ['movie', 'screen', 'start_time', 'base_price', 'booked_count', 'available_count']
     list_filter = ['screen__cinema', 'is_3d', 'start_time']
-    date_hierarchy = 'start_time'
\ No newline at end of file
+    date_hierarchy = 'start_time'
+    readonly_fields = ['booked_count', 'available_count']
\ No newline at end of file
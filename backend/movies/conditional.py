@@ -0,0 +1,112 @@
+"""
+Conditional GET (ETag / Last-Modified) for the read-only catalogue viewsets.
+
+Validators come from TableVersion rows rather than from hashing the body,
+so a 304 is decided with one small query, before the queryset is touched or
+anything is serialized. Seat counts are not versioned per table (taking a
+seat would invalidate every showtime response); actions that show them add
+the seat_version of their showtimes with seat_stamp().
+"""
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import TableVersion
+from .now_showing import today_start
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Add to a viewset and declare which tables each action reads:
+
+        version_tables = {'list': ['movies.movie'], 'retrieve': ['movies.movie']}
+        cache_control = {'list': {'public': True, 'max_age': 300}}
+
+    Actions without version_tables are served as before. cache_control falls
+    back to settings.CATALOGUE_CACHE_CONTROL. get_extra_validator() adds
+    state the tables don't cover to the ETag.
+    """
+    version_tables = {}
+    cache_control = {}
+
+    def get_version_tables(self):
+        return self.version_tables.get(self.action)
+
+    def get_extra_validator(self, request):
+        """A string that changes with the response beyond the version tables, or None"""
+        return None
+
+    def get_cache_control(self):
+        return self.cache_control.get(self.action, getattr(settings, 'CATALOGUE_CACHE_CONTROL', {}))
+
+    def get_validators(self, request):
+        tables = self.get_version_tables()
+        if not tables:
+            return None
+
+        # The day is part of the stamp because "today" scopes some responses
+        # (now_showing, showtimes without ?date=), so nothing is older than midnight
+        day_start = today_start()
+        last_modified = day_start
+        versions = {}
+        rows = TableVersion.objects.filter(table__in=tables).values_list('table', 'version', 'updated_at')
+        for table, version, updated_at in rows:
+            versions[table] = version
+            last_modified = max(last_modified, updated_at)
+
+        stamp = ';'.join(f'{table}={versions.get(table, 0)}' for table in sorted(tables))
+        stamp = f'{request.get_full_path()}|{stamp}|{day_start.date()}'
+        extra = self.get_extra_validator(request)
+        if extra is not None:
+            stamp = f'{stamp}|{extra}'
+            # The extra state has no modification time; validate by ETag only
+            last_modified = None
+        etag = f'"{hashlib.md5(stamp.encode()).hexdigest()}"'
+
+        return etag, last_modified and last_modified.timestamp()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        self._validators = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+
+        self._validators = self.get_validators(request)
+        if self._validators is None:
+            return
+
+        etag, last_modified = self._validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        validators = getattr(self, '_validators', None)
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, **self.get_cache_control())
+
+        return response
+
+
+def seat_stamp(showtimes):
+    """id:seat_version of each showtime, for get_extra_validator() of actions showing seat counts"""
+    return ','.join(sorted(f'{showtime.pk}:{showtime.seat_version}' for showtime in showtimes))
@@ -0,0 +1,165 @@
+"""
+Seat layout cache shared between worker processes.
+
+Seat rows for a screen almost never change once setup_cinema_data has
+created them, so each layout is written once to a small binary file named
+after the screen id and Screen.layout_version and then memory-mapped. Every
+gunicorn worker maps the same file, so the pages live once in the OS page
+cache and only the first worker to see a new version touches the database.
+
+Changing Screen.layout_version (see the signals in movies/models.py) makes
+the next lookup build a fresh file; the old one is removed on rebuild.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import Seat
+
+
+MAGIC = b'SLC1'
+HEADER = struct.Struct('<4sqqI')        # magic, screen id, layout version, seat count
+RECORD = struct.Struct('<q2sHB3x')      # seat id, row, number, seat type code
+
+SEAT_TYPE_CODES = {code: index for index, (code, _label) in enumerate(Seat.SEAT_TYPES)}
+SEAT_TYPES_BY_CODE = [code for code, _label in Seat.SEAT_TYPES]
+
+LayoutSeat = namedtuple('LayoutSeat', ['id', 'row', 'number', 'seat_type'])
+
+
+class SeatLayout:
+    """Read-only view of one screen's seats, in layout (row, number) order"""
+
+    def __init__(self, screen_id, version, buffer):
+        magic, stored_screen_id, stored_version, count = HEADER.unpack_from(buffer, 0)
+        if (magic != MAGIC or stored_screen_id != screen_id or stored_version != version
+                or len(buffer) != HEADER.size + count * RECORD.size):
+            raise ValueError(f'Corrupt seat layout file for screen {screen_id} v{version}')
+
+        self.screen_id = screen_id
+        self.version = version
+        self._buffer = buffer
+        self._count = count
+        self._seat_ids = None
+        self._by_id = None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        records = memoryview(self._buffer)[HEADER.size:HEADER.size + self._count * RECORD.size]
+        for seat_id, row, number, type_code in RECORD.iter_unpack(records):
+            yield LayoutSeat(seat_id, row.rstrip(b'\0').decode('ascii'), number, SEAT_TYPES_BY_CODE[type_code])
+
+    @property
+    def seat_ids(self):
+        if self._seat_ids is None:
+            self._seat_ids = [seat.id for seat in self]
+        return self._seat_ids
+
+    def get(self, seat_id):
+        if self._by_id is None:
+            self._by_id = {seat.id: seat for seat in self}
+        return self._by_id.get(seat_id)
+
+    def __contains__(self, seat_id):
+        return self.get(seat_id) is not None
+
+    def as_seat_dicts(self):
+        """Same shape as SeatSerializer output"""
+        return [
+            {
+                'id': seat.id,
+                'row': seat.row,
+                'number': seat.number,
+                'seat_type': seat.seat_type,
+                'screen': self.screen_id,
+            }
+            for seat in self
+        ]
+
+
+_layouts = {}
+_lock = threading.Lock()
+
+
+def _cache_dir():
+    path = Path(getattr(settings, 'SEAT_LAYOUT_CACHE_DIR', None) or
+                Path(tempfile.gettempdir()) / 'omniwatch-seat-layouts')
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _layout_path(screen_id, version):
+    return _cache_dir() / f'screen-{screen_id}-v{version}.bin'
+
+
+def _write_layout_file(screen_id, version):
+    seats = (
+        Seat.objects.filter(screen_id=screen_id)
+        .order_by('row', 'number')
+        .values_list('id', 'row', 'number', 'seat_type')
+    )
+
+    payload = bytearray()
+    count = 0
+    for seat_id, row, number, seat_type in seats.iterator():
+        payload += RECORD.pack(seat_id, row.encode('ascii'), number, SEAT_TYPE_CODES[seat_type])
+        count += 1
+
+    path = _layout_path(screen_id, version)
+
+    # Write to a temp file and rename so other workers never map a half-written layout
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.screen-{screen_id}-')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(HEADER.pack(MAGIC, screen_id, version, count))
+        tmp.write(payload)
+    os.replace(tmp_path, path)
+
+    # Older versions are stale now; workers that still map them keep their pages
+    for old_path in path.parent.glob(f'screen-{screen_id}-v*.bin'):
+        if old_path != path:
+            try:
+                old_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    return path
+
+
+def _map_layout(screen_id, version):
+    path = _layout_path(screen_id, version)
+    if not path.exists():
+        path = _write_layout_file(screen_id, version)
+
+    with open(path, 'rb') as layout_file:
+        buffer = mmap.mmap(layout_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return SeatLayout(screen_id, version, buffer)
+
+
+def get_seat_layout(screen):
+    """Return the SeatLayout for screen, building the shared file on first use"""
+    screen_id, version = screen.pk, screen.layout_version
+
+    cached = _layouts.get(screen_id)
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _lock:
+        cached = _layouts.get(screen_id)
+        if cached is None or cached.version != version:
+            try:
+                cached = _map_layout(screen_id, version)
+            except (FileNotFoundError, ValueError, struct.error):
+                # Removed by a concurrent rebuild, torn or foreign; rebuild it from the database
+                _write_layout_file(screen_id, version)
+                cached = _map_layout(screen_id, version)
+            _layouts[screen_id] = cached
+
+    return cached
@@ -0,0 +1,140 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from movies.models import Movie
+from movies.storage import content_addressed_name, content_hash
+
+
+IMAGE_FIELDS = ['poster_image', 'banner_image']
+MEDIA_DIRS = ['movie_posters', 'movie_banners']
+
+# import_tmdb_movies stores an image before the row that references it is
+# saved, so a file this new may be about to gain a reference
+UNREFERENCED_MIN_AGE = timedelta(hours=1)
+
+
+class Command(BaseCommand):
+    help = 'Rename movie images to content-hash names and repoint the ImageFields (optionally delete leftovers)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would change without touching files or rows'
+        )
+        parser.add_argument(
+            '--delete-unreferenced',
+            action='store_true',
+            help='Also delete files no movie references after deduplication (files under an hour old are kept)'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        self.digests = {}
+        self.copied = {}
+
+        self.stdout.write(self.style.SUCCESS('Deduplicating media...'))
+
+        movies = list(Movie.objects.only('id', 'title', *IMAGE_FIELDS, 'image_renditions'))
+        changed_movies = [movie for movie in movies if self.dedupe_movie(movie, dry_run)]
+
+        if not dry_run:
+            with transaction.atomic():
+                Movie.objects.bulk_update(changed_movies, IMAGE_FIELDS + ['image_renditions'], batch_size=200)
+
+        self.stdout.write(f'Movies repointed: {len(changed_movies)}')
+        self.stdout.write(f'Unique files written: {len(self.copied)}')
+
+        if not options['delete_unreferenced']:
+            return
+
+        # Anything left in the image directories that no movie points at is a duplicate
+        referenced = set()
+        for movie in movies:
+            referenced.update(self.movie_paths(movie))
+
+        removed = 0
+        freed = -sum(self.copied.values())
+        cutoff = timezone.now() - UNREFERENCED_MIN_AGE
+        for directory in MEDIA_DIRS:
+            if not default_storage.exists(directory):
+                continue
+            _dirs, files = default_storage.listdir(directory)
+            for filename in files:
+                name = f'{directory}/{filename}'
+                if name in referenced or filename.startswith('.'):
+                    continue
+                if default_storage.get_modified_time(name) > cutoff:
+                    continue
+                freed += default_storage.size(name)
+                if not dry_run:
+                    default_storage.delete(name)
+                removed += 1
+
+        verb = 'Would remove' if dry_run else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'\nDeduplication complete!\n{verb}: {removed} files ({freed / (1024 * 1024):.1f} MB freed)'
+        ))
+
+    def digest(self, name):
+        if name not in self.digests:
+            with default_storage.open(name, 'rb') as content:
+                self.digests[name] = content_hash(content)
+        return self.digests[name]
+
+    def hashed_name(self, name, dry_run):
+        """Content-addressed name for an existing file, copying it there if needed"""
+        if not name or name.startswith(('http://', 'https://')) or not default_storage.exists(name):
+            return name
+
+        target = content_addressed_name(name, self.digest(name))
+        if target != name and target not in self.copied and not default_storage.exists(target):
+            self.copied[target] = default_storage.size(name)
+            if not dry_run:
+                with default_storage.open(name, 'rb') as content:
+                    default_storage.save(target, content)
+        return target
+
+    def dedupe_movie(self, movie, dry_run):
+        changed = False
+
+        for field_name in IMAGE_FIELDS:
+            image_field = getattr(movie, field_name)
+            new_name = self.hashed_name(image_field.name, dry_run)
+            if new_name != image_field.name:
+                image_field.name = new_name
+                changed = True
+
+        renditions = movie.image_renditions or {}
+        for field_name, entry in renditions.items():
+            for key, value in entry.items():
+                if key == 'source':
+                    new_source = self.hashed_name(value, dry_run)
+                    changed = changed or new_source != value
+                    entry[key] = new_source
+                    continue
+                if not isinstance(value, dict):
+                    # e.g. 'failed': True
+                    continue
+                for width, name in value.items():
+                    new_name = self.hashed_name(name, dry_run)
+                    if new_name != name:
+                        value[width] = new_name
+                        changed = True
+
+        return changed
+
+    def movie_paths(self, movie):
+        for field_name in IMAGE_FIELDS:
+            image_field = getattr(movie, field_name)
+            if image_field:
+                yield image_field.name
+        for entry in (movie.image_renditions or {}).values():
+            for key, value in entry.items():
+                if key == 'source':
+                    yield value
+                elif isinstance(value, dict):
+                    yield from value.values()
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from movies.tmdb_images import download_images, pending_movies
+from movies.tmdb_service import TMDBService
+import time
+
+
+class Command(BaseCommand):
+    help = 'Download TMDB posters and backdrops that have not been stored yet, and render them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Concurrent image downloads'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Movies written to the database per batch'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        workers = max(options['workers'], 1)
+        tmdb = TMDBService(pool_size=workers)
+
+        self.stdout.write(f'Movies with images to download: {pending_movies().count()}')
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tmdb-images') as executor:
+            movies, images = download_images(
+                tmdb, executor,
+                batch_size=options['batch_size'],
+                log=self.stdout.write,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\nDownloads complete!\nMovies updated: {movies}\nImages stored: {images}\n'
+            f'Still pending: {pending_movies().count()}\n'
+            f'Finished in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from movies.models import Movie
+from movies.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG renditions of movie posters and banners'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate renditions even if they are up to date or failed before'
+        )
+    
+    def handle(self, *args, **options):
+        generated = 0
+        
+        for movie in Movie.objects.all().iterator():
+            if generate_renditions(movie, force=options['force']):
+                generated += 1
+                self.stdout.write(f'Rendered: {movie.title}')
+        
+        self.stdout.write(self.style.SUCCESS(f'\nRenditions complete!\nMovies updated: {generated}'))
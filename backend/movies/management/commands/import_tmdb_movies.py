@@ -1,14 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.core.management.base import BaseCommand
-from django.core.files.base import ContentFile
-from movies.models import Movie
+from django.db import transaction
+from django.utils import timezone
+from movies.models import Movie, TableVersion
+from movies.search import index_movies
+from movies.tmdb_cache import MODES, ResponseCache
+from movies.tmdb_images import download_images
 from movies.tmdb_service import TMDBService
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
+import json
 import time
 
 
+# Fields refreshed from TMDB on every sync. is_3d/is_imax/is_featured are set
+# on import only, since staff edit them afterwards
+SYNCED_FIELDS = ['title', 'description', 'duration', 'rating', 'genre', 'release_date',
+                 'director', 'cast', 'trailer_url', 'tmdb_poster_path', 'tmdb_backdrop_path']
+
+
+def content_hash(fields):
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
 class Command(BaseCommand):
     help = 'Import movies from TMDB API'
-    
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--type',
@@ -22,110 +39,223 @@ class Command(BaseCommand):
             default=1,
             help='Number of pages to import'
         )
-    
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Concurrent TMDB requests'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=TMDBService.DEFAULT_RATE_LIMIT,
+            help='Maximum TMDB API requests per second'
+        )
+        parser.add_argument(
+            '--cache-mode',
+            choices=MODES,
+            help='TMDB response cache: live (default), record, replay (offline) or off'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=float,
+            default=24,
+            help='Re-fetch details for movies last synced more than this many hours ago (0 refreshes all)'
+        )
+        parser.add_argument(
+            '--skip-images',
+            action='store_true',
+            help='Only sync metadata; run download_tmdb_images later to fetch posters and backdrops'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Movies written to the database per batch'
+        )
+
     def handle(self, *args, **options):
-        tmdb = TMDBService()
+        started = time.monotonic()
+        workers = max(options['workers'], 1)
+        tmdb = TMDBService(
+            rate_limit=options['rate'],
+            pool_size=workers,
+            cache=ResponseCache(mode=options['cache_mode']),
+        )
         movie_type = options['type']
         pages = options['pages']
-        
+        self.batch_size = options['batch_size']
+
         self.stdout.write(self.style.SUCCESS(f'Starting import of {movie_type} movies...'))
-        
-        imported_count = 0
-        skipped_count = 0
-        
-        for page in range(1, pages + 1):
-            self.stdout.write(f'Fetching page {page}...')
-            
-            if movie_type == 'now_playing':
-                data = tmdb.get_now_playing(page)
-            else:
-                data = tmdb.get_upcoming(page)
-            
-            if not data or 'results' not in data:
-                self.stdout.write(self.style.ERROR('Failed to fetch movies'))
-                continue
-            
-            for movie_data in data['results']:
-                tmdb_id = movie_data['id']
-                
-                if Movie.objects.filter(title=movie_data['title']).exists():
-                    skipped_count += 1
-                    continue
-                
-                details = tmdb.get_movie_details(tmdb_id)
-                if not details:
+
+        self.imported_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        fetch_page = tmdb.get_now_playing if movie_type == 'now_playing' else tmdb.get_upcoming
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tmdb') as executor:
+            self.executor = executor
+
+            # Listing pages first, then every movie's details in parallel, then images
+            self.stdout.write(f'Fetching {pages} pages...')
+            results = []
+            for page, data in zip(range(1, pages + 1), executor.map(fetch_page, range(1, pages + 1))):
+                if not data or 'results' not in data:
+                    self.stdout.write(self.style.ERROR(f'Failed to fetch page {page}'))
                     continue
-                
-                self.stdout.write(f'Importing: {movie_data["title"]}')
-                
+                results.extend(data['results'])
+
+            # Pages can overlap. Every listed tmdb_id is resolved in one query;
+            # details are only fetched for new movies and ones synced before
+            # stale_before. Movies added by hand (no tmdb_id) are matched by
+            # title and left alone
+            candidates = {}
+            for movie_data in results:
+                candidates.setdefault(movie_data['id'], movie_data)
+            existing = Movie.objects.filter(tmdb_id__in=list(candidates)).only(
+                'id', 'tmdb_id', 'tmdb_synced_at', 'tmdb_content_hash'
+            ).in_bulk(field_name='tmdb_id')
+            untracked_titles = set(Movie.objects.filter(
+                tmdb_id__isnull=True,
+                title__in=[movie_data['title'] for movie_data in candidates.values()]
+            ).values_list('title', flat=True))
+
+            stale_before = timezone.now() - timedelta(hours=options['stale_after'])
+            to_fetch = []
+            for tmdb_id, movie_data in candidates.items():
+                movie = existing.get(tmdb_id)
+                if movie is None:
+                    if movie_data['title'] not in untracked_titles:
+                        to_fetch.append((movie_data, None))
+                elif movie.tmdb_synced_at is None or movie.tmdb_synced_at < stale_before:
+                    to_fetch.append((movie_data, movie))
+            skipped_count = len(results) - len(to_fetch)
+
+            futures = {
+                executor.submit(self.fetch_movie, tmdb, movie_data, movie): movie_data
+                for movie_data, movie in to_fetch
+            }
+            batch = []
+            for future in as_completed(futures):
+                movie_data = futures[future]
                 try:
-                    rating_map = {
-                        'G': 'G', 'PG': 'PG', 'PG-13': '12A',
-                        '12A': '12A', '15': '15A', 'R': '18', 'NC-17': '18'
-                    }
-                    
-                    certification = tmdb.get_certification(details.get('release_dates', {}))
-                    rating = rating_map.get(certification, 'PG')
-                    
-                    credits = details.get('credits', {})
-                    director = next(
-                        (crew['name'] for crew in credits.get('crew', []) if crew['job'] == 'Director'),
-                        'Unknown'
-                    )
-                    cast = ', '.join([actor['name'] for actor in credits.get('cast', [])[:5]])
-                    
-                    genres = details.get('genres', [])
-                    genre = genres[0]['name'] if genres else 'Drama'
-                    
-                    videos = details.get('videos', {}).get('results', [])
-                    trailer_url = f"https://www.youtube.com/watch?v={videos[0]['key']}" if videos else ''
-                    
-                    movie = Movie(
-                        title=movie_data['title'],
-                        description=movie_data.get('overview', 'No description available'),
-                        duration=details.get('runtime', 120),
-                        rating=rating,
-                        genre=genre,
-                        release_date=datetime.strptime(movie_data['release_date'], '%Y-%m-%d').date() if movie_data.get('release_date') else datetime.now().date(),
-                        director=director,
-                        cast=cast,
-                        is_3d=False,
-                        is_imax=False,
-                        is_featured=movie_data.get('vote_average', 0) > 7.5,
-                        trailer_url=trailer_url,
-                        tmdb_id=tmdb_id
-                    )
-                    
-                    poster_url = tmdb.get_poster_url(movie_data.get('poster_path'))
-                    if poster_url:
-                        poster_content = tmdb.download_image(poster_url)
-                        if poster_content:
-                            movie.poster_image.save(
-                                f"{tmdb_id}_poster.jpg",
-                                ContentFile(poster_content),
-                                save=False
-                            )
-                    
-                    backdrop_url = tmdb.get_backdrop_url(movie_data.get('backdrop_path'))
-                    if backdrop_url:
-                        backdrop_content = tmdb.download_image(backdrop_url)
-                        if backdrop_content:
-                            movie.banner_image.save(
-                                f"{tmdb_id}_banner.jpg",
-                                ContentFile(backdrop_content),
-                                save=False
-                            )
-                    
-                    movie.save()
-                    imported_count += 1
-                    time.sleep(0.25)
-                    
+                    result = future.result()
                 except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'Error: {str(e)}'))
+                    self.stdout.write(self.style.ERROR(f'Error importing {movie_data["title"]}: {str(e)}'))
+                    continue
+                if result is None:
                     continue
-            
-            self.stdout.write(self.style.SUCCESS(f'Page {page} complete'))
-        
+
+                movie, changed = result
+                if movie.pk is None:
+                    self.stdout.write(f'Importing: {movie.title}')
+                elif changed:
+                    self.stdout.write(f'Updating: {movie.title}')
+                batch.append(result)
+                if len(batch) >= self.batch_size:
+                    self.save_batch(batch)
+                    batch = []
+            self.save_batch(batch)
+
+            if not options['skip_images']:
+                self.stdout.write('Downloading images...')
+                movies, images = download_images(tmdb, executor, batch_size=self.batch_size, log=self.stdout.write)
+                self.stdout.write(f'Stored {images} images for {movies} movies')
+
         self.stdout.write(self.style.SUCCESS(
-            f'\nImport complete!\nImported: {imported_count} movies\nSkipped: {skipped_count} movies'
-        ))
\ No newline at end of file
+            f'\nImport complete!\nImported: {self.imported_count} movies\n'
+            f'Updated: {self.updated_count} movies\nUnchanged: {self.unchanged_count} movies\n'
+            f'Skipped: {skipped_count} movies\n'
+            f'Finished in {time.monotonic() - started:.1f}s'
+        ))
+
+    def movie_fields(self, tmdb, movie_data, details):
+        rating_map = {
+            'G': 'G', 'PG': 'PG', 'PG-13': '12A',
+            '12A': '12A', '15': '15A', 'R': '18', 'NC-17': '18'
+        }
+
+        certification = tmdb.get_certification(details.get('release_dates', {}))
+        rating = rating_map.get(certification, 'PG')
+
+        credits = details.get('credits', {})
+        director = next(
+            (crew['name'] for crew in credits.get('crew', []) if crew['job'] == 'Director'),
+            'Unknown'
+        )
+        cast = ', '.join([actor['name'] for actor in credits.get('cast', [])[:5]])
+
+        genres = details.get('genres', [])
+        genre = genres[0]['name'] if genres else 'Drama'
+
+        videos = details.get('videos', {}).get('results', [])
+        trailer_url = f"https://www.youtube.com/watch?v={videos[0]['key']}" if videos else ''
+
+        return {
+            'title': movie_data['title'],
+            'description': movie_data.get('overview', 'No description available'),
+            'duration': details.get('runtime') or 120,
+            'rating': rating,
+            'genre': genre,
+            'release_date': datetime.strptime(movie_data['release_date'], '%Y-%m-%d').date() if movie_data.get('release_date') else datetime.now().date(),
+            'director': director,
+            'cast': cast,
+            'trailer_url': trailer_url,
+            'tmdb_poster_path': movie_data.get('poster_path') or '',
+            'tmdb_backdrop_path': movie_data.get('backdrop_path') or '',
+        }
+
+    def fetch_movie(self, tmdb, movie_data, movie=None):
+        """
+        Runs on a worker thread. Returns (movie, changed): an unsaved Movie for
+        new ones, otherwise the existing movie with any TMDB changes applied.
+        Images are left to the download stage (movies.tmdb_images)
+        """
+        tmdb_id = movie_data['id']
+        details = tmdb.get_movie_details(tmdb_id)
+        if not details:
+            return None
+
+        fields = self.movie_fields(tmdb, movie_data, details)
+        digest = content_hash(fields)
+        synced_at = timezone.now()
+
+        if movie is not None:
+            changed = digest != movie.tmdb_content_hash
+            if changed:
+                for name, value in fields.items():
+                    setattr(movie, name, value)
+                movie.tmdb_content_hash = digest
+            movie.tmdb_synced_at = synced_at
+            return movie, changed
+
+        return Movie(
+            **fields,
+            is_3d=False,
+            is_imax=False,
+            is_featured=movie_data.get('vote_average', 0) > 7.5,
+            tmdb_id=tmdb_id,
+            tmdb_synced_at=synced_at,
+            tmdb_content_hash=digest,
+        ), True
+
+    def save_batch(self, batch):
+        if not batch:
+            return
+
+        created = [movie for movie, _changed in batch if movie.pk is None]
+        updated = [movie for movie, changed in batch if changed and movie.pk is not None]
+        unchanged = [movie for movie, changed in batch if not changed]
+
+        with transaction.atomic():
+            created = Movie.objects.bulk_create(created)
+            Movie.objects.bulk_update(updated, SYNCED_FIELDS + ['tmdb_content_hash', 'tmdb_synced_at'])
+            Movie.objects.bulk_update(unchanged, ['tmdb_synced_at'])
+            # Bulk writes skip the Movie signals: index for search and bump the catalogue version here
+            if created or updated:
+                index_movies(created + updated)
+                TableVersion.bump('movies.movie')
+        self.imported_count += len(created)
+        self.updated_count += len(updated)
+        self.unchanged_count += len(unchanged)
+
@@ -0,0 +1,205 @@
+import time as timer
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from bookings.models import Booking, BookedSeat
+from movies.models import Movie, Screen, Showtime
+from movies.optimizer import TICK_MINUTES, estimate_demand, minutes_to_ticks, plan_day
+from movies.scheduling import SchedulePlanner, showtime_price
+
+
+class Command(BaseCommand):
+    help = 'Programme showtimes from historical occupancy, maximizing expected seats sold'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=str,
+            help='First day to programme, YYYY-MM-DD (default: tomorrow)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Number of days to programme'
+        )
+        parser.add_argument(
+            '--cinema',
+            type=int,
+            action='append',
+            help='Only programme this cinema (can be repeated)'
+        )
+        parser.add_argument(
+            '--history-days',
+            type=int,
+            default=90,
+            help='Days of past showtimes to learn demand from'
+        )
+        parser.add_argument(
+            '--open',
+            type=str,
+            default='10:00',
+            help='Earliest start time of the day'
+        )
+        parser.add_argument(
+            '--last-start',
+            type=str,
+            default='22:30',
+            help='Latest start time of the day'
+        )
+        parser.add_argument(
+            '--slot-minutes',
+            type=int,
+            default=15,
+            help='Granularity of start times'
+        )
+        parser.add_argument(
+            '--repeat-decay',
+            type=float,
+            default=0.7,
+            help='Demand multiplier for each further showing of a film at a cinema on the same day'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the plan without writing showtimes'
+        )
+
+    def handle(self, *args, **options):
+        started = timer.monotonic()
+
+        start_day = parse_date(options['start']) if options['start'] else timezone.localdate() + timedelta(days=1)
+        open_time = parse_time(options['open'])
+        last_start = parse_time(options['last_start'])
+        if start_day is None or open_time is None or last_start is None or last_start <= open_time:
+            raise CommandError('Invalid --start, --open or --last-start')
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        if options['slot_minutes'] % TICK_MINUTES:
+            raise CommandError(f'--slot-minutes must be a multiple of {TICK_MINUTES}')
+
+        days = [start_day + timedelta(days=offset) for offset in range(options['days'])]
+
+        screens = Screen.objects.order_by('cinema_id', 'id')
+        if options['cinema']:
+            screens = screens.filter(cinema_id__in=options['cinema'])
+        screens = list(screens)
+        movies = list(Movie.objects.filter(release_date__lte=days[-1]).order_by('id'))
+        if not screens or not movies:
+            self.stdout.write(self.style.WARNING('Nothing to programme: no screens or no released movies.'))
+            return
+
+        screen_types = [screen_type for screen_type, _label in Screen.SCREEN_TYPES]
+        rates = self.estimate_rates(movies, screen_types, options['history_days'])
+
+        window_start = timezone.make_aware(datetime.combine(days[0], time.min))
+        window_end = timezone.make_aware(datetime.combine(days[-1] + timedelta(days=1), time.min))
+        planner = SchedulePlanner(screens, window_start, window_end)
+
+        # Candidate start slots and screen time per film, in ticks from opening
+        slot_step = options['slot_minutes'] // TICK_MINUTES
+        open_minutes = open_time.hour * 60 + open_time.minute
+        last_minutes = last_start.hour * 60 + last_start.minute
+        slots = np.arange(0, (last_minutes - open_minutes) // TICK_MINUTES + 1, slot_step)
+        slot_hours = ((open_minutes + slots * TICK_MINUTES) // 60) % 24
+        lengths = minutes_to_ticks([movie.duration + 30 for movie in movies])
+        horizon = int(slots[-1] + lengths.max())
+        release_dates = np.array([movie.release_date.toordinal() for movie in movies])
+
+        cinemas = {}
+        for screen in screens:
+            cinemas.setdefault(screen.cinema_id, []).append(screen)
+
+        planned = 0
+        expected_seats = 0.0
+        for day in days:
+            day_open = timezone.make_aware(datetime.combine(day, open_time))
+            released = release_dates <= day.toordinal()
+
+            for cinema_id, cinema_screens in cinemas.items():
+                capacity = np.array([screen.total_seats for screen in cinema_screens], dtype=float)
+                type_index = [screen_types.index(screen.screen_type) for screen in cinema_screens]
+
+                # [movies, slots, screens] -> [movies, screens, slots] expected seats per showing
+                expected = rates[:, slot_hours][:, :, type_index].transpose(0, 2, 1) * capacity[None, :, None]
+                expected[~released] = -np.inf
+
+                busy = self.busy_ticks(planner, cinema_screens, day_open, horizon)
+                for movie_index, screen_index, slot_index, seats in plan_day(
+                    expected, lengths, slots, busy, repeat_decay=options['repeat_decay']
+                ):
+                    movie, screen = movies[movie_index], cinema_screens[screen_index]
+                    start_time = day_open + timedelta(minutes=int(slots[slot_index]) * TICK_MINUTES)
+                    if planner.add(movie, screen, start_time, showtime_price(screen, start_time, movie.is_3d),
+                                   is_3d=movie.is_3d):
+                        planned += 1
+                        expected_seats += seats
+
+        if not options['dry_run']:
+            planner.save()
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {planned} showtimes across {len(cinemas)} cinemas and {len(days)} days\n'
+            f'Expected seats sold: {expected_seats:.0f}\n'
+            f'Finished in {timer.monotonic() - started:.1f}s'
+        ))
+
+    def estimate_rates(self, movies, screen_types, history_days):
+        """Occupancy rate per (movie, hour, screen type) from past bookings"""
+        until = timezone.now()
+        since = until - timedelta(days=history_days)
+
+        movie_index = {movie.id: index for index, movie in enumerate(movies)}
+        type_index = {screen_type: index for index, screen_type in enumerate(screen_types)}
+        sold = np.zeros((len(movies), 24, len(screen_types)))
+        offered = np.zeros_like(sold)
+
+        offered_rows = (
+            Showtime.objects
+            .filter(start_time__gte=since, start_time__lt=until)
+            .annotate(hour=ExtractHour('start_time'))
+            .values('movie_id', 'hour', 'screen__screen_type')
+            .annotate(seats=Sum('screen__total_seats'))
+            .order_by()
+        )
+        for row in offered_rows:
+            if row['movie_id'] in movie_index:
+                offered[movie_index[row['movie_id']], row['hour'], type_index[row['screen__screen_type']]] += row['seats']
+
+        sold_rows = (
+            BookedSeat.objects
+            .filter(booking__status__in=Booking.ACTIVE_STATUSES,
+                    booking__showtime__start_time__gte=since, booking__showtime__start_time__lt=until)
+            .annotate(hour=ExtractHour('booking__showtime__start_time'))
+            .values('booking__showtime__movie_id', 'hour', 'booking__showtime__screen__screen_type')
+            .annotate(seats=Count('id'))
+            .order_by()
+        )
+        for row in sold_rows:
+            movie_id = row['booking__showtime__movie_id']
+            if movie_id in movie_index:
+                sold[movie_index[movie_id], row['hour'], type_index[row['booking__showtime__screen__screen_type']]] += row['seats']
+
+        self.stdout.write(f'History: {int(sold.sum())} seats sold of {int(offered.sum())} offered')
+        return estimate_demand(sold, offered)
+
+    def busy_ticks(self, planner, screens, day_open, horizon):
+        """[screens, ticks] mask of time already taken on each screen from day_open on"""
+        busy = np.zeros((len(screens), horizon), dtype=bool)
+        day_close = day_open + timedelta(minutes=horizon * TICK_MINUTES)
+        for screen_index, screen in enumerate(screens):
+            timeline = planner.timelines[screen.id]
+            for start, end in zip(timeline.starts, timeline.ends):
+                if end <= day_open or start >= day_close:
+                    continue
+                first = max(int((start - day_open).total_seconds() // 60 // TICK_MINUTES), 0)
+                last = min(int(minutes_to_ticks((end - day_open).total_seconds() / 60)), horizon)
+                busy[screen_index, first:last] = True
+        return busy
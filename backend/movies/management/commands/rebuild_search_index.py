@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from movies.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the movie full-text search index from the Movie table'
+    
+    def handle(self, *args, **options):
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt!'))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q
+from cinema_project.db import immediate_atomic
+from movies.models import Showtime
+from bookings.models import Booking
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Showtime.booked_count/available_count from BookedSeat rows'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--showtime',
+            type=int,
+            action='append',
+            help='Only rebuild the given showtime id (can be repeated)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of showtimes recounted and written per transaction'
+        )
+    
+    def handle(self, *args, **options):
+        showtimes = Showtime.objects.all()
+        if options['showtime']:
+            showtimes = showtimes.filter(id__in=options['showtime'])
+        showtime_ids = list(showtimes.order_by('id').values_list('id', flat=True))
+        
+        checked = corrected = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(showtime_ids), batch_size):
+            batch = showtime_ids[start:start + batch_size]
+            with immediate_atomic():
+                # Locked before counting, so a booking's adjust_seat_counts() can't
+                # land between the count and the write and be overwritten
+                list(Showtime.objects.select_for_update().filter(id__in=batch).values_list('id', flat=True))
+                
+                # One grouped COUNT for the batch instead of one query each
+                counted = Showtime.objects.filter(id__in=batch).annotate(
+                    booked=Count(
+                        'bookings__booked_seats',
+                        filter=Q(bookings__status__in=Booking.ACTIVE_STATUSES)
+                    ),
+                    total_seats=F('screen__total_seats'),
+                ).only('id', 'booked_count', 'available_count', 'seat_version')
+                
+                changed = []
+                for showtime in counted:
+                    checked += 1
+                    available = showtime.total_seats - showtime.booked
+                    
+                    if showtime.booked_count != showtime.booked or showtime.available_count != available:
+                        showtime.booked_count = showtime.booked
+                        showtime.available_count = available
+                        # Seat counts are validated by seat_version (ETags, schedule cache)
+                        showtime.seat_version += 1
+                        changed.append(showtime)
+                
+                Showtime.objects.bulk_update(changed, ['booked_count', 'available_count', 'seat_version'])
+                corrected += len(changed)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Seat counters rebuilt!\nShowtimes checked: {checked}\nShowtimes corrected: {corrected}'
+        ))
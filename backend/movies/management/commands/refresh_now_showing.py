@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from movies.models import NowShowing
+from movies import now_showing
+
+
+class Command(BaseCommand):
+    help = 'Refresh the materialized now showing set (schedule just after midnight; also after bulk schedule changes)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild every entry instead of only those left stale by the day rollover'
+        )
+    
+    def handle(self, *args, **options):
+        if options['full']:
+            now_showing.rebuild()
+        else:
+            now_showing.refresh_stale()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Now showing refreshed!\nMovies showing: {NowShowing.objects.count()}'
+        ))
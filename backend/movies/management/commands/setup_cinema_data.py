@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
-from movies.models import Cinema, Screen, Seat, Showtime, Movie
-from datetime import datetime, timedelta
+from movies.models import Cinema, Screen, Seat, Movie
+from movies.scheduling import SchedulePlanner, showtime_price
+from datetime import timedelta
 from django.utils import timezone
 import random
 
@@ -130,6 +131,8 @@ class Command(BaseCommand):
                                 )
                         
                         Seat.objects.bulk_create(seats_to_create)
+                        # bulk_create skips the Seat signals, so invalidate the cached layout here
+                        screen.bump_layout_version()
                         seats_created += len(seats_to_create)
                         self.stdout.write(f'    Created {len(seats_to_create)} seats')
         
@@ -150,79 +153,65 @@ class Command(BaseCommand):
         ))
     
     def create_showtimes(self, num_days):
-        """Create showtimes for all movies across all screens"""
-        movies = Movie.objects.all()
-        screens = Screen.objects.all()
+        """Create showtimes for all movies across all screens, a week per bulk insert"""
+        movies = list(Movie.objects.all())
+        screens = list(Screen.objects.all())
         
-        if not movies.exists():
+        if not movies:
             self.stdout.write(self.style.WARNING('No movies found. Please import movies first.'))
             return 0
         
-        if not screens.exists():
+        if not screens:
             self.stdout.write(self.style.WARNING('No screens found.'))
             return 0
         
         showtimes_created = 0
-        base_prices = {
-            'STANDARD': 10.50,
-            'MAXX': 13.50,
-            'DLUXX': 15.00,
-            'RECLINE': 12.50,
-            'LUX': 18.00,
-        }
+        overlapping = 0
         
         # Showtime slots (hours)
         time_slots = [11, 12, 14, 15, 17, 18, 20, 21, 22]
         
-        for day in range(num_days):
-            show_date = timezone.now() + timedelta(days=day)
+        now = timezone.now()
+        for week_start in range(0, num_days, 7):
+            days = range(week_start, min(week_start + 7, num_days))
+            window_start = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=week_start)
+            planner = SchedulePlanner(screens, window_start, window_start + timedelta(days=len(days)))
             
-           
-            for screen in screens:
-                # Premium screens get more showtimes 
-                if screen.screen_type in ['MAXX', 'DLUXX', 'RECLINE']:
-                    num_showtimes = random.randint(5, 7)
-                else:
-                    # Standard screens 
-                    num_showtimes = random.randint(3, 5)
+            for day in days:
+                show_date = now + timedelta(days=day)
                 
-                # Select random movies for this screen
-                daily_movies = random.sample(list(movies), min(num_showtimes, movies.count()))
-                
-                # Assign time slots to movies
-                selected_slots = random.sample(time_slots, min(num_showtimes, len(time_slots)))
-                
-                for movie, hour in zip(daily_movies, selected_slots):
-                    show_time = show_date.replace(
-                        hour=hour,
-                        minute=random.choice([0, 15, 30, 45]),
-                        second=0,
-                        microsecond=0
-                    )
+                for screen in screens:
+                    # Premium screens get more showtimes 
+                    if screen.screen_type in ['MAXX', 'DLUXX', 'RECLINE']:
+                        num_showtimes = random.randint(5, 7)
+                    else:
+                        # Standard screens 
+                        num_showtimes = random.randint(3, 5)
+                    
+                    # Select random movies for this screen
+                    daily_movies = random.sample(movies, min(num_showtimes, len(movies)))
                     
-                    # Check if showtime already exists
-                    if not Showtime.objects.filter(
-                        screen=screen,
-                        start_time=show_time
-                    ).exists():
+                    # Assign time slots to movies, earliest first
+                    selected_slots = sorted(random.sample(time_slots, min(num_showtimes, len(time_slots))))
+                    
+                    for movie, hour in zip(daily_movies, selected_slots):
+                        show_time = show_date.replace(
+                            hour=hour,
+                            minute=random.choice([0, 15, 30, 45]),
+                            second=0,
+                            microsecond=0
+                        )
                         
-                        base_price = base_prices.get(screen.screen_type, 10.50)
                         is_3d = movie.is_3d and random.choice([True, False])
+                        base_price = showtime_price(screen, show_time, is_3d)
                         
-                        if is_3d:
-                            base_price += 2.00
-                        
-                        # Weekend surcharge
-                        if show_date.weekday() >= 5:  # Saturday or Sunday
-                            base_price += 2.50
-                        
-                        Showtime.objects.create(
-                            movie=movie,
-                            screen=screen,
-                            start_time=show_time,
-                            base_price=base_price,
-                            is_3d=is_3d
-                        )
-                        showtimes_created += 1
+                        # Skipped when the screen is still busy with an earlier film
+                        planner.add(movie, screen, show_time, base_price, is_3d=is_3d)
+            
+            showtimes_created += len(planner.save())
+            overlapping += planner.rejected
+        
+        if overlapping:
+            self.stdout.write(f'Skipped {overlapping} slots that overlapped another showtime')
         
-        return showtimes_created
\ No newline at end of file
+        return showtimes_created
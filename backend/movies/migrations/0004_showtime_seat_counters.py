@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:19
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+
+
+def populate_seat_counters(apps, schema_editor):
+    Showtime = apps.get_model('movies', 'Showtime')
+    
+    showtimes = Showtime.objects.annotate(
+        booked=Count(
+            'bookings__booked_seats',
+            filter=Q(bookings__status__in=['PENDING', 'CONFIRMED'])
+        ),
+        total_seats=F('screen__total_seats'),
+    )
+    
+    updated = []
+    for showtime in showtimes.iterator():
+        showtime.booked_count = showtime.booked
+        showtime.available_count = showtime.total_seats - showtime.booked
+        updated.append(showtime)
+    
+    Showtime.objects.bulk_update(updated, ['booked_count', 'available_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_alter_movie_poster_image'),
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showtime',
+            name='available_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='booked_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_seat_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:21
+
+from django.db import migrations, models
+import movies.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_showtime_seat_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screen',
+            name='layout_version',
+            field=models.IntegerField(default=movies.models.new_layout_version),
+        ),
+    ]
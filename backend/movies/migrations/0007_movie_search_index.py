@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'movies_movie_fts'
+PG_INDEX = 'movies_movie_search_idx'
+
+# Must stay identical to movies.search.PG_VECTOR so the planner can use the index
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(\"title\", '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(\"director\", '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(\"cast\", '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(\"genre\", '')), 'D')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+            'title, director, "cast", genre, tokenize="unicode61 remove_diacritics 2")'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, director, "cast", genre) '
+            'SELECT id, title, director, "cast", genre FROM movies_movie'
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE INDEX {PG_INDEX} ON movies_movie USING GIN (({PG_VECTOR}))')
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_screen_layout_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
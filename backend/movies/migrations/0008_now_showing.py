@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:23
+
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def populate_now_showing(apps, schema_editor):
+    Showtime = apps.get_model('movies', 'Showtime')
+    NowShowing = apps.get_model('movies', 'NowShowing')
+    
+    today_start = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    next_starts = (
+        Showtime.objects.filter(start_time__gte=today_start)
+        .values('movie_id')
+        .annotate(next_start=Min('start_time'))
+    )
+    NowShowing.objects.bulk_create([
+        NowShowing(movie_id=row['movie_id'], next_start_time=row['next_start'])
+        for row in next_starts
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_movie_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NowShowing',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='now_showing', serialize=False, to='movies.movie')),
+                ('next_start_time', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['next_start_time', 'movie_id'],
+            },
+        ),
+        migrations.RunPython(populate_now_showing, migrations.RunPython.noop),
+    ]
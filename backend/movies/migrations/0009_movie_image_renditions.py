@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_now_showing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='tmdb_content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='tmdb_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
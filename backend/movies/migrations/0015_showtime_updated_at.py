@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0014_movie_tmdb_image_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showtime',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0015_showtime_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken', models.JSONField(default=list)),
+                ('released', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('showtime', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.showtime')),
+            ],
+        ),
+    ]
@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from datetime import timedelta
+import random
 
 class Cinema(models.Model):
     name = models.CharField(max_length=200)
@@ -24,6 +29,15 @@ class Movie(models.Model):
     ]
 
     tmdb_id = models.IntegerField(null=True, blank=True, unique=True)
+    # Set by import_tmdb_movies: when the TMDB details were last fetched, and a
+    # hash of the fields derived from them, so unchanged movies aren't rewritten
+    tmdb_synced_at = models.DateTimeField(null=True, blank=True)
+    tmdb_content_hash = models.CharField(max_length=64, blank=True)
+    # TMDB paths the poster/banner should be downloaded from, and the paths the
+    # stored files actually came from (see movies.tmdb_images)
+    tmdb_poster_path = models.CharField(max_length=200, blank=True)
+    tmdb_backdrop_path = models.CharField(max_length=200, blank=True)
+    tmdb_image_sources = models.JSONField(default=dict, blank=True)
     
     title = models.CharField(max_length=300)
     description = models.TextField()
@@ -40,10 +54,17 @@ class Movie(models.Model):
     is_imax = models.BooleanField(default=False)
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Resized poster/banner files, maintained by movies.renditions
+    image_renditions = models.JSONField(default=dict, blank=True)
     
     def __str__(self):
         return self.title
 
+def new_layout_version():
+    # Random rather than incrementing so a rebuilt database never reuses a
+    # (screen id, version) pair that is still sitting in the layout cache
+    return random.randint(1, 2**31 - 1)
+
 class Screen(models.Model):
     SCREEN_TYPES = [
         ('STANDARD', 'Standard'),
@@ -59,9 +80,14 @@ class Screen(models.Model):
     total_seats = models.IntegerField()
     rows = models.IntegerField(default=10)
     seats_per_row = models.IntegerField(default=15)
+    # Replaced whenever the screen or its seats change; keys the seat layout cache
+    layout_version = models.IntegerField(default=new_layout_version)
     
     def __str__(self):
         return f"{self.cinema.name} - {self.name}"
+    
+    def bump_layout_version(self):
+        Screen.objects.filter(pk=self.pk).update(layout_version=new_layout_version())
 
 class Seat(models.Model):
     SEAT_TYPES = [
@@ -92,22 +118,167 @@ class Showtime(models.Model):
     base_price = models.DecimalField(max_digits=6, decimal_places=2)
     is_3d = models.BooleanField(default=False)
     
+    # Denormalized occupancy, kept in step with bookings by adjust_seat_counts()
+    # and rebuilt from BookedSeat by the rebuild_seat_counters command
+    booked_count = models.IntegerField(default=0)
+    available_count = models.IntegerField(default=0)
+    # Bumped whenever a seat is taken or released; drives the ETags of seat maps
+    # and of responses showing seat counts (movies.conditional.seat_stamp)
+    seat_version = models.IntegerField(default=0)
+    # With seat_version, stamps the per-(cinema, day) schedule buckets
+    updated_at = models.DateTimeField(auto_now=True)
+    
     class Meta:
         ordering = ['start_time']
+        indexes = [
+            models.Index(fields=['start_time', 'id'], name='showtime_start_id_idx'),
+            # Per-screen and per-movie day ranges (schedule grid, movie showtimes, now showing)
+            models.Index(fields=['screen', 'start_time'], name='showtime_screen_start_idx'),
+            models.Index(fields=['movie', 'start_time'], name='showtime_movie_start_idx'),
+        ]
     
     def __str__(self):
         return f"{self.movie.title} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored start time so save() can spot a moved showtime
+        instance._loaded_start_time = instance.__dict__.get('start_time')
+        return instance
+    
     @property
     def available_seats(self):
-        from bookings.models import BookedSeat
-        booked = BookedSeat.objects.filter(
-            booking__showtime=self,
-            booking__status__in=['PENDING', 'CONFIRMED']
-        ).count()
-        return self.screen.total_seats - booked
+        return self.available_count
+    
+    @staticmethod
+    def end_time_for(start_time, duration):
+        """Screen is busy for the film plus 30 minutes of ads, trailers and cleaning"""
+        return start_time + timedelta(minutes=duration + 30)
+    
+    def adjust_seat_counts(self, booked_delta):
+        """Move booked_delta seats between available and booked in a single UPDATE"""
+        Showtime.move_seats(self.pk, booked_delta)
+    
+    @classmethod
+    def move_seats(cls, showtime_id, booked_delta):
+        """adjust_seat_counts() for a showtime that hasn't been loaded"""
+        if not booked_delta:
+            return
+        cls.objects.filter(pk=showtime_id).update(
+            booked_count=F('booked_count') + booked_delta,
+            available_count=F('available_count') - booked_delta,
+            seat_version=F('seat_version') + 1,
+        )
     
     def save(self, *args, **kwargs):
         if not self.end_time:
-            self.end_time = self.start_time + timedelta(minutes=self.movie.duration + 30)
-        super().save(*args, **kwargs)
\ No newline at end of file
+            self.end_time = self.end_time_for(self.start_time, self.movie.duration)
+        if self._state.adding:
+            self.available_count = self.screen.total_seats - self.booked_count
+        loaded_start = getattr(self, '_loaded_start_time', None)
+        super().save(*args, **kwargs)
+        
+        if loaded_start is not None and loaded_start != self.start_time:
+            # Bookings keep a copy of the start time for their history
+            from bookings.history import showtime_moved
+            showtime_moved(self)
+        self._loaded_start_time = self.start_time
+
+
+class NowShowing(models.Model):
+    """
+    Materialized "now showing" set: one row per movie with a showtime today or
+    later, holding that movie's next start time. Maintained by movies.now_showing.
+    """
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='now_showing')
+    next_start_time = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        ordering = ['next_start_time', 'movie_id']
+    
+    def __str__(self):
+        return f"{self.movie_id} - {self.next_start_time}"
+
+class TableVersion(models.Model):
+    """
+    Version stamp per catalogue table, bumped on every write. Conditional GET
+    support in movies.conditional builds ETag/Last-Modified from these rows.
+    """
+    table = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.table} v{self.version}"
+    
+    @classmethod
+    def bump(cls, *tables):
+        now = timezone.now()
+        for table in tables:
+            if not cls.objects.filter(table=table).update(version=F('version') + 1, updated_at=now):
+                cls.objects.bulk_create([cls(table=table, version=1, updated_at=now)], ignore_conflicts=True)
+
+class SeatEvent(models.Model):
+    """
+    Seats taken and released on a showtime. movies.seat_events.DatabaseBroker
+    writes one per change and every process streaming seat maps reads them,
+    so changes made by any worker reach every open map. Kept briefly.
+    """
+    showtime = models.ForeignKey(Showtime, on_delete=models.CASCADE, related_name='+')
+    taken = models.JSONField(default=list)
+    released = models.JSONField(default=list)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def as_event(self):
+        return {'type': 'seats', 'showtime': self.showtime_id, 'taken': self.taken, 'released': self.released}
+
+@receiver(post_save, sender=Screen)
+def invalidate_screen_layout(sender, instance, created, **kwargs):
+    if not created:
+        instance.bump_layout_version()
+
+@receiver(post_save, sender=Seat)
+@receiver(post_delete, sender=Seat)
+def invalidate_seat_layout(sender, instance, **kwargs):
+    Screen.objects.filter(pk=instance.screen_id).update(layout_version=new_layout_version())
+
+@receiver(post_save, sender=Movie)
+def index_movie_for_search(sender, instance, using, **kwargs):
+    from .search import index_movies
+    index_movies([instance], using=using)
+
+@receiver(post_save, sender=Movie)
+def render_movie_images(sender, instance, **kwargs):
+    from .renditions import needs_renditions, schedule_renditions
+    if needs_renditions(instance):
+        transaction.on_commit(lambda: schedule_renditions(instance))
+
+@receiver(post_delete, sender=Movie)
+def remove_movie_from_search(sender, instance, using, **kwargs):
+    from .search import remove_movies
+    remove_movies([instance.pk], using=using)
+
+@receiver(post_save, sender=Showtime)
+def update_now_showing_on_save(sender, instance, created, **kwargs):
+    from .now_showing import showtime_added, refresh_movies
+    if created:
+        showtime_added(instance)
+    else:
+        refresh_movies([instance.movie_id])
+
+@receiver(post_delete, sender=Showtime)
+def update_now_showing_on_delete(sender, instance, **kwargs):
+    from .now_showing import showtime_removed
+    showtime_removed(instance)
+
+@receiver(post_save, sender=Cinema)
+@receiver(post_delete, sender=Cinema)
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Screen)
+@receiver(post_delete, sender=Screen)
+@receiver(post_save, sender=Showtime)
+@receiver(post_delete, sender=Showtime)
+def bump_catalogue_version(sender, **kwargs):
+    TableVersion.bump(sender._meta.label_lower)
\ No newline at end of file
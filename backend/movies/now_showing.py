@@ -0,0 +1,111 @@
+"""
+Maintenance of the materialized NowShowing set.
+
+A movie is "now showing" when it has a showtime starting today (in the
+project timezone) or later. Rather than joining Movie and Showtime on every
+home page request, NowShowing keeps one row per such movie with its next
+start time:
+
+* adding a showtime can only move a movie's next start earlier, so it is
+  applied without re-reading the movie's showtimes;
+* editing or deleting a showtime recomputes just that movie;
+* at day rollover, rows whose next start fell before today are recomputed
+  in memory on read, without writing, until the refresh_now_showing command
+  (scheduled just after midnight) stores them.
+"""
+from datetime import datetime, time
+
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import NowShowing, Showtime
+
+
+def today_start():
+    return timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+
+
+def _next_starts(movie_ids, since):
+    return dict(
+        Showtime.objects.filter(movie_id__in=movie_ids, start_time__gte=since)
+        .values('movie_id')
+        .annotate(next_start=Min('start_time'))
+        .values_list('movie_id', 'next_start')
+    )
+
+
+def refresh_movies(movie_ids, since=None):
+    """Recompute the next start time of the given movies from their showtimes"""
+    movie_ids = set(movie_ids)
+    if not movie_ids:
+        return
+
+    next_starts = _next_starts(movie_ids, since or today_start())
+
+    NowShowing.objects.filter(movie_id__in=movie_ids - next_starts.keys()).delete()
+
+    existing = NowShowing.objects.in_bulk(list(next_starts.keys()))
+    changed = []
+    created = []
+    for movie_id, next_start in next_starts.items():
+        entry = existing.get(movie_id)
+        if entry is None:
+            created.append(NowShowing(movie_id=movie_id, next_start_time=next_start))
+        elif entry.next_start_time != next_start:
+            entry.next_start_time = next_start
+            changed.append(entry)
+
+    NowShowing.objects.bulk_create(created, ignore_conflicts=True)
+    NowShowing.objects.bulk_update(changed, ['next_start_time'])
+
+
+def showtime_added(showtime):
+    if showtime.start_time < today_start():
+        return
+
+    entry = NowShowing.objects.filter(movie_id=showtime.movie_id).first()
+    if entry is None:
+        NowShowing.objects.bulk_create(
+            [NowShowing(movie_id=showtime.movie_id, next_start_time=showtime.start_time)],
+            ignore_conflicts=True
+        )
+    elif showtime.start_time < entry.next_start_time:
+        entry.next_start_time = showtime.start_time
+        entry.save(update_fields=['next_start_time'])
+
+
+def showtime_removed(showtime):
+    # Only removing the movie's earliest upcoming showtime changes its entry
+    if NowShowing.objects.filter(movie_id=showtime.movie_id, next_start_time=showtime.start_time).exists():
+        refresh_movies([showtime.movie_id])
+
+
+def refresh_stale():
+    """Recompute rows left behind by the day rolling over"""
+    stale_ids = list(
+        NowShowing.objects.filter(next_start_time__lt=today_start()).values_list('movie_id', flat=True)
+    )
+    refresh_movies(stale_ids)
+
+
+def rebuild():
+    NowShowing.objects.all().delete()
+    refresh_movies(Showtime.objects.filter(start_time__gte=today_start()).values_list('movie_id', flat=True).distinct())
+
+
+def now_showing_entries():
+    """
+    (movie_id, next_start_time) pairs, soonest first.
+
+    Never writes: entries left stale by the day rollover are recomputed for
+    this response only and stored later by refresh_stale().
+    """
+    since = today_start()
+    entries = list(NowShowing.objects.values_list('movie_id', 'next_start_time'))
+    stale_ids = [movie_id for movie_id, next_start in entries if next_start < since]
+    if not stale_ids:
+        return entries
+
+    entries = [(movie_id, next_start) for movie_id, next_start in entries if next_start >= since]
+    entries.extend(_next_starts(stale_ids, since).items())
+    return sorted(entries, key=lambda entry: (entry[1], entry[0]))
@@ -0,0 +1,91 @@
+"""
+Demand-driven screen/slot assignment for the optimize_schedule command.
+
+estimate_demand() turns historical seats sold and seats offered, indexed by
+(movie, hour of day, screen type), into an occupancy rate per cell. Sparse
+cells are shrunk towards movie x hour x screen type marginals, so a film
+with little history still gets a sensible estimate.
+
+plan_day() then fills one cinema's screens for one day greedily: it scores
+every (movie, screen, start slot) at once as rate x capacity, skips the
+ones that would overlap a screen's existing programme, takes the best,
+marks the screen busy and repeats. Each extra showing of a film at the same
+cinema that day is discounted by repeat_decay, since the second and third
+shows split one audience rather than finding a new one.
+"""
+import numpy as np
+
+
+TICK_MINUTES = 5
+
+
+def estimate_demand(sold, offered, prior_weight=200.0, default_rate=0.3):
+    """
+    Expected occupancy in [0, 1] per (movie, hour, screen type).
+
+    sold and offered are arrays of the same shape; prior_weight is how
+    many offered seats a cell needs before its own history outweighs the
+    marginals.
+    """
+    sold = np.asarray(sold, dtype=float)
+    offered = np.asarray(offered, dtype=float)
+
+    # With no sales recorded there is no signal at all, not zero demand
+    global_rate = sold.sum() / offered.sum() if sold.sum() else default_rate
+
+    def marginal(axes):
+        rate = (sold.sum(axis=axes) + prior_weight * global_rate) / (offered.sum(axis=axes) + prior_weight)
+        return rate / global_rate
+
+    movie_factor = marginal((1, 2))[:, None, None]
+    hour_factor = marginal((0, 2))[None, :, None]
+    type_factor = marginal((0, 1))[None, None, :]
+    baseline = global_rate * movie_factor * hour_factor * type_factor
+
+    rate = (sold + prior_weight * baseline) / (offered + prior_weight)
+    return np.clip(rate, 0.0, 1.0)
+
+
+def minutes_to_ticks(minutes):
+    return -(-np.asarray(minutes) // TICK_MINUTES)
+
+
+def plan_day(expected, lengths, slots, busy, repeat_decay=0.7, min_expected=0.0):
+    """
+    Choose showtimes for one cinema and day.
+
+    expected -- [movies, screens, slots] expected seats sold per showing
+    lengths  -- [movies] screen time per showing, in ticks
+    slots    -- [slots] candidate start ticks
+    busy     -- [screens, ticks] bool, True where a screen is already taken;
+                updated in place
+
+    Returns (movie, screen, slot, expected seats) in the order chosen.
+    """
+    expected = np.asarray(expected, dtype=float)
+    lengths = np.asarray(lengths)
+    slots = np.asarray(slots)
+    horizon = busy.shape[1]
+
+    ends = slots[None, :] + lengths[:, None]                         # [movies, slots]
+    fits = ends <= horizon
+    ends = np.minimum(ends, horizon)
+    weight = np.ones(len(lengths))
+    chosen = []
+
+    while True:
+        # Busy ticks inside every candidate interval, via prefix sums per screen
+        taken = np.concatenate([np.zeros((busy.shape[0], 1), dtype=np.int32),
+                                np.cumsum(busy, axis=1, dtype=np.int32)], axis=1)
+        overlap = taken[:, ends] - taken[:, slots][:, None, :]        # [screens, movies, slots]
+        feasible = (overlap.transpose(1, 0, 2) == 0) & fits[:, None, :]
+
+        score = np.where(feasible, expected * weight[:, None, None], -np.inf)
+        best = np.unravel_index(np.argmax(score), score.shape)
+        if not np.isfinite(score[best]) or score[best] <= min_expected:
+            return chosen
+
+        movie, screen, slot = (int(index) for index in best)
+        busy[screen, slots[slot]:ends[movie, slot]] = True
+        weight[movie] *= repeat_decay
+        chosen.append((movie, screen, slot, float(score[best])))
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ShowtimeCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (start_time, id) for the showtime listing.
+    
+    Unlike the default PageNumberPagination there is no COUNT(*) and no
+    OFFSET scan, so every page costs the same however deep the client goes.
+    Backed by the showtime_start_id_idx index.
+    """
+    ordering = ('start_time', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,180 @@
+"""
+Responsive renditions of movie posters and banners.
+
+TMDB originals are several megabytes each, so every poster/banner also gets
+a handful of smaller widths in WebP and JPEG, stored in the original's
+directory under content-hash names like the original itself
+(movie_posters/<sha256>.webp, see movies.storage). Movie.image_renditions
+records what was generated, keyed by image field, so serializers never have
+to stat files:
+
+    {"poster_image": {"source": "movie_posters/<sha256>.jpg",
+                      "webp": {"185": "movie_posters/<sha256>.webp", ...},
+                      "jpeg": {"185": "movie_posters/<sha256>.jpg", ...}}}
+
+A source that can't be rendered is recorded as {"source": ..., "failed": true}
+and served as the original only, until it changes or generate_renditions
+--force retries it.
+
+Renditions are produced by the TMDB image download stage (movies.tmdb_images),
+by the generate_renditions command, or in a background thread after a save
+that changes a movie's images. Serializers only read image_renditions and
+serve the original until the renditions exist.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image
+
+from .models import Movie, TableVersion
+
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = {
+    'poster_image': [185, 342, 500, 780],
+    'banner_image': [300, 780, 1280],
+}
+
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 3}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _is_remote(name):
+    return name.startswith('http://') or name.startswith('https://')
+
+
+def _generate_field(movie, field_name):
+    source_name = getattr(movie, field_name).name
+
+    with default_storage.open(source_name, 'rb') as source:
+        image = Image.open(source)
+        # Let the JPEG decoder scale down while decoding; nothing we emit is wider than this
+        largest = max(RENDITION_WIDTHS[field_name])
+        image.draft('RGB', (largest, largest * image.height // max(image.width, 1)))
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    # Never upscale; an image narrower than every width gets a single rendition at its own size
+    widths = [width for width in RENDITION_WIDTHS[field_name] if width < image.width] or [image.width]
+
+    entry = {'source': source_name}
+    for extension in RENDITION_FORMATS:
+        entry[extension] = {}
+
+    for width in widths:
+        resized = image.copy()
+        resized.thumbnail((width, width * 10), Image.LANCZOS, reducing_gap=3.0)
+
+        for extension, (image_format, options) in RENDITION_FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+
+            # Content-addressed: only the directory and extension of the name are kept,
+            # and saving identical bytes again resolves to the existing file
+            name = f'{os.path.splitext(source_name)[0]}.{extension}'
+            entry[extension][str(width)] = default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    return entry
+
+
+def needs_renditions(movie):
+    """True when a local image on movie has no renditions for its current file"""
+    renditions = movie.image_renditions or {}
+    for field_name in RENDITION_WIDTHS:
+        image_field = getattr(movie, field_name)
+        if image_field and not _is_remote(image_field.name):
+            if (renditions.get(field_name) or {}).get('source') != image_field.name:
+                return True
+    return False
+
+
+def generate_renditions(movie, force=False):
+    """
+    Make sure every image on movie has up to date renditions.
+
+    Returns True when movie.image_renditions changed (and was written back).
+    """
+    renditions = dict(movie.image_renditions or {})
+    changed = False
+
+    for field_name in RENDITION_WIDTHS:
+        image_field = getattr(movie, field_name)
+        if not image_field or _is_remote(image_field.name):
+            if renditions.pop(field_name, None) is not None:
+                changed = True
+            continue
+
+        current = renditions.get(field_name)
+        if not force and current and current.get('source') == image_field.name:
+            continue
+
+        try:
+            renditions[field_name] = _generate_field(movie, field_name)
+        except (OSError, ValueError) as e:
+            logger.warning('Could not render %s for movie %s: %s', field_name, movie.pk, e)
+            # Recorded so later saves of the movie don't retry until the image changes
+            renditions[field_name] = {'source': image_field.name, 'failed': True}
+        changed = True
+
+    if changed:
+        movie.image_renditions = renditions
+        Movie.objects.filter(pk=movie.pk).update(image_renditions=renditions)
+        TableVersion.bump('movies.movie')
+    return changed
+
+
+# Renditions for saved movies are rendered off the request thread,
+# one movie at a time per process
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='renditions')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _render_in_background(movie_id):
+    try:
+        movie = Movie.objects.filter(pk=movie_id).first()
+        if movie is not None:
+            generate_renditions(movie)
+    except Exception:
+        logger.exception('Background rendition of movie %s failed', movie_id)
+    finally:
+        with _pending_lock:
+            _pending.discard(movie_id)
+        close_old_connections()
+
+
+def schedule_renditions(movie):
+    with _pending_lock:
+        if movie.pk in _pending:
+            return
+        _pending.add(movie.pk)
+    _executor.submit(_render_in_background, movie.pk)
+
+
+def srcset_map(movie, field_name, build_url):
+    """{'webp': 'url 185w, url 342w', 'jpeg': ...} for one image field, or None"""
+    entry = (movie.image_renditions or {}).get(field_name)
+    image_field = getattr(movie, field_name)
+
+    # Not rendered yet (or stale): serve the original until the save's background render lands
+    if not entry or entry.get('failed') or not image_field or entry.get('source') != image_field.name:
+        return None
+
+    return {
+        extension: ', '.join(
+            f'{build_url(default_storage.url(name))} {width}w'
+            for width, name in sorted(entry[extension].items(), key=lambda item: int(item[0]))
+        )
+        for extension in RENDITION_FORMATS
+        if entry.get(extension)
+    }
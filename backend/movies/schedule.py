@@ -0,0 +1,132 @@
+"""
+Per-cinema daily programme: every showtime at one cinema on one day,
+grouped by movie and then by screen, with occupancy.
+
+The grid is read with a single range query on start_time (never
+start_time__date, which wraps the column in a function and can't use an
+index) and cached per (cinema, day) bucket. The cache key carries a bucket
+version read from the database: the TableVersion rows of the cinema, movie
+and screen tables, and the count, latest updated_at and summed seat_version
+of the showtimes in the bucket. Any worker sees a renamed movie or screen,
+or a showtime saved, deleted or moved in or out of the bucket, or a seat
+taken or released on its next request, whatever cache backend is in use, so
+a stale grid is never read back. A showtime change only invalidates its own
+bucket (or the two it moved between).
+"""
+import hashlib
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import Showtime, TableVersion
+
+
+# Tables whose rows appear in the grid, besides the showtimes stamped per bucket
+SCHEDULE_TABLES = ['movies.cinema', 'movies.movie', 'movies.screen']
+
+
+def day_bounds(day):
+    """[start, end) of a local calendar day as aware datetimes"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def showtimes_stamp(cinema_id, day):
+    """
+    Stamp of the showtimes in the (cinema, day) bucket. seat_version only
+    grows, so its sum changes whenever a seat is taken or released
+    """
+    start, end = day_bounds(day)
+    stamp = Showtime.objects.filter(
+        screen__cinema_id=cinema_id, start_time__gte=start, start_time__lt=end
+    ).aggregate(count=Count('id'), changed=Max('updated_at'), seats=Sum('seat_version'))
+    changed = stamp['changed'].isoformat() if stamp['changed'] else ''
+    return f"{stamp['count']}:{changed}:{stamp['seats'] or 0}"
+
+
+def bucket_version(cinema_id, day, showtimes=None):
+    """
+    Stamp of everything the (cinema, day) grid is built from. Pass
+    showtimes_stamp() as showtimes when it has already been read
+    """
+    if showtimes is None:
+        showtimes = showtimes_stamp(cinema_id, day)
+    tables = TableVersion.objects.filter(table__in=SCHEDULE_TABLES).order_by('table').values_list('table', 'version')
+    stamp = f"{';'.join(f'{table}={version}' for table, version in tables)}|{showtimes}"
+    return hashlib.md5(stamp.encode()).hexdigest()
+
+
+def build_schedule(cinema, day):
+    start, end = day_bounds(day)
+    showtimes = (
+        Showtime.objects
+        .filter(screen__cinema_id=cinema.id, start_time__gte=start, start_time__lt=end)
+        .select_related('movie', 'screen')
+        .only(
+            'id', 'start_time', 'end_time', 'base_price', 'is_3d', 'booked_count', 'available_count',
+            'movie__id', 'movie__title', 'movie__duration', 'movie__rating', 'movie__genre',
+            'screen__id', 'screen__name', 'screen__screen_type', 'screen__total_seats',
+        )
+        .order_by('start_time', 'id')
+    )
+
+    # Movies and screens keep the order of their first showtime of the day
+    movies = {}
+    for showtime in showtimes:
+        movie, screen = showtime.movie, showtime.screen
+
+        movie_entry = movies.get(movie.id)
+        if movie_entry is None:
+            movie_entry = movies[movie.id] = {
+                'id': movie.id,
+                'title': movie.title,
+                'duration': movie.duration,
+                'rating': movie.rating,
+                'genre': movie.genre,
+                'screens': {},
+            }
+
+        screen_entry = movie_entry['screens'].get(screen.id)
+        if screen_entry is None:
+            screen_entry = movie_entry['screens'][screen.id] = {
+                'id': screen.id,
+                'name': screen.name,
+                'screen_type': screen.screen_type,
+                'total_seats': screen.total_seats,
+                'showtimes': [],
+            }
+
+        total = showtime.booked_count + showtime.available_count
+        screen_entry['showtimes'].append({
+            'id': showtime.id,
+            'start_time': showtime.start_time,
+            'end_time': showtime.end_time,
+            'base_price': str(showtime.base_price),
+            'is_3d': showtime.is_3d,
+            'booked_seats': showtime.booked_count,
+            'available_seats': showtime.available_count,
+            'occupancy': round(showtime.booked_count / total, 3) if total else 0.0,
+        })
+
+    for movie_entry in movies.values():
+        movie_entry['screens'] = list(movie_entry['screens'].values())
+
+    return {
+        'cinema': {'id': cinema.id, 'name': cinema.name, 'location': cinema.location},
+        'date': day.isoformat(),
+        'movies': list(movies.values()),
+    }
+
+
+def get_schedule(cinema, day, showtimes=None):
+    """The cached grid; showtimes as for bucket_version()"""
+    key = f'schedule:{cinema.id}:{day.isoformat()}:{bucket_version(cinema.id, day, showtimes)}'
+    schedule = cache.get(key)
+    if schedule is None:
+        schedule = build_schedule(cinema, day)
+        cache.set(key, schedule, getattr(settings, 'SCHEDULE_CACHE_TIMEOUT', 300))
+    return schedule
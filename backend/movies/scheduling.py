@@ -0,0 +1,134 @@
+"""
+Bulk showtime planning with per-screen overlap detection.
+
+SchedulePlanner loads the existing showtimes of a window once, keeps a
+sorted interval index per screen and accepts or rejects new showtimes in
+memory. A showtime occupies its screen from start_time to end_time (the
+film plus 30 minutes, see Showtime.end_time_for), so a 21:00 film that ends
+at 23:20 blocks a 22:00 one. Accepted showtimes are written with
+bulk_create, which bypasses Showtime.save() and the post_save receivers, so
+save() fills in end_time/available_count itself and does the invalidation
+those receivers would have done.
+"""
+import bisect
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Showtime, TableVersion
+
+
+BASE_PRICES = {
+    'STANDARD': Decimal('10.50'),
+    'MAXX': Decimal('13.50'),
+    'DLUXX': Decimal('15.00'),
+    'RECLINE': Decimal('12.50'),
+    'LUX': Decimal('18.00'),
+}
+
+
+def showtime_price(screen, start_time, is_3d):
+    """Ticket base price: screen type, plus 3D and weekend surcharges"""
+    price = BASE_PRICES.get(screen.screen_type, BASE_PRICES['STANDARD'])
+    if is_3d:
+        price += Decimal('2.00')
+    if start_time.weekday() >= 5:  # Saturday or Sunday
+        price += Decimal('2.50')
+    return price
+
+
+class ScreenTimeline:
+    """Sorted, non-overlapping [start, end) intervals on one screen"""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def overlaps(self, start, end):
+        # Only the last interval starting before end can reach past start:
+        # intervals don't overlap, so ends are sorted like starts
+        index = bisect.bisect_left(self.starts, end)
+        return index > 0 and self.ends[index - 1] > start
+
+    def add(self, start, end):
+        if self.overlaps(start, end):
+            return False
+        index = bisect.bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        return True
+
+
+class SchedulePlanner:
+    """
+    Plan showtimes starting between window_start and window_end on screens:
+
+        planner = SchedulePlanner(screens, week_start, week_start + timedelta(days=7))
+        planner.add(movie, screen, start_time, base_price)
+        planner.save()
+    """
+
+    def __init__(self, screens, window_start, window_end):
+        self.screens = {screen.id: screen for screen in screens}
+        self.timelines = {screen_id: ScreenTimeline() for screen_id in self.screens}
+        self.pending = []
+        self.rejected = 0
+
+        # Existing showtimes come in start order, so timelines are built by
+        # appending. Rows that already overlap (from before the planner) are
+        # merged into one busy interval to keep the timeline sorted.
+        existing = (
+            Showtime.objects
+            .filter(screen_id__in=list(self.screens),
+                    # No film runs for a day, so this bounds the index range scan
+                    start_time__gte=window_start - timedelta(days=1),
+                    start_time__lt=window_end, end_time__gt=window_start)
+            .order_by('start_time')
+            .values_list('screen_id', 'start_time', 'end_time')
+        )
+        for screen_id, start, end in existing:
+            timeline = self.timelines[screen_id]
+            if timeline.ends and start < timeline.ends[-1]:
+                timeline.ends[-1] = max(timeline.ends[-1], end)
+            else:
+                timeline.starts.append(start)
+                timeline.ends.append(end)
+
+    def is_free(self, screen, start_time, duration):
+        return not self.timelines[screen.id].overlaps(start_time, Showtime.end_time_for(start_time, duration))
+
+    def add(self, movie, screen, start_time, base_price, is_3d=False):
+        """Queue a showtime; returns it, or None when it would overlap another on the screen"""
+        end_time = Showtime.end_time_for(start_time, movie.duration)
+        if not self.timelines[screen.id].add(start_time, end_time):
+            self.rejected += 1
+            return None
+
+        showtime = Showtime(
+            movie=movie,
+            screen=screen,
+            start_time=start_time,
+            end_time=end_time,
+            base_price=base_price,
+            is_3d=is_3d,
+            available_count=screen.total_seats,
+        )
+        self.pending.append(showtime)
+        return showtime
+
+    def save(self, batch_size=1000):
+        """Write the queued showtimes and refresh what depends on them"""
+        from .now_showing import refresh_movies
+
+        showtimes, self.pending = self.pending, []
+        if not showtimes:
+            return []
+
+        with transaction.atomic():
+            showtimes = Showtime.objects.bulk_create(showtimes, batch_size=batch_size)
+            TableVersion.bump('movies.showtime')
+
+        refresh_movies({showtime.movie_id for showtime in showtimes})
+        return showtimes
+
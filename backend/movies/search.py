@@ -0,0 +1,134 @@
+"""
+Relevance-ranked full-text search for the movie catalogue.
+
+SQLite keeps an FTS5 table (movies_movie_fts) beside movies_movie that is
+updated from the Movie save/delete signals. PostgreSQL uses a GIN index over
+a weighted tsvector expression, so the database maintains it on its own.
+Both are created by migration 0007_movie_search_index. Any other database
+falls back to DRF's icontains search.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from .models import Movie
+
+
+FTS_TABLE = 'movies_movie_fts'
+PG_INDEX = 'movies_movie_search_idx'
+
+# Column weights for ranking: a title hit beats a director hit beats a cast hit...
+FIELD_WEIGHTS = [('title', 10.0), ('director', 3.0), ('cast', 2.0), ('genre', 1.0)]
+
+PG_VECTOR = ' || '.join(
+    f"setweight(to_tsvector('simple', coalesce(\"{field}\", '')), '{letter}')"
+    for (field, _weight), letter in zip(FIELD_WEIGHTS, 'ABCD')
+)
+
+
+def search_terms(text):
+    """Split user input into lowercase word tokens safe to embed in FTS syntax"""
+    return re.findall(r'\w+', text.lower())
+
+
+def _sqlite_query(terms):
+    # Every term must match, and each one matches as a prefix ("wick" finds "Wicked")
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _pg_query(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def ranked_search(queryset, terms):
+    """
+    Filter queryset to movies matching all terms and annotate search_rank
+    (lower is better), or return None if the database has no index.
+
+    Both parts are subqueries of the one SELECT, so pagination applies its
+    LIMIT/OFFSET to the full ranked result rather than to a capped id list.
+    """
+    vendor = connections[queryset.db].vendor
+    movie_id = f'"{Movie._meta.db_table}"."id"'
+
+    if vendor == 'sqlite':
+        query = _sqlite_query(terms)
+        weights = ', '.join(str(weight) for _field, weight in FIELD_WEIGHTS)
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [query])
+        rank = RawSQL(
+            f'SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {movie_id}',
+            [query], output_field=FloatField()
+        )
+    elif vendor == 'postgresql':
+        query = _pg_query(terms)
+        matches = RawSQL(f"SELECT id FROM movies_movie WHERE ({PG_VECTOR}) @@ to_tsquery('simple', %s)", [query])
+        rank = RawSQL(
+            f"SELECT -ts_rank({PG_VECTOR}, to_tsquery('simple', %s)) FROM movies_movie inner_movie "
+            f"WHERE inner_movie.id = {movie_id}",
+            [query], output_field=FloatField()
+        )
+    else:
+        return None
+
+    return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+def index_movies(movies, using='default'):
+    """Write movies into the SQLite FTS table (PostgreSQL indexes itself)"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    rows = [
+        (movie.pk, movie.title, movie.director, movie.cast, movie.genre)
+        for movie in movies
+    ]
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, director, "cast", genre) VALUES (%s, %s, %s, %s, %s)',
+            rows
+        )
+
+
+def remove_movies(movie_ids, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not movie_ids:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(movie_id,) for movie_id in movie_ids])
+
+
+def rebuild_index(using='default'):
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        index_movies(Movie.objects.using(using).only('id', 'title', 'director', 'cast', 'genre').iterator(), using)
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {PG_INDEX}')
+
+
+class MovieSearchFilter(filters.SearchFilter):
+    """SearchFilter that answers ?search= from the full-text index, ranked by relevance"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = search_terms(' '.join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+
+        ranked = ranked_search(queryset, terms)
+        if ranked is None:
+            return super().filter_queryset(request, queryset, view)
+
+        # An explicit ?ordering= from OrderingFilter still takes precedence
+        return ranked.order_by('search_rank', 'pk')
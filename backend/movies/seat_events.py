@@ -0,0 +1,177 @@
+"""
+Live seat map updates.
+
+Bookings publish seat deltas per showtime once their transaction commits:
+
+    {"type": "seats", "showtime": 12, "taken": [301, 302], "released": []}
+
+and the seat_events view (served by the ASGI application) streams them to
+open seat maps as server-sent events, after a snapshot of the current map.
+A client that falls too far behind gets {"type": "reset"} and should fetch
+the snapshot again.
+
+The broker is loaded from settings.SEAT_EVENTS_BROKER. Bookings are made by
+the WSGI workers and streamed by the ASGI application, so the default
+DatabaseBroker hands events over through the SeatEvent table: publishing
+writes a row, and each process with open streams polls for new rows every
+SEAT_EVENTS_POLL_SECONDS and fans them out to its subscribers.
+InProcessBroker skips the table and only reaches subscribers in the
+publishing process (a single ASGI process, or tests). Another shared
+pub/sub fits in by implementing the same three methods.
+
+Rows are read in id order. A row committed behind one already read (ids
+handed out concurrently on PostgreSQL) is missed until the stream ends and
+the client reconnects to a fresh snapshot.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import SeatEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, channel, loop, maxsize):
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, event):
+        """Thread safe; called by the broker from whichever thread published"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The subscriber's event loop has gone away
+            pass
+
+    def _put(self, event):
+        if self.queue.full():
+            # Dropping deltas would leave the map wrong, so start the client over
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = {'type': 'reset', 'showtime': self.channel}
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    async def subscribe(self, channel):
+        """Must be awaited in the event loop that will read the subscription"""
+        subscription = Subscription(channel, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel, event):
+        self.fan_out(channel, event)
+
+    def fan_out(self, channel, event):
+        """Deliver event to this process's subscribers of channel"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def channels(self):
+        with self._lock:
+            return list(self._subscriptions)
+
+
+class DatabaseBroker(InProcessBroker):
+    def __init__(self, queue_size=256):
+        super().__init__(queue_size)
+        self.poll_seconds = settings.SEAT_EVENTS_POLL_SECONDS
+        self.retention = timedelta(seconds=settings.SEAT_EVENTS_RETENTION_SECONDS)
+        self._poller = None
+        self._started = None
+        self._pruned_at = None
+
+    async def subscribe(self, channel):
+        if self._poller is None or self._poller.done():
+            self._started = asyncio.get_running_loop().create_future()
+            self._poller = asyncio.create_task(self._poll())
+        subscription = await super().subscribe(channel)
+        try:
+            # Events from the poller's starting point on; earlier ones are in the client's snapshot
+            await asyncio.shield(self._started)
+        except Exception:
+            self.unsubscribe(subscription)
+            raise
+        return subscription
+
+    def publish(self, channel, event):
+        SeatEvent.objects.create(showtime_id=channel, taken=event['taken'], released=event['released'])
+        # Clear out old rows now and then; readers only ever need the last few seconds
+        now = time.monotonic()
+        if self._pruned_at is None or now - self._pruned_at > self.retention.total_seconds():
+            self._pruned_at = now
+            SeatEvent.objects.filter(created_at__lt=timezone.now() - self.retention).delete()
+
+    async def _poll(self):
+        try:
+            last_id = await sync_to_async(latest_event_id)()
+        except Exception as e:
+            self._started.set_exception(e)
+            raise
+        self._started.set_result(None)
+
+        # Runs while this process has subscribers; the next subscribe starts it again
+        while channels := self.channels():
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                rows = await sync_to_async(events_since)(last_id, channels)
+            except Exception:
+                logger.exception('Could not read seat events')
+                continue
+            for row in rows:
+                last_id = row.pk
+                self.fan_out(row.showtime_id, row.as_event())
+
+
+def latest_event_id():
+    return SeatEvent.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def events_since(last_id, channels):
+    return list(SeatEvent.objects.filter(pk__gt=last_id, showtime_id__in=channels).order_by('pk'))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'SEAT_EVENTS_BROKER', 'movies.seat_events.DatabaseBroker'))()
+
+
+def publish_seat_changes(showtime_id, taken=(), released=()):
+    """Announce seats taken/released on showtime_id once the current transaction commits"""
+    taken, released = list(taken), list(released)
+    if not taken and not released:
+        return
+    event = {'type': 'seats', 'showtime': showtime_id, 'taken': taken, 'released': released}
+    # Robust: a lost event must not fail the booking that has already committed
+    transaction.on_commit(lambda: get_broker().publish(showtime_id, event), robust=True)
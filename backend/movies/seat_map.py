@@ -0,0 +1,40 @@
+import base64
+
+
+def encode_taken_bitset(seat_ids, taken_ids):
+    """
+    Pack seat availability into a base64 bitset.
+
+    Bit i (byte i // 8, mask 1 << (i % 8)) is set when seat_ids[i] is taken,
+    so clients can decode it against the layout-ordered seat_ids list.
+    """
+    taken_ids = set(taken_ids)
+    bits = bytearray((len(seat_ids) + 7) // 8)
+
+    for index, seat_id in enumerate(seat_ids):
+        if seat_id in taken_ids:
+            bits[index >> 3] |= 1 << (index & 7)
+
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+def seat_map_etag(showtime):
+    return f'"seatmap-{showtime.pk}-{showtime.screen.layout_version}-{showtime.seat_version}"'
+
+
+def seat_map_payload(showtime):
+    """seat_map response body: layout-ordered seat ids and the taken bitset"""
+    from bookings.models import SeatInventory
+    from .layout_cache import get_seat_layout
+
+    seat_ids = get_seat_layout(showtime.screen).seat_ids
+    booked_seat_ids = SeatInventory.objects.filter(
+        showtime=showtime
+    ).values_list('seat_id', flat=True)
+
+    return {
+        'showtime': showtime.id,
+        'version': showtime.seat_version,
+        'seat_ids': seat_ids,
+        'taken': encode_taken_bitset(seat_ids, booked_seat_ids),
+    }
@@ -1,20 +1,29 @@
 from rest_framework import serializers
 from .models import Cinema, Movie, Screen, Seat, Showtime
+from .renditions import srcset_map
+from .sparse_fields import SparseFieldsMixin
 
 
-class CinemaSerializer(serializers.ModelSerializer):
+class CinemaSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Cinema
         fields = '__all__'
 
 
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     poster_image = serializers.SerializerMethodField()
     banner_image = serializers.SerializerMethodField()
+    poster_srcset = serializers.SerializerMethodField()
+    banner_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Movie
-        fields = '__all__'
+        exclude = ['image_renditions', 'tmdb_synced_at', 'tmdb_content_hash',
+                   'tmdb_poster_path', 'tmdb_backdrop_path', 'tmdb_image_sources']
+        method_field_sources = {
+            'poster_srcset': ['poster_image', 'image_renditions'],
+            'banner_srcset': ['banner_image', 'image_renditions'],
+        }
     
     def get_poster_image(self, obj):
         if not obj.poster_image:
@@ -49,6 +58,16 @@ class MovieSerializer(serializers.ModelSerializer):
         if request:
             return request.build_absolute_uri(obj.banner_image.url)
         return None
+    
+    def get_poster_srcset(self, obj):
+        return srcset_map(obj, 'poster_image', self._build_url)
+    
+    def get_banner_srcset(self, obj):
+        return srcset_map(obj, 'banner_image', self._build_url)
+    
+    def _build_url(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
 
 class ScreenSerializer(serializers.ModelSerializer):
@@ -63,22 +82,24 @@ class SeatSerializer(serializers.ModelSerializer):
         model = Seat
         fields = '__all__'
 
-class ShowtimeSerializer(serializers.ModelSerializer):
+class ShowtimeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     movie = MovieSerializer(read_only=True)
     screen = ScreenSerializer(read_only=True)
-    available_seats = serializers.IntegerField(read_only=True)
+    available_seats = serializers.IntegerField(source='available_count', read_only=True)
     
     class Meta:
         model = Showtime
-        fields = '__all__'
+        # Not '__all__': booked_count, available_count and seat_version are internal
+        fields = ['id', 'movie', 'screen', 'start_time', 'end_time', 'base_price', 'is_3d', 'available_seats']
+        expandable = ['movie', 'screen']
 
-class ShowtimeListSerializer(serializers.ModelSerializer):
+class ShowtimeListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Lightweight serializer for listing showtimes"""
     cinema_name = serializers.CharField(source='screen.cinema.name', read_only=True)
     cinema_location = serializers.CharField(source='screen.cinema.location', read_only=True)
     screen_name = serializers.CharField(source='screen.name', read_only=True)
     movie_title = serializers.CharField(source='movie.title', read_only=True)
-    available_seats = serializers.IntegerField(read_only=True)
+    available_seats = serializers.IntegerField(source='available_count', read_only=True)
     
     class Meta:
         model = Showtime
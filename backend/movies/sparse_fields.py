@@ -0,0 +1,136 @@
+"""
+Sparse fieldsets (?fields=, ?expand=) and the querysets that match them.
+
+    /api/movies/showtimes/?fields=id,start_time,movie&expand=movie
+
+?fields= keeps only the listed top-level fields. ?expand= names the
+relations to render as nested objects; the serializer's other expandable
+relations collapse to their primary key. Without ?expand= every
+expandable relation stays nested, as before.
+
+plan_queryset() walks the pruned serializer and applies the select_related()
+and only() that fetch exactly the columns it will read, so the N+1 queries
+on nested relations disappear and unrequested columns are never loaded.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def _param_set(request, name):
+    if request is None or name not in request.query_params:
+        return None
+    return {value.strip() for value in request.query_params[name].split(',') if value.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin. List nested relations that may collapse to a primary
+    key in Meta.expandable, and the model fields a SerializerMethodField
+    reads in Meta.method_field_sources (used for query planning).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Only the top-level serializer reacts to the query string
+        request = self.context.get('request')
+        fields = _param_set(request, 'fields')
+        expand = _param_set(request, 'expand')
+
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+        if expand is not None:
+            for name in getattr(self.Meta, 'expandable', ()):
+                if name in self.fields and name not in expand:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+
+def _concrete_field(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.concrete else None
+
+
+def _collect(serializer, model, prefix, select, only):
+    """Fill select/only for serializer; returns False when only() can't be planned safely"""
+    method_sources = getattr(getattr(serializer, 'Meta', None), 'method_field_sources', {})
+    plannable = True
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.SerializerMethodField):
+            sources = method_sources.get(name, [name] if _concrete_field(model, name) else None)
+            if sources is None:
+                plannable = False
+                continue
+            only.update(prefix + source for source in sources)
+            continue
+
+        if isinstance(field, serializers.ListSerializer) or field.source == '*':
+            plannable = False
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            relation = _concrete_field(model, field.source)
+            if relation is None or not relation.is_relation:
+                plannable = False
+                continue
+            path = prefix + field.source
+            select.add(path)
+            only.add(path)
+            plannable &= _collect(field, relation.related_model, path + '__', select, only)
+            continue
+
+        # Plain or dotted source, e.g. 'start_time' or 'screen.cinema.name'
+        current_model = model
+        path = prefix
+        parts = field.source.split('.')
+        for index, part in enumerate(parts):
+            model_field = _concrete_field(current_model, part)
+            if model_field is None:
+                plannable = False
+                break
+            if index == len(parts) - 1:
+                only.add(path + part)
+            elif model_field.is_relation:
+                only.add(path + part)
+                select.add(path + part)
+                current_model = model_field.related_model
+                path = path + part + '__'
+            else:
+                plannable = False
+                break
+
+    return plannable
+
+
+def plan_queryset(queryset, serializer):
+    """Apply select_related()/only() matching what serializer will read"""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+
+    select, only = set(), set()
+    plannable = _collect(serializer, queryset.model, '', select, only)
+
+    if select:
+        queryset = queryset.select_related(*sorted(select))
+    if plannable and only:
+        queryset = queryset.only(*sorted(only))
+    return queryset
+
+
+class SparseFieldsViewSetMixin:
+    """Viewset mixin that plans the queryset for the (possibly pruned) serializer"""
+    sparse_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.sparse_actions:
+            queryset = plan_queryset(queryset, self.get_serializer())
+        return queryset
@@ -1,3 +1,1148 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time as time_module
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
 
+from . import layout_cache
+from .layout_cache import get_seat_layout
+from .models import Cinema, Movie, NowShowing, Screen, Seat, SeatEvent, Showtime, TableVersion
+from .now_showing import now_showing_entries, rebuild as rebuild_now_showing, today_start
+from .optimizer import estimate_demand, plan_day
+from .renditions import generate_renditions, srcset_map
+from .schedule import day_bounds
+from .scheduling import SchedulePlanner, ScreenTimeline
+from .seat_events import DatabaseBroker, InProcessBroker, get_broker
+from .tmdb_cache import ResponseCache
+from .tmdb_images import download_images, pending_movies
+from .tmdb_service import TMDBService, TokenBucket
+
+
+# Tables that grow with traffic; reading any of them without an index is a regression
+LARGE_TABLES = {'movies_showtime', 'movies_seat', 'bookings_booking', 'bookings_bookedseat', 'bookings_seatinventory'}
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan, sql):
+    """Large tables the plan reads from start to end"""
+    if connection.vendor == 'postgresql':
+        pattern = re.compile(r'Seq Scan on (\w+)')
+    elif ' LIMIT ' in sql:
+        # Walking an index in ORDER BY order until the LIMIT is how paginated lists should read
+        pattern = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+    else:
+        # SQLite's SCAN visits every row even when it goes through an index; only SEARCH narrows
+        pattern = re.compile(r'^SCAN (\w+)')
+    return [match.group(1) for line in plan for match in [pattern.search(line.strip())]
+            if match and match.group(1) in LARGE_TABLES]
+
+
+def constraint_index(table, name):
+    """The index backing a UniqueConstraint; SQLite names it after the table"""
+    return f'sqlite_autoindex_{table}_' if connection.vendor == 'sqlite' else name
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Seeds a catalogue and booking history large enough for the planner to
+    prefer indexes, then EXPLAINs every SELECT an endpoint issues.
+    """
+    DAYS = 30
+    SHOWTIMES_PER_DAY = 5
+    BOOKINGS = 4000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(12)
+
+        cinemas = Cinema.objects.bulk_create([
+            Cinema(name='OmniWatch', location=f'Location {i}', address=f'{i} Main Street', phone='01-0000000')
+            for i in range(3)
+        ])
+        movies = Movie.objects.bulk_create([
+            Movie(title=f'Movie {i}', description='', duration=90 + i, rating='12A', genre='Drama',
+                  release_date=datetime(2025, 1, 1).date(), director='Director', cast='Cast')
+            for i in range(40)
+        ])
+        screens = Screen.objects.bulk_create([
+            Screen(cinema=cinema, name=f'Screen {i + 1}', screen_type='STANDARD',
+                   total_seats=150, rows=10, seats_per_row=15)
+            for cinema in cinemas for i in range(6)
+        ])
+        Seat.objects.bulk_create([
+            Seat(screen=screen, row=chr(ord('A') + row), number=number + 1, seat_type='STANDARD')
+            for screen in screens for row in range(10) for number in range(15)
+        ])
+
+        first_day = timezone.localdate() - timedelta(days=cls.DAYS // 2)
+        showtimes = []
+        for day_offset in range(cls.DAYS):
+            day_start = timezone.make_aware(datetime.combine(first_day + timedelta(days=day_offset), time(11)))
+            for screen in screens:
+                for slot in range(cls.SHOWTIMES_PER_DAY):
+                    movie = rng.choice(movies)
+                    start = day_start + timedelta(hours=3 * slot)
+                    showtimes.append(Showtime(
+                        movie=movie, screen=screen, start_time=start,
+                        end_time=start + timedelta(minutes=movie.duration + 30),
+                        base_price=Decimal('10.00'), available_count=screen.total_seats,
+                    ))
+        showtimes = Showtime.objects.bulk_create(showtimes)
+
+        from bookings.models import Booking, BookedSeat, SeatInventory
+
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(50)])
+        seats_by_screen = {}
+        for seat in Seat.objects.all():
+            seats_by_screen.setdefault(seat.screen_id, []).append(seat)
+
+        bookings = Booking.objects.bulk_create([
+            Booking(user=rng.choice(users), showtime=showtime, starts_at=showtime.start_time,
+                    booking_reference=f'REF{i:08d}', total_amount=Decimal('20.00'),
+                    status=rng.choice(['PENDING', 'CONFIRMED', 'CANCELLED']))
+            for i, showtime in enumerate(rng.choice(showtimes) for _ in range(cls.BOOKINGS))
+        ])
+        booked_seats = BookedSeat.objects.bulk_create([
+            BookedSeat(booking=booking, seat=seat, price=Decimal('10.00'))
+            for booking in bookings
+            for seat in rng.sample(seats_by_screen[booking.showtime.screen_id], 2)
+        ])
+        held = {}
+        for booked_seat in booked_seats:
+            if booked_seat.booking.status in Booking.ACTIVE_STATUSES:
+                held.setdefault((booked_seat.booking.showtime_id, booked_seat.seat_id), booked_seat.booking)
+        SeatInventory.objects.bulk_create([
+            SeatInventory(showtime_id=showtime_id, seat_id=seat_id, booking=booking)
+            for (showtime_id, seat_id), booking in held.items()
+        ])
+
+        rebuild_now_showing()
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.cinema = cinemas[0]
+        cls.movie = movies[0]
+        cls.user = users[0]
+        cls.showtime = next(showtime for showtime in showtimes if showtime.start_time.date() > timezone.localdate())
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def assertIndexedQueries(self, method, path, data=None, expected_indexes=(), **extra):
+        """Run one request and fail if any SELECT it issued scans a large table"""
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(path, data, **extra)
+        self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+
+        plans = []
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = query_plan(sql)
+            plans.append(plan)
+            scanned = full_scans(plan, sql)
+            self.assertFalse(scanned, f'Full scan of {scanned} in {path}:\n{sql}\n' + '\n'.join(plan))
+
+        used = '\n'.join(line for plan in plans for line in plan)
+        for index_name in expected_indexes:
+            self.assertIn(index_name, used, f'{index_name} not used by {path}:\n{used}')
+        return response
+
+
+class MoviesQueryPlanTests(QueryPlanTestCase):
+    def test_showtime_list(self):
+        self.assertIndexedQueries('get', '/api/movies/showtimes/', expected_indexes=['showtime_start_id_idx'])
+
+    def test_showtime_list_by_movie(self):
+        self.assertIndexedQueries('get', '/api/movies/showtimes/', {'movie': self.movie.id})
+
+    def test_showtime_list_by_cinema(self):
+        self.assertIndexedQueries('get', '/api/movies/showtimes/', {'screen__cinema': self.cinema.id})
+
+    def test_showtime_detail(self):
+        self.assertIndexedQueries('get', f'/api/movies/showtimes/{self.showtime.id}/')
+
+    def test_movie_showtimes_for_day(self):
+        self.assertIndexedQueries(
+            'get', f'/api/movies/movies/{self.showtime.movie_id}/showtimes/',
+            {'date': timezone.localdate(self.showtime.start_time).isoformat()},
+            expected_indexes=['showtime_movie_start_idx'],
+        )
+
+    def test_cinema_schedule(self):
+        self.assertIndexedQueries(
+            'get', f'/api/movies/cinemas/{self.cinema.id}/schedule/',
+            {'date': timezone.localdate(self.showtime.start_time).isoformat()},
+            expected_indexes=['showtime_screen_start_idx'],
+        )
+
+    def test_now_showing(self):
+        self.assertIndexedQueries('get', '/api/movies/movies/now_showing/')
+
+    def test_seats(self):
+        self.assertIndexedQueries(
+            'get', f'/api/movies/showtimes/{self.showtime.id}/seats/',
+            expected_indexes=[constraint_index('bookings_seatinventory', 'seat_inventory_showtime_seat_uniq')],
+        )
+
+    def test_seat_map(self):
+        self.assertIndexedQueries(
+            'get', f'/api/movies/showtimes/{self.showtime.id}/seat_map/',
+            expected_indexes=[constraint_index('bookings_seatinventory', 'seat_inventory_showtime_seat_uniq')],
+        )
+
+
+class SeatCountValidatorTests(QueryPlanTestCase):
+    BOOKINGS = 0
+
+    def test_seat_change_only_invalidates_its_showtime(self):
+        client = APIClient()
+        detail = f'/api/movies/showtimes/{self.showtime.id}/'
+        other = Showtime.objects.exclude(pk=self.showtime.pk).first()
+        other_detail = f'/api/movies/showtimes/{other.id}/'
+        etags = {path: client.get(path)['ETag'] for path in (detail, other_detail)}
+        version = TableVersion.objects.filter(table='movies.showtime').values_list('version', flat=True).first()
+
+        self.showtime.adjust_seat_counts(2)
+
+        self.assertEqual(client.get(detail, HTTP_IF_NONE_MATCH=etags[detail]).status_code, 200)
+        self.assertEqual(client.get(other_detail, HTTP_IF_NONE_MATCH=etags[other_detail]).status_code, 304)
+        self.assertEqual(
+            TableVersion.objects.filter(table='movies.showtime').values_list('version', flat=True).first(), version
+        )
+
+    def test_schedule_sees_seat_changes_without_cache_invalidation(self):
+        # As another worker would leave it: only the database knows about the change
+        path = f'/api/movies/cinemas/{self.showtime.screen.cinema_id}/schedule/'
+        day = {'date': timezone.localdate(self.showtime.start_time).isoformat()}
+        APIClient().get(path, day)
+        Showtime.objects.filter(pk=self.showtime.pk).update(booked_count=7, seat_version=F('seat_version') + 1)
+
+        schedule = APIClient().get(path, day).data
+        booked = {
+            showtime['id']: showtime['booked_seats']
+            for movie in schedule['movies'] for screen in movie['screens'] for showtime in screen['showtimes']
+        }
+        self.assertEqual(booked[self.showtime.id], 7)
+
+    def test_showtime_change_only_invalidates_its_bucket(self):
+        client = APIClient()
+        cinema_id = self.showtime.screen.cinema_id
+        path = f'/api/movies/cinemas/{cinema_id}/schedule/'
+        day = timezone.localdate(self.showtime.start_time)
+        other = Showtime.objects.filter(screen__cinema_id=cinema_id, start_time__gte=day_bounds(day)[1]).first()
+        etag = client.get(path, {'date': day.isoformat()})['ETag']
+
+        other.base_price += 1
+        other.save()
+        self.assertEqual(client.get(path, {'date': day.isoformat()}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Moved into the bucket
+        other.start_time = self.showtime.start_time + timedelta(minutes=1)
+        other.save()
+        response = client.get(path, {'date': day.isoformat()}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(other.id, [
+            showtime['id']
+            for movie in response.data['movies'] for screen in movie['screens'] for showtime in screen['showtimes']
+        ])
+
+
+class RenditionTests(TestCase):
+    def create_movie(self, **fields):
+        return Movie.objects.create(
+            title='Artwork', description='', duration=100, rating='PG', genre='Drama',
+            release_date=datetime(2025, 1, 1).date(), director='Director', cast='Cast', **fields
+        )
+
+    def test_movie_without_images(self):
+        movie = self.create_movie()
+        self.assertIsNone(srcset_map(movie, 'poster_image', str))
+        self.assertIsNone(srcset_map(movie, 'banner_image', str))
+
+        response = APIClient().get(f'/api/movies/movies/{movie.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['poster_srcset'])
+        self.assertIsNone(response.data['banner_srcset'])
+
+    def test_unreadable_image_is_recorded(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            movie = self.create_movie()
+            movie.poster_image.save('poster.jpg', ContentFile(b'not an image'))
+
+            self.assertTrue(generate_renditions(movie))
+            movie.refresh_from_db()
+            self.assertEqual(movie.image_renditions['poster_image'],
+                             {'source': movie.poster_image.name, 'failed': True})
+            # Nothing left to render until the image changes
+            self.assertFalse(generate_renditions(movie))
+            self.assertIsNone(srcset_map(movie, 'poster_image', str))
+
+    def test_renders_on_save_not_on_read(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            movie = self.create_movie()
+            with self.captureOnCommitCallbacks() as callbacks:
+                movie.poster_image.save('poster.jpg', ContentFile(b'not an image'))
+            self.assertEqual(len(callbacks), 1)
+
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = APIClient().get(f'/api/movies/movies/{movie.id}/')
+            self.assertIsNone(response.data['poster_srcset'])
+            self.assertEqual(callbacks, [])
+
+            generate_renditions(movie)
+            with self.captureOnCommitCallbacks() as callbacks:
+                movie.save()
+            self.assertEqual(callbacks, [])
+
+
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media_root = media_root.name
+
+    def create_movie(self, title):
+        return Movie.objects.create(title=title, description='', duration=100, rating='PG', genre='Drama',
+                                    release_date=datetime(2025, 1, 1).date(), director='Director', cast='Cast')
+
+    def write_legacy_file(self, name, content, age=timedelta(0)):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as legacy:
+            legacy.write(content)
+        mtime = (timezone.now() - age).timestamp()
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_duplicate_uploads_share_one_file(self):
+        first, second = self.create_movie('First'), self.create_movie('Second')
+        first.poster_image.save('1_poster.jpg', ContentFile(b'same poster'))
+        second.poster_image.save('2_poster.jpg', ContentFile(b'same poster'))
+
+        self.assertEqual(first.poster_image.name, second.poster_image.name)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'movie_posters')),
+                         [os.path.basename(first.poster_image.name)])
+
+    def test_dedupe_media_repoints_image_fields(self):
+        movies = [self.create_movie('First'), self.create_movie('Second')]
+        old_paths = []
+        for movie in movies:
+            name = f'movie_posters/{movie.id}_poster.jpg'
+            old_paths.append(self.write_legacy_file(name, b'same poster', age=timedelta(days=1)))
+            Movie.objects.filter(pk=movie.pk).update(poster_image=name, image_renditions={
+                'poster_image': {'source': name, 'failed': True},
+            })
+        fresh = self.write_legacy_file('movie_posters/99_poster.jpg', b'still importing')
+
+        call_command('dedupe_media', stdout=StringIO())
+        names = set()
+        for movie in movies:
+            movie.refresh_from_db()
+            names.add(movie.poster_image.name)
+            self.assertEqual(movie.image_renditions['poster_image']['source'], movie.poster_image.name)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, names.pop())))
+        # Nothing is deleted unless asked
+        self.assertTrue(all(os.path.exists(path) for path in old_paths))
+
+        call_command('dedupe_media', '--delete-unreferenced', stdout=StringIO())
+        self.assertFalse(any(os.path.exists(path) for path in old_paths))
+        self.assertTrue(os.path.exists(fresh))
+
+
+class LayoutCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cinema = Cinema.objects.create(name='OmniWatch', location='Layout', address='1 Main Street', phone='01-0000000')
+        cls.screen = Screen.objects.create(cinema=cinema, name='Screen 1', total_seats=6, rows=2, seats_per_row=3)
+        Seat.objects.bulk_create([
+            Seat(screen=cls.screen, row=row, number=number, seat_type='VIP' if row == 'B' else 'STANDARD')
+            for row in 'BA' for number in (3, 1, 2)
+        ])
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings = override_settings(SEAT_LAYOUT_CACHE_DIR=cache_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Forget layouts other tests mapped in this process
+        layout_cache._layouts.clear()
+        self.screen.refresh_from_db()
+
+    def expected_seats(self):
+        return [
+            {'id': seat.id, 'row': seat.row, 'number': seat.number, 'seat_type': seat.seat_type, 'screen': seat.screen_id}
+            for seat in Seat.objects.filter(screen=self.screen).order_by('row', 'number')
+        ]
+
+    def test_layout_is_built_in_seat_order(self):
+        with self.assertNumQueries(1):
+            layout = get_seat_layout(self.screen)
+        with self.assertNumQueries(0):
+            self.assertIs(get_seat_layout(self.screen), layout)
+
+        self.assertTrue(layout_cache._layout_path(self.screen.id, self.screen.layout_version).exists())
+        self.assertEqual(layout.as_seat_dicts(), self.expected_seats())
+        self.assertEqual(len(layout), 6)
+        self.assertIn(layout.seat_ids[0], layout)
+        self.assertNotIn(0, layout)
+
+    def test_seat_and_screen_saves_rebuild_the_layout(self):
+        first = get_seat_layout(self.screen)
+        old_path = layout_cache._layout_path(self.screen.id, self.screen.layout_version)
+
+        Seat.objects.create(screen=self.screen, row='C', number=1)
+        self.screen.refresh_from_db()
+        self.assertNotEqual(self.screen.layout_version, first.version)
+        second = get_seat_layout(self.screen)
+        self.assertEqual(second.as_seat_dicts(), self.expected_seats())
+        self.assertFalse(old_path.exists())
+
+        self.screen.name = 'Screen 1A'
+        self.screen.save()
+        self.screen.refresh_from_db()
+        self.assertNotEqual(self.screen.layout_version, second.version)
+        self.assertEqual(get_seat_layout(self.screen).version, self.screen.layout_version)
+
+    def test_damaged_file_is_rebuilt(self):
+        path = layout_cache._layout_path(self.screen.id, self.screen.layout_version)
+        contents = layout_cache._write_layout_file(self.screen.id, self.screen.layout_version).read_bytes()
+
+        for damaged in (b'', b'garbage', contents[:-layout_cache.RECORD.size], contents[:-1]):
+            with self.subTest(size=len(damaged)):
+                layout_cache._layouts.clear()
+                path.write_bytes(damaged)
+                self.assertEqual(get_seat_layout(self.screen).as_seat_dicts(), self.expected_seats())
+                self.assertEqual(path.read_bytes(), contents)
+
+
+class SearchTests(TestCase):
+    path = '/api/movies/movies/'
+
+    def create_movie(self, title, **fields):
+        fields = {'director': 'Director', 'cast': 'Cast', 'genre': 'Drama', **fields}
+        return Movie.objects.create(title=title, description='', duration=100, rating='PG',
+                                    release_date=datetime(2025, 1, 1).date(), **fields)
+
+    def search(self, text, **params):
+        return [movie['title'] for movie in APIClient().get(self.path, {'search': text, **params}).data['results']]
+
+    def test_title_hits_rank_above_cast_hits(self):
+        self.create_movie('Quiet Evening', cast='Keanu Reeves')
+        self.create_movie('Keanu')
+        self.create_movie('Unrelated')
+        self.assertEqual(self.search('keanu'), ['Keanu', 'Quiet Evening'])
+
+    def test_terms_match_as_prefixes(self):
+        self.create_movie('Wicked')
+        self.create_movie('John Wick', director='Chad Stahelski')
+        self.assertEqual(set(self.search('wick')), {'Wicked', 'John Wick'})
+        self.assertEqual(self.search('wick stahel'), ['John Wick'])
+
+    def test_index_follows_saves_and_deletes(self):
+        movie = self.create_movie('Arrival')
+        self.assertEqual(self.search('arrival'), ['Arrival'])
+
+        movie.title = 'Departure'
+        movie.save()
+        self.assertEqual(self.search('arrival'), [])
+        self.assertEqual(self.search('departure'), ['Departure'])
+
+        movie.delete()
+        self.assertEqual(self.search('departure'), [])
+
+    def test_every_match_is_reachable_through_pages(self):
+        for i in range(25):
+            self.create_movie(f'Sequel {i:02d}')
+        first = APIClient().get(self.path, {'search': 'sequel'}).data
+        second = APIClient().get(first['next']).data
+
+        self.assertEqual(first['count'], 25)
+        titles = [movie['title'] for movie in first['results'] + second['results']]
+        self.assertEqual(sorted(titles), [f'Sequel {i:02d}' for i in range(25)])
+
+
+class NowShowingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cinema = Cinema.objects.create(name='OmniWatch', location='Now', address='1 Main Street', phone='01-0000000')
+        cls.screen = Screen.objects.create(cinema=cinema, name='Screen 1', total_seats=100)
+        cls.movie = Movie.objects.create(title='Showing', description='', duration=100, rating='PG', genre='Drama',
+                                         release_date=datetime(2025, 1, 1).date(), director='Director', cast='Cast')
+
+    def create_showtime(self, start):
+        return Showtime.objects.create(movie=self.movie, screen=self.screen, start_time=start,
+                                       end_time=start + timedelta(hours=2), base_price=Decimal('10.00'))
+
+    def next_start(self):
+        return NowShowing.objects.filter(movie=self.movie).values_list('next_start_time', flat=True).first()
+
+    def test_showtime_added(self):
+        tomorrow = today_start() + timedelta(days=1, hours=18)
+        self.create_showtime(today_start() - timedelta(hours=6))
+        self.assertIsNone(self.next_start())
+
+        self.create_showtime(tomorrow)
+        self.assertEqual(self.next_start(), tomorrow)
+        self.create_showtime(tomorrow + timedelta(days=1))
+        self.assertEqual(self.next_start(), tomorrow)
+        self.create_showtime(tomorrow - timedelta(hours=3))
+        self.assertEqual(self.next_start(), tomorrow - timedelta(hours=3))
+
+    def test_showtime_removed(self):
+        first = self.create_showtime(today_start() + timedelta(days=1, hours=12))
+        second = self.create_showtime(first.start_time + timedelta(days=1))
+
+        first.delete()
+        self.assertEqual(self.next_start(), second.start_time)
+        second.delete()
+        self.assertIsNone(self.next_start())
+
+    def test_rollover_is_read_without_writing(self):
+        later = self.create_showtime(today_start() + timedelta(hours=20))
+        # As midnight leaves it: the stored next start is yesterday's showtime
+        NowShowing.objects.filter(movie=self.movie).update(next_start_time=today_start() - timedelta(hours=4))
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(now_showing_entries(), [(self.movie.id, later.start_time)])
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in captured.captured_queries))
+        self.assertLess(self.next_start(), today_start())
+
+        call_command('refresh_now_showing', stdout=StringIO())
+        self.assertEqual(self.next_start(), later.start_time)
+
+    def test_rollover_drops_movies_with_nothing_left(self):
+        NowShowing.objects.create(movie=self.movie, next_start_time=today_start() - timedelta(hours=4))
+        self.assertEqual(now_showing_entries(), [])
+
+
+class SchedulingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cinema = Cinema.objects.create(name='OmniWatch', location='Plan', address='1 Main Street', phone='01-0000000')
+        cls.screen = Screen.objects.create(cinema=cinema, name='Screen 1', total_seats=100)
+        cls.movie = Movie.objects.create(title='Planned', description='', duration=90, rating='PG', genre='Drama',
+                                         release_date=datetime(2025, 1, 1).date(), director='Director', cast='Cast')
+        cls.day = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=2), time()))
+
+    def test_timeline_intervals(self):
+        timeline = ScreenTimeline()
+        self.assertTrue(timeline.add(10, 12))
+        self.assertTrue(timeline.add(14, 16))
+
+        cases = [
+            ('adjacent before', 8, 10, True),
+            ('adjacent after', 16, 18, True),
+            ('fills the gap exactly', 12, 14, True),
+            ('contained', 10.5, 11, False),
+            ('containing', 9, 19, False),
+            ('overlapping start', 7, 8.5, False),
+            ('overlapping end', 17, 19, False),
+            ('spanning two', 11, 15, False),
+        ]
+        for label, start, end, accepted in cases:
+            with self.subTest(label):
+                self.assertEqual(timeline.add(start, end), accepted)
+        self.assertEqual(list(zip(timeline.starts, timeline.ends)), [(8, 10), (10, 12), (12, 14), (14, 16), (16, 18)])
+
+    def test_planner_checks_existing_showtimes(self):
+        start = self.day + timedelta(hours=18)
+        existing = Showtime.objects.create(movie=self.movie, screen=self.screen, start_time=start,
+                                           end_time=Showtime.end_time_for(start, self.movie.duration),
+                                           base_price=Decimal('10.00'))
+
+        planner = SchedulePlanner([self.screen], self.day, self.day + timedelta(days=1))
+        self.assertIsNone(planner.add(self.movie, self.screen, start + timedelta(minutes=30), Decimal('10.00')))
+        self.assertIsNone(planner.add(self.movie, self.screen, start - timedelta(minutes=60), Decimal('10.00')))
+        self.assertIsNotNone(planner.add(self.movie, self.screen, existing.end_time, Decimal('10.00')))
+        before = planner.add(self.movie, self.screen, start - timedelta(minutes=120), Decimal('10.00'))
+        self.assertEqual(before.end_time, start)
+        self.assertFalse(planner.is_free(self.screen, start - timedelta(minutes=200), self.movie.duration))
+        self.assertEqual(planner.rejected, 2)
+
+        planner.save()
+        self.assertEqual(Showtime.objects.filter(screen=self.screen).count(), 3)
+
+
+class OptimizerTests(TestCase):
+    def test_estimate_demand_is_an_occupancy_rate(self):
+        rng = np.random.default_rng(3)
+        offered = rng.integers(0, 500, size=(4, 24, 3)).astype(float)
+        sold = offered * rng.random(offered.shape)
+        rates = estimate_demand(sold, offered)
+
+        self.assertEqual(rates.shape, offered.shape)
+        self.assertTrue(((rates >= 0) & (rates <= 1)).all())
+        # No history at all is no signal, not zero demand
+        self.assertTrue(np.allclose(estimate_demand(np.zeros_like(offered), np.zeros_like(offered)), 0.3))
+
+    def test_planned_day_has_no_overlaps_and_fits_capacity(self):
+        rng = np.random.default_rng(5)
+        capacity = np.array([80.0, 150.0, 300.0])
+        rates = estimate_demand(rng.random((6, 24, 1)) * 100, np.full((6, 24, 1), 100.0))[:, 10:23, 0]
+        slots = np.arange(0, 150, 3)
+        expected = rates[:, (slots // 12)][:, None, :] * capacity[None, :, None]
+        lengths = np.array([24, 27, 30, 33, 36, 40])
+        busy = np.zeros((3, 200), dtype=bool)
+        busy[1, 40:80] = True
+        already_busy = busy.copy()
+
+        chosen = plan_day(expected, lengths, slots, busy)
+        self.assertTrue(chosen)
+
+        intervals = {}
+        for movie, screen, slot, seats in chosen:
+            self.assertLessEqual(seats, capacity[screen])
+            start, end = slots[slot], slots[slot] + lengths[movie]
+            self.assertLessEqual(end, busy.shape[1])
+            self.assertFalse(already_busy[screen, start:end].any())
+            for other_start, other_end in intervals.get(screen, []):
+                self.assertTrue(end <= other_start or start >= other_end)
+            intervals.setdefault(screen, []).append((start, end))
+
+    def test_optimize_schedule_programmes_without_overlaps(self):
+        cinema = Cinema.objects.create(name='OmniWatch', location='Optimize', address='1 Main Street', phone='01-0000000')
+        screens = [Screen.objects.create(cinema=cinema, name=f'Screen {i}', screen_type=screen_type, total_seats=seats)
+                   for i, (screen_type, seats) in enumerate([('STANDARD', 60), ('MAXX', 200)])]
+        for i, duration in enumerate([95, 120, 150]):
+            Movie.objects.create(title=f'Movie {i}', description='', duration=duration, rating='PG', genre='Drama',
+                                 release_date=datetime(2025, 1, 1).date(), director='Director', cast='Cast')
+        day = timezone.localdate() + timedelta(days=1)
+        start = timezone.make_aware(datetime.combine(day, time(14)))
+        Showtime.objects.create(movie=Movie.objects.first(), screen=screens[0], start_time=start,
+                                end_time=Showtime.end_time_for(start, 95), base_price=Decimal('10.00'))
+
+        call_command('optimize_schedule', '--start', day.isoformat(), '--days', '1', stdout=StringIO())
+
+        for screen in screens:
+            showtimes = list(Showtime.objects.filter(screen=screen).order_by('start_time'))
+            self.assertGreater(len(showtimes), 1)
+            for earlier, later in zip(showtimes, showtimes[1:]):
+                self.assertLessEqual(earlier.end_time, later.start_time)
+            for showtime in showtimes:
+                self.assertEqual(showtime.available_count, screen.total_seats)
+                self.assertEqual(showtime.end_time, Showtime.end_time_for(showtime.start_time, showtime.movie.duration))
+
+
+class FakeClock:
+    """Stands in for the time module: sleep() advances monotonic() instead of blocking"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('movies.tmdb_service.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_up_to_capacity_then_waits(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.slept, [])
+
+        bucket.acquire()
+        self.assertEqual(self.clock.slept, [0.5])
+
+    def test_sustained_rate_and_refill_cap(self):
+        bucket = TokenBucket(rate=4)
+        started = self.clock.now
+        for _ in range(4 + 20):
+            bucket.acquire()
+        # The first 4 are the initial burst, the other 20 come at 4 per second
+        self.assertAlmostEqual(self.clock.now - started, 5.0)
+
+        # An idle bucket refills to capacity, no further
+        self.clock.now += 60
+        self.clock.slept.clear()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertEqual(self.clock.slept, [0.25])
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeSession:
+    """
+    HTTP layer for TMDBService: handler(url, params, headers) returns a
+    FakeResponse, and every request is recorded in calls.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        with self.lock:
+            self.calls.append((url, params, headers or {}))
+        return self.handler(url, params, headers or {})
+
+    def urls(self):
+        return [url for url, _params, _headers in self.calls]
+
+
+def fake_tmdb(handler, cache=None):
+    tmdb = TMDBService(rate_limit=1000, cache=cache or ResponseCache(mode='off'))
+    tmdb.session = FakeSession(handler)
+    return tmdb
+
+
+class ResponseCacheTests(TestCase):
+    url = f'{TMDBService.BASE_URL}/movie/1'
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache = ResponseCache(directory=cache_dir.name, ttl=60, max_bytes=10 ** 6, mode='live')
+
+    def serve(self, url, params, headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, {'id': 1, 'title': 'Cached'}, {'ETag': '"v1"'})
+
+    def test_fresh_entries_skip_the_network(self):
+        tmdb = fake_tmdb(self.serve, self.cache)
+        self.assertEqual(tmdb.get_movie_details(1)['title'], 'Cached')
+        self.assertEqual(tmdb.get_movie_details(1)['title'], 'Cached')
+        self.assertEqual(len(tmdb.session.calls), 1)
+        # The API key never reaches the cache key
+        self.assertEqual(self.cache.key(self.url, {'api_key': 'a', 'page': 1}),
+                         self.cache.key(self.url, {'api_key': 'b', 'page': 1}))
+
+    def test_expired_entry_is_revalidated(self):
+        tmdb = fake_tmdb(self.serve, self.cache)
+        tmdb.get_movie_details(1)
+
+        self.cache.ttl = 0
+        self.assertEqual(tmdb.get_movie_details(1)['title'], 'Cached')
+        self.assertEqual(len(tmdb.session.calls), 2)
+        self.assertEqual(tmdb.session.calls[1][2]['If-None-Match'], '"v1"')
+
+        # The 304 restarted the entry's TTL
+        self.cache.ttl = 60
+        tmdb.get_movie_details(1)
+        self.assertEqual(len(tmdb.session.calls), 2)
+
+    def test_changed_payload_replaces_the_entry(self):
+        tmdb = fake_tmdb(self.serve, self.cache)
+        tmdb.get_movie_details(1)
+        self.cache.ttl = 0
+        tmdb.session.handler = lambda url, params, headers: FakeResponse(200, {'id': 1, 'title': 'New'}, {'ETag': '"v2"'})
+
+        self.assertEqual(tmdb.get_movie_details(1)['title'], 'New')
+        self.assertEqual(self.cache.get(self.url, tmdb.session.calls[0][1]).etag, '"v2"')
+
+    def test_least_recently_used_entries_are_evicted(self):
+        body = 'x' * 400
+        for name in ('a', 'b'):
+            self.cache.store(f'{self.url}/{name}', {}, body)
+        entry_size = self.cache.get(f'{self.url}/a', {}).path.stat().st_size
+        self.cache.max_bytes = entry_size * 2 + entry_size // 2
+
+        # Make a the most recently used
+        for age, name in ((20, 'a'), (10, 'b')):
+            path = self.cache.get(f'{self.url}/{name}', {}).path
+            os.utime(path, (time_module.time() - age,) * 2)
+        self.cache.get(f'{self.url}/a', {})
+
+        self.cache.store(f'{self.url}/c', {}, body)
+        self.assertIsNotNone(self.cache.get(f'{self.url}/a', {}))
+        self.assertIsNone(self.cache.get(f'{self.url}/b', {}))
+        self.assertIsNotNone(self.cache.get(f'{self.url}/c', {}))
+
+    def test_replay_never_touches_the_network(self):
+        self.cache.mode = 'replay'
+        tmdb = fake_tmdb(self.serve, self.cache)
+        self.assertIsNone(tmdb.get_movie_details(1))
+        self.assertEqual(tmdb.session.calls, [])
+
+
+class ImportTmdbMoviesTests(TestCase):
+    def setUp(self):
+        self.listing = [
+            {'id': 101, 'title': 'Listed', 'overview': 'One', 'release_date': '2025-03-01', 'poster_path': '/p101.jpg'},
+            {'id': 102, 'title': 'Also Listed', 'overview': 'Two', 'release_date': '2025-04-01'},
+            {'id': 103, 'title': 'Added By Hand', 'overview': 'Three', 'release_date': '2025-05-01'},
+        ]
+        self.runtimes = {101: 110, 102: 95, 103: 100}
+        self.session = FakeSession(self.serve)
+        patcher = mock.patch('movies.tmdb_service.requests.Session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Movie.objects.create(title='Added By Hand', description='', duration=100, rating='PG', genre='Drama',
+                             release_date=datetime(2025, 5, 1).date(), director='Director', cast='Cast')
+
+    def serve(self, url, params, headers):
+        if url.endswith('/movie/now_playing'):
+            return FakeResponse(200, {'results': self.listing})
+        tmdb_id = int(url.rsplit('/', 1)[1])
+        return FakeResponse(200, {
+            'runtime': self.runtimes[tmdb_id],
+            'genres': [{'name': 'Action'}],
+            'credits': {'crew': [{'job': 'Director', 'name': f'Director {tmdb_id}'}], 'cast': []},
+            'videos': {'results': []},
+            'release_dates': {'results': []},
+        })
+
+    def run_import(self, *args):
+        output = StringIO()
+        call_command('import_tmdb_movies', '--cache-mode', 'off', '--skip-images', *args, stdout=output)
+        return output.getvalue()
+
+    def detail_requests(self):
+        return sorted(url.rsplit('/', 1)[1] for url in self.session.urls() if not url.endswith('now_playing'))
+
+    def test_new_movies_are_imported_once(self):
+        output = self.run_import()
+        self.assertIn('Imported: 2 movies', output)
+        self.assertEqual(self.detail_requests(), ['101', '102'])
+        movie = Movie.objects.get(tmdb_id=101)
+        self.assertEqual((movie.duration, movie.director, movie.tmdb_poster_path), (110, 'Director 101', '/p101.jpg'))
+        self.assertFalse(Movie.objects.filter(tmdb_id=103).exists())
+
+        self.session.calls.clear()
+        output = self.run_import()
+        self.assertEqual(self.detail_requests(), [])
+        self.assertIn('Skipped: 3 movies', output)
+
+    def test_stale_movies_are_refetched_and_only_changes_written(self):
+        self.run_import()
+        synced = dict(Movie.objects.filter(tmdb_id__isnull=False).values_list('tmdb_id', 'tmdb_synced_at'))
+        version = TableVersion.objects.filter(table='movies.movie').values_list('version', flat=True).first()
+
+        self.session.calls.clear()
+        output = self.run_import('--stale-after', '0')
+        self.assertEqual(self.detail_requests(), ['101', '102'])
+        self.assertIn('Unchanged: 2 movies', output)
+        self.assertEqual(TableVersion.objects.filter(table='movies.movie').values_list('version', flat=True).first(),
+                         version)
+        for tmdb_id, synced_at in Movie.objects.filter(tmdb_id__isnull=False).values_list('tmdb_id', 'tmdb_synced_at'):
+            self.assertGreater(synced_at, synced[tmdb_id])
+
+        self.runtimes[102] = 125
+        output = self.run_import('--stale-after', '0')
+        self.assertIn('Updated: 1 movies', output)
+        self.assertIn('Unchanged: 1 movies', output)
+        self.assertEqual(Movie.objects.get(tmdb_id=102).duration, 125)
+
+
+def jpeg_bytes(color):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 60), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class InlineExecutor:
+    """Runs executor.map() work on the test's thread, inside its transaction"""
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+class TmdbImageTests(TestCase):
+    def setUp(self):
+        media_root, staging = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.addCleanup(staging.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name, TMDB_IMAGE_DOWNLOAD_DIR=staging.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.staging = Path(staging.name)
+        self.images = {}
+
+    def serve(self, url, params, headers):
+        image = self.images.get(url.rsplit('/', 1)[1])
+        if image is None:
+            return FakeResponse(404)
+        offset = int(headers['Range'][len('bytes='):-1]) if 'Range' in headers else 0
+        if offset:
+            return FakeResponse(206, image[offset:])
+        return FakeResponse(200, image)
+
+    def create_movie(self, title, poster_path=''):
+        return Movie.objects.create(title=title, description='', duration=100, rating='PG', genre='Drama',
+                                    release_date=datetime(2025, 1, 1).date(), director='Director', cast='Cast',
+                                    tmdb_id=Movie.objects.count() + 1, tmdb_poster_path=poster_path)
+
+    def test_partial_download_is_resumed(self):
+        self.images['p1.jpg'] = image = jpeg_bytes('red')
+        destination = self.staging / 'p1.jpg'
+        Path(f'{destination}.part').write_bytes(image[:100])
+        tmdb = fake_tmdb(self.serve)
+        tmdb.IMAGE_CHUNK_SIZE = 64
+
+        self.assertTrue(tmdb.download_image(tmdb.get_poster_url('/p1.jpg'), destination))
+        self.assertEqual(tmdb.session.calls[0][2], {'Range': 'bytes=100-'})
+        self.assertEqual(destination.read_bytes(), image)
+        self.assertFalse(Path(f'{destination}.part').exists())
+
+    def test_server_ignoring_range_restarts_the_file(self):
+        self.images['p1.jpg'] = image = jpeg_bytes('red')
+        destination = self.staging / 'p1.jpg'
+        Path(f'{destination}.part').write_bytes(b'stale bytes')
+        tmdb = fake_tmdb(lambda url, params, headers: FakeResponse(200, image))
+
+        self.assertTrue(tmdb.download_image(tmdb.get_poster_url('/p1.jpg'), destination))
+        self.assertEqual(destination.read_bytes(), image)
+
+    def test_staged_files_skip_the_network(self):
+        image = jpeg_bytes('blue')
+        (self.staging / 'p2.jpg').write_bytes(image)
+        movie = self.create_movie('Staged', '/p2.jpg')
+        tmdb = fake_tmdb(self.serve)
+
+        self.assertEqual(download_images(tmdb, InlineExecutor()), (1, 1))
+        self.assertEqual(tmdb.session.calls, [])
+
+        movie.refresh_from_db()
+        self.assertEqual(movie.poster_image.read(), image)
+        self.assertEqual(movie.tmdb_image_sources, {'poster_image': '/p2.jpg'})
+        self.assertFalse((self.staging / 'p2.jpg').exists())
+        self.assertFalse(pending_movies().exists())
+
+    def test_batches_walk_forward_past_failures(self):
+        movies = [self.create_movie(f'Movie {i}', f'/m{i}.jpg') for i in range(5)]
+        for i in (0, 1, 3, 4):
+            self.images[f'm{i}.jpg'] = jpeg_bytes((i * 40, 0, 0))
+        tmdb = fake_tmdb(self.serve)
+
+        self.assertEqual(download_images(tmdb, InlineExecutor(), batch_size=2), (4, 4))
+        # The missing image is asked for once, and its movie stays pending for the next run
+        self.assertEqual(sorted(tmdb.session.urls()), sorted(tmdb.get_poster_url(f'/m{i}.jpg') for i in range(5)))
+        self.assertEqual(list(pending_movies()), [movies[2]])
+
+
+class ShowtimeApiTests(QueryPlanTestCase):
+    DAYS = 4
+    BOOKINGS = 0
+
+    def test_internal_counters_are_not_exposed(self):
+        showtime = self.client.get(f'/api/movies/showtimes/{self.showtime.id}/').data
+        self.assertEqual(showtime['available_seats'], self.showtime.available_count)
+        for field in ('booked_count', 'available_count', 'seat_version'):
+            self.assertNotIn(field, showtime)
+
+    def test_seat_map_bitset_decodes_to_taken_seats(self):
+        from bookings.services import book_showtime
+
+        layout = get_seat_layout(self.showtime.screen)
+        taken = [layout.seat_ids[0], layout.seat_ids[9], layout.seat_ids[-1]]
+        book_showtime(self.user, self.showtime, layout, [taken])
+
+        response = self.client.get(f'/api/movies/showtimes/{self.showtime.id}/seat_map/')
+        bits = base64.b64decode(response.data['taken'])
+        decoded = [seat_id for index, seat_id in enumerate(response.data['seat_ids'])
+                   if bits[index // 8] & (1 << (index % 8))]
+        self.assertEqual(response.data['seat_ids'], layout.seat_ids)
+        self.assertEqual(decoded, taken)
+
+    def test_seat_map_not_modified(self):
+        path = f'/api/movies/showtimes/{self.showtime.id}/seat_map/'
+        etag = self.client.get(path)['ETag']
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.showtime.adjust_seat_counts(1)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cursor_pages_are_stable(self):
+        expected = list(Showtime.objects.order_by('start_time', 'id').values_list('id', flat=True))
+        # A shared start time makes the id tie-break matter
+        Showtime.objects.filter(pk=expected[1]).update(start_time=Showtime.objects.get(pk=expected[0]).start_time)
+        expected = list(Showtime.objects.order_by('start_time', 'id').values_list('id', flat=True))
+
+        seen = []
+        url = '/api/movies/showtimes/?page_size=7'
+        while url:
+            page = self.client.get(url).data
+            seen.extend(showtime['id'] for showtime in page['results'])
+            url = page['next']
+        self.assertEqual(seen, expected)
+
+    def test_sparse_fields_prune_output_and_select(self):
+        path = f'/api/movies/showtimes/{self.showtime.id}/'
+        with CaptureQueriesContext(connection) as captured:
+            showtime = self.client.get(path, {'fields': 'id,start_time,movie', 'expand': 'movie'}).data
+        self.assertEqual(set(showtime), {'id', 'start_time', 'movie'})
+        self.assertEqual(showtime['movie']['id'], self.showtime.movie_id)
+
+        select = next(query['sql'] for query in captured.captured_queries
+                      if 'FROM "movies_showtime"' in query['sql'] and '"movies_movie"' in query['sql'])
+        self.assertNotIn('"movies_showtime"."base_price"', select)
+        self.assertNotIn('"movies_screen"', select)
+
+        showtime = self.client.get(path, {'expand': ''}).data
+        self.assertEqual(showtime['movie'], self.showtime.movie_id)
+        self.assertEqual(showtime['screen'], self.showtime.screen_id)
+
+
+@override_settings(SEAT_EVENTS_POLL_SECONDS=0.01)
+class SeatEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cinema = Cinema.objects.create(name='OmniWatch', location='Live', address='1 Main Street', phone='01-0000000')
+        screen = Screen.objects.create(cinema=cinema, name='Screen 1', screen_type='STANDARD',
+                                       total_seats=3, rows=1, seats_per_row=3)
+        Seat.objects.bulk_create([Seat(screen=screen, row='A', number=number) for number in (1, 2, 3)])
+        movie = Movie.objects.create(title='Live', description='', duration=100, rating='PG', genre='Drama',
+                                     release_date=datetime(2025, 1, 1).date(), director='Director', cast='Cast')
+        cls.showtime, cls.other_showtime = [
+            Showtime.objects.create(movie=movie, screen=screen, base_price=Decimal('10.00'),
+                                    start_time=timezone.now() + timedelta(days=1, hours=hours))
+            for hours in (0, 3)
+        ]
+        cls.seat_ids = list(Seat.objects.filter(screen=screen).order_by('number').values_list('id', flat=True))
+
+    def seats_event(self, *taken):
+        return {'type': 'seats', 'showtime': self.showtime.pk, 'taken': list(taken), 'released': []}
+
+    async def next_event(self, subscription):
+        return await asyncio.wait_for(subscription.get(), 1)
+
+    async def test_fan_out(self):
+        broker = InProcessBroker()
+        watchers = [await broker.subscribe(self.showtime.pk) for _ in range(2)]
+        elsewhere = await broker.subscribe(self.other_showtime.pk)
+
+        broker.publish(self.showtime.pk, self.seats_event(1))
+
+        for watcher in watchers:
+            self.assertEqual(await self.next_event(watcher), self.seats_event(1))
+        self.assertTrue(elsewhere.queue.empty())
+        broker.unsubscribe(watchers[0])
+        broker.publish(self.showtime.pk, self.seats_event(2))
+        self.assertEqual(await self.next_event(watchers[1]), self.seats_event(2))
+        self.assertTrue(watchers[0].queue.empty())
+
+    async def test_slow_subscriber_is_reset(self):
+        broker = InProcessBroker(queue_size=2)
+        subscription = await broker.subscribe(self.showtime.pk)
+
+        for seat_id in (1, 2, 3):
+            broker.publish(self.showtime.pk, self.seats_event(seat_id))
+
+        self.assertEqual(await self.next_event(subscription), {'type': 'reset', 'showtime': self.showtime.pk})
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_database_broker_reaches_other_processes(self):
+        # Two brokers stand in for a WSGI worker and the ASGI process
+        streaming, publishing = DatabaseBroker(), DatabaseBroker()
+        subscription = await streaming.subscribe(self.showtime.pk)
+
+        await sync_to_async(publishing.publish)(self.showtime.pk, self.seats_event(1))
+        await sync_to_async(publishing.publish)(self.other_showtime.pk, self.seats_event(2))
+
+        self.assertEqual(await self.next_event(subscription), self.seats_event(1))
+        streaming.unsubscribe(subscription)
+        # The poller stops with its last subscriber
+        await asyncio.wait_for(streaming._poller, 1)
+        self.assertTrue(subscription.queue.empty())
+
+    def test_bookings_publish_once_committed(self):
+        from bookings.services import book_showtime
+
+        user = User.objects.create_user('live')
+        with self.captureOnCommitCallbacks() as callbacks:
+            book_showtime(user, self.showtime, get_seat_layout(self.showtime.screen), [self.seat_ids[:2]])
+        self.assertFalse(SeatEvent.objects.exists())
+
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(SeatEvent.objects.get().as_event(), self.seats_event(*self.seat_ids[:2]))
+
+    @override_settings(SEAT_EVENTS_BROKER='movies.seat_events.InProcessBroker', SEAT_EVENTS_MAX_SECONDS=0.5)
+    async def test_stream(self):
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+
+        response = await AsyncClient().get(f'/api/movies/showtimes/{self.showtime.pk}/seat_events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 2000\n\n')
+        self.assertTrue((await anext(stream)).startswith(b'event: snapshot\ndata: '))
+
+        get_broker().publish(self.showtime.pk, self.seats_event(self.seat_ids[0]))
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        self.assertEqual(chunk.decode(), f'event: seats\ndata: {json.dumps(self.seats_event(self.seat_ids[0]))}\n\n')
+
+        # The stream ends after SEAT_EVENTS_MAX_SECONDS and lets go of its subscription
+        self.assertEqual([chunk async for chunk in stream], [b': keepalive\n\n'])
+        self.assertEqual(get_broker().channels(), [])
+
+    def test_stream_needs_asgi(self):
+        response = APIClient().get(f'/api/movies/showtimes/{self.showtime.pk}/seat_events/')
+        self.assertEqual(response.status_code, 501)
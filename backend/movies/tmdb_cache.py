@@ -0,0 +1,190 @@
+"""
+On-disk cache of TMDB API responses, used by TMDBService.
+
+Each response is stored as one JSON file named after the SHA-256 of the
+request URL and its parameters (minus the API key), together with its ETag
+and Last-Modified validators. Modes:
+
+    live    serve entries younger than the TTL; revalidate older ones with
+            If-None-Match / If-Modified-Since so an unchanged payload costs
+            a 304 instead of a full download
+    record  always fetch, and store every response for later replay
+    replay  never touch the network; serve whatever was recorded
+    off     no caching
+
+The directory is capped at max_bytes. Hits bump a file's mtime and the
+least recently used files are evicted first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+MODES = ('live', 'record', 'replay', 'off')
+
+# Query parameters that don't change the response and must not be written to disk
+IGNORED_PARAMS = {'api_key'}
+
+
+class CachedResponse:
+    def __init__(self, path, data):
+        self.path = path
+        self.body = data['body']
+        self.etag = data.get('etag')
+        self.last_modified = data.get('last_modified')
+        self.fetched_at = data.get('fetched_at', 0)
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    def __init__(self, directory=None, ttl=None, max_bytes=None, mode=None):
+        self.directory = Path(
+            directory or getattr(settings, 'TMDB_CACHE_DIR', None) or
+            Path(tempfile.gettempdir()) / 'omniwatch-tmdb-cache'
+        )
+        self.ttl = ttl if ttl is not None else getattr(settings, 'TMDB_CACHE_TTL', 6 * 60 * 60)
+        self.max_bytes = max_bytes if max_bytes is not None else getattr(settings, 'TMDB_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        self.mode = mode or getattr(settings, 'TMDB_CACHE_MODE', 'live')
+        if self.mode not in MODES:
+            raise ValueError(f'Unknown TMDB cache mode {self.mode!r}, expected one of {", ".join(MODES)}')
+
+        self._lock = threading.Lock()
+        self._size = None
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def key(self, url, params):
+        params = sorted((name, str(value)) for name, value in (params or {}).items() if name not in IGNORED_PARAMS)
+        return hashlib.sha256(json.dumps([url, params]).encode()).hexdigest()
+
+    def _path(self, key):
+        return self.directory / key[:2] / f'{key}.json'
+
+    def get(self, url, params):
+        if not self.enabled:
+            return None
+        path = self._path(self.key(url, params))
+        try:
+            with open(path, encoding='utf-8') as cache_file:
+                entry = CachedResponse(path, json.load(cache_file))
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+        # mtime is the LRU clock
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return entry
+
+    def is_fresh(self, entry):
+        return self.mode == 'replay' or (self.mode == 'live' and entry.age() < self.ttl)
+
+    def store(self, url, params, body, etag=None, last_modified=None):
+        if not self.enabled:
+            return
+        key = self.key(url, params)
+        path = self._path(key)
+        payload = json.dumps({
+            'url': url,
+            'params': {name: value for name, value in (params or {}).items() if name not in IGNORED_PARAMS},
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time(),
+            'body': body,
+        }).encode('utf-8')
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            previous_size = path.stat().st_size
+        except FileNotFoundError:
+            previous_size = 0
+
+        # Write to a temp file and rename so concurrent readers never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{key[:8]}-')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(payload)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(payload) - previous_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def refresh(self, entry):
+        """Mark a revalidated (304) entry as freshly fetched"""
+        try:
+            with open(entry.path, encoding='utf-8') as cache_file:
+                data = json.load(cache_file)
+            data['fetched_at'] = time.time()
+            fd, tmp_path = tempfile.mkstemp(dir=entry.path.parent, prefix='.refresh-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+                json.dump(data, tmp)
+            os.replace(tmp_path, entry.path)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def _entries(self):
+        return self.directory.glob('*/*.json')
+
+    def _scan_size(self):
+        total = 0
+        for path in self._entries():
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _evict(self):
+        """Remove least recently used entries until the cache is back under 90% of max_bytes"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _mtime, size, _path in entries)
+        target = self.max_bytes * 0.9
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._size = total
+
+    def clear(self):
+        for path in self._entries():
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
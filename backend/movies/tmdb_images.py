@@ -0,0 +1,151 @@
+"""
+Download stage for TMDB posters and backdrops.
+
+import_tmdb_movies only records where each movie's images live on TMDB
+(Movie.tmdb_poster_path / tmdb_backdrop_path). This stage fetches every
+image whose stored file didn't come from that path, a batch of movies at a
+time:
+
+    1. worker threads stream each image into the staging directory in
+       chunks; an existing file is reused and a .part file is resumed
+    2. the staged file is copied into media storage, again in chunks
+    3. the batch's rows are written with one bulk_update, and only then are
+       the staged files removed
+    4. renditions are generated for the new images
+
+Memory use stays flat however many movies are pending, and a run that
+dies half way picks up where it stopped: rows already written are no
+longer pending, and staged files skip the network.
+"""
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.db.models.fields.json import KT
+
+from .models import Movie, TableVersion
+from .renditions import generate_renditions
+
+
+# image field -> (field holding its TMDB path, file name suffix)
+IMAGE_FIELDS = {
+    'poster_image': ('tmdb_poster_path', 'poster'),
+    'banner_image': ('tmdb_backdrop_path', 'banner'),
+}
+
+
+def staging_dir():
+    directory = Path(
+        getattr(settings, 'TMDB_IMAGE_DOWNLOAD_DIR', None) or
+        Path(tempfile.gettempdir()) / 'omniwatch-tmdb-images'
+    )
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def pending_movies():
+    """Movies with at least one TMDB image that hasn't been stored yet"""
+    pending = Q()
+    aliases = {}
+    for field_name, (path_field, _suffix) in IMAGE_FIELDS.items():
+        source = f'{field_name}_source'
+        aliases[source] = KT(f'tmdb_image_sources__{field_name}')
+        pending |= ~Q(**{path_field: ''}) & (
+            Q(**{f'{source}__isnull': True}) | ~Q(**{source: F(path_field)})
+        )
+    return Movie.objects.alias(**aliases).filter(pending).order_by('pk')
+
+
+def pending_fields(movie):
+    sources = movie.tmdb_image_sources or {}
+    return [
+        field_name for field_name, (path_field, _suffix) in IMAGE_FIELDS.items()
+        if getattr(movie, path_field) and sources.get(field_name) != getattr(movie, path_field)
+    ]
+
+
+def fetch_images(tmdb, movie, directory):
+    """
+    Runs on a worker thread: download and store movie's pending images.
+    Returns the staged files, which the caller removes once the row is saved.
+    """
+    staged = []
+    sources = dict(movie.tmdb_image_sources or {})
+    for field_name in pending_fields(movie):
+        path_field, suffix = IMAGE_FIELDS[field_name]
+        tmdb_path = getattr(movie, path_field)
+        # TMDB image paths are unique file names, e.g. /kqjL17yufvn9OVLyXYpvtyrFfak.jpg
+        destination = directory / tmdb_path.lstrip('/')
+        if not destination.exists():
+            url = tmdb.get_poster_url(tmdb_path) if suffix == 'poster' else tmdb.get_backdrop_url(tmdb_path)
+            if not tmdb.download_image(url, destination):
+                continue
+
+        with open(destination, 'rb') as staged_file:
+            getattr(movie, field_name).save(
+                f'{movie.tmdb_id}_{suffix}{destination.suffix}',
+                File(staged_file),
+                save=False
+            )
+        sources[field_name] = tmdb_path
+        staged.append(destination)
+
+    movie.tmdb_image_sources = sources
+    return staged
+
+
+def render(movie):
+    """Runs on a worker thread, which must not keep its own database connection open"""
+    try:
+        return generate_renditions(movie)
+    finally:
+        connections.close_all()
+
+
+def download_images(tmdb, executor, batch_size=50, log=None):
+    """Work through pending_movies() with executor's threads. Returns (movies updated, images stored)"""
+    directory = staging_dir()
+    updated_count = 0
+    image_count = 0
+    last_pk = 0
+
+    def fetch(movie):
+        try:
+            return movie, fetch_images(tmdb, movie, directory)
+        except Exception as e:
+            if log:
+                log(f'Could not download images for {movie.title}: {e}')
+            return movie, []
+
+    while True:
+        # Keyset pagination: rows that fail stay pending without being retried in this run
+        batch = list(pending_movies().filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return updated_count, image_count
+        last_pk = batch[-1].pk
+
+        stored = [(movie, staged) for movie, staged in executor.map(fetch, batch) if staged]
+        if not stored:
+            continue
+
+        with transaction.atomic():
+            # bulk_update skips the Movie signals: bump the catalogue version here
+            Movie.objects.bulk_update(
+                [movie for movie, _staged in stored],
+                list(IMAGE_FIELDS) + ['tmdb_image_sources']
+            )
+            TableVersion.bump('movies.movie')
+        for movie, staged in stored:
+            for path in staged:
+                path.unlink(missing_ok=True)
+            if log:
+                log(f'Downloaded images: {movie.title}')
+
+        updated_count += len(stored)
+        image_count += sum(len(staged) for _movie, staged in stored)
+
+        # Renditions are CPU bound; Pillow releases the GIL while resizing
+        list(executor.map(render, [movie for movie, _staged in stored]))
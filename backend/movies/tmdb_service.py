@@ -1,35 +1,119 @@
-﻿import requests
+﻿import os
+import threading
+import time
+
+import requests
 from decouple import config
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .tmdb_cache import ResponseCache
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available;
+    tokens refill at rate per second up to capacity, so short bursts are
+    allowed but the sustained rate never exceeds rate.
+    """
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
 
 class TMDBService:
     BASE_URL = "https://api.themoviedb.org/3"
     IMAGE_BASE_URL = "https://image.tmdb.org/t/p/original"
     
-    def __init__(self):
+    # TMDB allows roughly 50 requests per second per IP; stay below it
+    DEFAULT_RATE_LIMIT = 40
+    
+    IMAGE_CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, rate_limit=DEFAULT_RATE_LIMIT, pool_size=16, cache=None):
         self.api_key = config('TMDB_API_KEY', default='')
         self.headers = {
             'Authorization': f'Bearer {config("TMDB_ACCESS_TOKEN", default="")}',
             'Content-Type': 'application/json;charset=utf-8'
         }
+        self.rate_limiter = TokenBucket(rate_limit)
+        
+        # One pooled session keeps connections alive across requests and threads;
+        # 429s and 5xx responses are retried with backoff, honouring Retry-After
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET'],
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        self.cache = cache if cache is not None else ResponseCache()
+    
+    def _get_json(self, url, params):
+        entry = self.cache.get(url, params)
+        if entry is not None and self.cache.is_fresh(entry):
+            return entry.body
+        if self.cache.mode == 'replay':
+            return None
+        
+        headers = dict(self.headers)
+        if entry is not None and self.cache.mode == 'live':
+            headers.update(entry.validators())
+        
+        self.rate_limiter.acquire()
+        try:
+            response = self.session.get(url, params=params, headers=headers, timeout=15)
+        except requests.RequestException:
+            return None
+        
+        if response.status_code == 304 and entry is not None:
+            self.cache.refresh(entry)
+            return entry.body
+        if response.status_code != 200:
+            return None
+        
+        body = response.json()
+        self.cache.store(
+            url, params, body,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+        )
+        return body
     
     def get_now_playing(self, page=1):
         url = f"{self.BASE_URL}/movie/now_playing"
         params = {'api_key': self.api_key, 'page': page, 'region': 'IE'}
-        response = requests.get(url, params=params, headers=self.headers)
-        return response.json() if response.status_code == 200 else None
+        return self._get_json(url, params)
     
     def get_upcoming(self, page=1):
         url = f"{self.BASE_URL}/movie/upcoming"
         params = {'api_key': self.api_key, 'page': page, 'region': 'IE'}
-        response = requests.get(url, params=params, headers=self.headers)
-        return response.json() if response.status_code == 200 else None
+        return self._get_json(url, params)
     
     def get_movie_details(self, tmdb_id):
         url = f"{self.BASE_URL}/movie/{tmdb_id}"
         params = {'api_key': self.api_key, 'append_to_response': 'credits,videos,release_dates'}
-        response = requests.get(url, params=params, headers=self.headers)
-        return response.json() if response.status_code == 200 else None
+        return self._get_json(url, params)
     
     def get_poster_url(self, poster_path):
         if poster_path:
@@ -41,11 +125,37 @@ class TMDBService:
             return f"{self.IMAGE_BASE_URL}{backdrop_path}"
         return None
     
-    def download_image(self, image_url):
-        if not image_url:
-            return None
-        response = requests.get(image_url)
-        return response.content if response.status_code == 200 else None
+    def download_image(self, image_url, destination):
+        """
+        Stream image_url into destination (a Path) in chunks, so memory use
+        doesn't depend on the image size. A destination.part left behind by
+        an interrupted download is resumed with a Range request. Returns True
+        once destination holds the complete file.
+        """
+        if not image_url or self.cache.mode == 'replay':
+            return False
+        
+        partial = destination.with_name(destination.name + '.part')
+        offset = partial.stat().st_size if partial.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            with self.session.get(image_url, headers=headers, stream=True, timeout=30) as response:
+                if response.status_code == 416:
+                    # The partial file doesn't match the image any more; start over
+                    partial.unlink()
+                    return self.download_image(image_url, destination)
+                if response.status_code not in (200, 206):
+                    return False
+                
+                # A 200 means the server ignored the Range header: rewrite from the start
+                with open(partial, 'ab' if response.status_code == 206 else 'wb') as out:
+                    for chunk in response.iter_content(self.IMAGE_CHUNK_SIZE):
+                        out.write(chunk)
+        except requests.RequestException:
+            return False
+        
+        os.replace(partial, destination)
+        return True
     
     def get_certification(self, release_dates):
         if not release_dates:
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CinemaViewSet, MovieViewSet, ShowtimeViewSet
+from .views import CinemaViewSet, MovieViewSet, ShowtimeViewSet, seat_events
 
 router = DefaultRouter()
 router.register(r'cinemas', CinemaViewSet)
@@ -8,5 +8,6 @@ router.register(r'movies', MovieViewSet)
 router.register(r'showtimes', ShowtimeViewSet)
 
 urlpatterns = [
+    path('showtimes/<int:pk>/seat_events/', seat_events, name='showtime-seat-events'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
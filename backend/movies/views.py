@@ -1,38 +1,125 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-from datetime import date, timedelta
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
 from .models import Cinema, Movie, Screen, Seat, Showtime
+from .conditional import ConditionalGetMixin, seat_stamp
+from .layout_cache import get_seat_layout
+from .now_showing import now_showing_entries
+from .pagination import ShowtimeCursorPagination
+from .schedule import day_bounds, get_schedule, showtimes_stamp
+from .search import MovieSearchFilter
+from .seat_events import get_broker
+from .seat_map import seat_map_etag, seat_map_payload
+from .sparse_fields import SparseFieldsViewSetMixin, plan_queryset
 from .serializers import (
     CinemaSerializer, MovieSerializer, ScreenSerializer, 
     SeatSerializer, ShowtimeSerializer, ShowtimeListSerializer
 )
 
-class CinemaViewSet(viewsets.ReadOnlyModelViewSet):
+def requested_date(request):
+    """?date= as a date, today when absent, None when malformed"""
+    value = request.query_params.get('date')
+    if not value:
+        return timezone.localdate()
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+class CinemaViewSet(ConditionalGetMixin, SparseFieldsViewSetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Cinema.objects.all()
     serializer_class = CinemaSerializer
     permission_classes = [AllowAny]
+    version_tables = {
+        'list': ['movies.cinema'],
+        'retrieve': ['movies.cinema'],
+        # Showtimes are stamped per (cinema, day) bucket instead
+        'schedule': ['movies.movie', 'movies.screen', 'movies.cinema'],
+    }
+    cache_control = {
+        'list': {'public': True, 'max_age': 3600},
+        'retrieve': {'public': True, 'max_age': 3600},
+    }
+    
+    def get_extra_validator(self, request):
+        day = requested_date(request)
+        if self.action != 'schedule' or day is None or not self.kwargs['pk'].isdigit():
+            return None
+        # Kept for the schedule action, which keys its cache on the same stamp
+        self.showtimes_stamp = showtimes_stamp(int(self.kwargs['pk']), day)
+        return self.showtimes_stamp
+    
+    @action(detail=True, methods=['get'])
+    def schedule(self, request, pk=None):
+        """All showtimes at this cinema on ?date= (default today), grouped by movie and screen"""
+        day = requested_date(request)
+        if day is None:
+            return Response({'error': 'Invalid date, expected YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(get_schedule(self.get_object(), day, getattr(self, 'showtimes_stamp', None)))
 
-class MovieViewSet(viewsets.ReadOnlyModelViewSet):
+class MovieViewSet(ConditionalGetMixin, SparseFieldsViewSetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    version_tables = {
+        'list': ['movies.movie'],
+        'retrieve': ['movies.movie'],
+        'now_showing': ['movies.movie', 'movies.showtime'],
+        'showtimes': ['movies.showtime', 'movies.movie', 'movies.screen', 'movies.cinema'],
+    }
+    cache_control = {
+        'list': {'public': True, 'max_age': 300},
+        'retrieve': {'public': True, 'max_age': 300},
+    }
+    filter_backends = [DjangoFilterBackend, MovieSearchFilter, filters.OrderingFilter]
     filterset_fields = ['rating', 'is_3d', 'is_imax', 'is_featured', 'genre']
     search_fields = ['title', 'director', 'cast', 'genre']
     ordering_fields = ['release_date', 'title', 'created_at']
+    sparse_actions = ('list', 'retrieve', 'now_showing')
+    
+    def get_extra_validator(self, request):
+        day = requested_date(request)
+        if self.action != 'showtimes' or day is None or not self.kwargs['pk'].isdigit():
+            return None
+        start, end = day_bounds(day)
+        showtimes = Showtime.objects.filter(movie_id=self.kwargs['pk'], start_time__gte=start, start_time__lt=end)
+        if request.query_params.get('cinema', '').isdigit():
+            showtimes = showtimes.filter(screen__cinema_id=request.query_params['cinema'])
+        return seat_stamp(showtimes.only('id', 'seat_version'))
     
     @action(detail=False, methods=['get'])
     def now_showing(self, request):
-        """Get movies currently showing"""
-        movies = Movie.objects.filter(
-            showtimes__start_time__gte=date.today()
-        ).distinct()
+        """Get movies currently showing, soonest next showtime first"""
+        entries = now_showing_entries()
+        page = self.paginate_queryset(entries)
+        if page is not None:
+            entries = page
         
-        serializer = self.get_serializer(movies, many=True)
-        return Response(serializer.data)
+        movies = self.get_queryset().in_bulk([movie_id for movie_id, _next_start in entries])
+        
+        data = []
+        for movie_id, next_start in entries:
+            if movie_id in movies:
+                movie_data = self.get_serializer(movies[movie_id]).data
+                movie_data['next_showtime'] = next_start
+                data.append(movie_data)
+        
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
     
    
     
@@ -41,39 +128,156 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
         """Get showtimes for a specific movie"""
         movie = self.get_object()
         cinema_id = request.query_params.get('cinema')
-        date_param = request.query_params.get('date', date.today())
+        day = requested_date(request)
+        if day is None:
+            return Response({'error': 'Invalid date, expected YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
         
-        showtimes = Showtime.objects.filter(movie=movie, start_time__date=date_param)
+        # A range on start_time rather than start_time__date, so the index applies
+        day_start, day_end = day_bounds(day)
+        showtimes = Showtime.objects.filter(movie=movie, start_time__gte=day_start, start_time__lt=day_end)
         
         if cinema_id:
             showtimes = showtimes.filter(screen__cinema_id=cinema_id)
         
-        serializer = ShowtimeListSerializer(showtimes, many=True, context={'request': request})
+        context = {'request': request}
+        showtimes = plan_queryset(showtimes, ShowtimeListSerializer(context=context))
+        serializer = ShowtimeListSerializer(showtimes, many=True, context=context)
         return Response(serializer.data)
 
-class ShowtimeViewSet(viewsets.ReadOnlyModelViewSet):
+class ShowtimeViewSet(ConditionalGetMixin, SparseFieldsViewSetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Showtime.objects.all()
     serializer_class = ShowtimeSerializer
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['movie', 'screen__cinema', 'is_3d']
+    pagination_class = ShowtimeCursorPagination
+    # seats and seat_map track availability per showtime and handle their own validators
+    version_tables = {
+        'list': ['movies.showtime', 'movies.movie', 'movies.screen', 'movies.cinema'],
+        'retrieve': ['movies.showtime', 'movies.movie', 'movies.screen', 'movies.cinema'],
+    }
+    
+    def get_extra_validator(self, request):
+        if self.action == 'retrieve' and self.kwargs['pk'].isdigit():
+            return seat_stamp(Showtime.objects.filter(pk=self.kwargs['pk']).only('id', 'seat_version'))
+        if self.action == 'list':
+            # Just the showtimes on the requested page, read the way the page itself is
+            page = self.pagination_class().paginate_queryset(
+                self.filter_queryset(Showtime.objects.only('id', 'start_time', 'seat_version')), request, view=self
+            )
+            return seat_stamp(page)
+        return None
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('seats', 'seat_map'):
+            # Only the screen is needed to find the cached seat layout
+            queryset = queryset.select_related('screen')
+        return queryset
     
     @action(detail=True, methods=['get'])
     def seats(self, request, pk=None):
         """Get available seats for a showtime"""
         showtime = self.get_object()
-        seats = Seat.objects.filter(screen=showtime.screen)
+        layout = get_seat_layout(showtime.screen)
+        
+        from bookings.holds import release_lapsed_holds
+        release_lapsed_holds(showtime)
         
         # Get booked seat IDs
-        from bookings.models import BookedSeat
-        booked_seat_ids = BookedSeat.objects.filter(
-            booking__showtime=showtime,
-            booking__status__in=['PENDING', 'CONFIRMED']
-        ).values_list('seat_id', flat=True)
+        from bookings.models import SeatInventory
+        booked_seat_ids = set(SeatInventory.objects.filter(
+            showtime=showtime
+        ).values_list('seat_id', flat=True))
         
         # Add is_available field to each seat
-        seats_data = SeatSerializer(seats, many=True).data
+        seats_data = layout.as_seat_dicts()
         for seat in seats_data:
             seat['is_available'] = seat['id'] not in booked_seat_ids
         
-        return Response(seats_data)
\ No newline at end of file
+        return Response(seats_data)
+    
+    @action(detail=True, methods=['get'])
+    def seat_map(self, request, pk=None):
+        """
+        Compact seat availability for polling clients.
+        
+        seat_ids lists the screen's seats in layout order and taken is a base64
+        bitset over that list. Clients should send the ETag back in
+        If-None-Match and will get a 304 until a seat is taken or released.
+        """
+        showtime = self.get_object()
+        
+        # Free lapsed holds first, so the ETag changes when they go
+        from bookings.holds import release_lapsed_holds
+        if release_lapsed_holds(showtime):
+            showtime.refresh_from_db(fields=['seat_version'])
+        etag = seat_map_etag(showtime)
+        
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            client_etags = parse_etags(if_none_match)
+            if etag in client_etags or '*' in client_etags:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        response = Response(seat_map_payload(showtime))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+def seat_snapshot(showtime):
+    from bookings.holds import release_lapsed_holds
+    if release_lapsed_holds(showtime):
+        showtime.refresh_from_db(fields=['seat_version'])
+    return seat_map_payload(showtime)
+
+
+def server_sent_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def seat_events(request, pk):
+    """
+    Live seat map for one showtime as server-sent events: a snapshot event
+    (the seat_map payload), then seats events with the ids taken and released
+    by each booking change (see movies.seat_events).
+    
+    Only served by the ASGI application, where an open stream costs no
+    worker; under WSGI clients should poll seat_map instead. Streams end
+    after SEAT_EVENTS_MAX_SECONDS and EventSource reconnects, which also
+    reaps streams whose client went away unnoticed.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Live seat updates need the ASGI server'}, status=501)
+    try:
+        showtime = await Showtime.objects.select_related('screen').aget(pk=pk)
+    except Showtime.DoesNotExist:
+        raise Http404
+    
+    # Subscribe before reading the snapshot, so no change can fall in between
+    broker = get_broker()
+    subscription = await broker.subscribe(showtime.pk)
+    
+    async def stream():
+        try:
+            yield 'retry: 2000\n\n'
+            yield server_sent_event('snapshot', await sync_to_async(seat_snapshot)(showtime))
+            
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.SEAT_EVENTS_MAX_SECONDS
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), min(settings.SEAT_EVENTS_KEEPALIVE_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield server_sent_event(event['type'], event)
+        finally:
+            broker.unsubscribe(subscription)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
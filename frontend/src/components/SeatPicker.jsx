@@ -1,6 +1,18 @@
 import React, { useState, useEffect } from 'react';
 import { showtimesAPI } from '../services/api';
 
+const SEAT_MAP_POLL_MS = 10000;
+
+// seat_map/snapshot payload -> Set of taken seat ids
+const decodeTaken = ({ seat_ids, taken }) => {
+    const bits = atob(taken);
+    const ids = new Set();
+    seat_ids.forEach((seatId, index) => {
+        if (bits.charCodeAt(index >> 3) & (1 << (index & 7))) ids.add(seatId);
+    });
+    return ids;
+};
+
 const SeatPicker = ({ showtimeId, onSeatsSelected, basePrice }) => {
     const [seats, setSeats] = useState([]);
     const [selectedSeats, setSelectedSeats] = useState([]);
@@ -10,6 +22,68 @@ const SeatPicker = ({ showtimeId, onSeatsSelected, basePrice }) => {
         loadSeats();
     }, [showtimeId]);
     
+    // Keep availability live: seat deltas pushed over server-sent events, or
+    // polling the compact seat map when the server can't stream
+    useEffect(() => {
+        let source = null;
+        let pollTimer = null;
+        let etag = null;
+        
+        const applySnapshot = (snapshot) => {
+            const taken = decodeTaken(snapshot);
+            setSeats(prev => prev.map(seat => ({ ...seat, is_available: !taken.has(seat.id) })));
+            setSelectedSeats(prev => prev.filter(seat => !taken.has(seat.id)));
+        };
+        
+        const applyDelta = ({ taken, released }) => {
+            setSeats(prev => prev.map(seat => {
+                if (taken.includes(seat.id)) return { ...seat, is_available: false };
+                if (released.includes(seat.id)) return { ...seat, is_available: true };
+                return seat;
+            }));
+            setSelectedSeats(prev => prev.filter(seat => !taken.includes(seat.id)));
+        };
+        
+        const poll = async () => {
+            try {
+                const response = await showtimesAPI.getSeatMap(showtimeId, etag);
+                if (response.status === 200) {
+                    etag = response.headers.etag;
+                    applySnapshot(response.data);
+                }
+            } catch (error) {
+                console.error('Error polling seats:', error);
+            }
+        };
+        
+        const connect = () => {
+            source = new EventSource(showtimesAPI.seatEventsUrl(showtimeId));
+            source.addEventListener('snapshot', (e) => applySnapshot(JSON.parse(e.data)));
+            source.addEventListener('seats', (e) => applyDelta(JSON.parse(e.data)));
+            source.addEventListener('reset', () => {
+                source.close();
+                connect();
+            });
+            source.onerror = () => {
+                // CONNECTING means the browser is already retrying
+                if (source.readyState === EventSource.CLOSED && !pollTimer) {
+                    pollTimer = setInterval(poll, SEAT_MAP_POLL_MS);
+                }
+            };
+        };
+        
+        if (window.EventSource) {
+            connect();
+        } else {
+            pollTimer = setInterval(poll, SEAT_MAP_POLL_MS);
+        }
+        
+        return () => {
+            if (source) source.close();
+            if (pollTimer) clearInterval(pollTimer);
+        };
+    }, [showtimeId]);
+    
     const loadSeats = async () => {
         try {
             const response = await showtimesAPI.getSeats(showtimeId);
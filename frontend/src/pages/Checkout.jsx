@@ -7,6 +7,8 @@ import { format } from 'date-fns';
 
 const stripePromise = loadStripe(process.env.REACT_APP_STRIPE_PUBLIC_KEY);
 
+const PAYMENT_POLL_MS = 1000;
+
 const CheckoutForm = ({ booking, onSuccess }) => {
     const stripe = useStripe();
     const elements = useElements();
@@ -37,15 +39,28 @@ const CheckoutForm = ({ booking, onSuccess }) => {
                 return;
             }
             
-            // Process payment through backend
-            const response = await bookingsAPI.processPayment(booking.id, {
+            // The backend queues the payment; wait for the job to finish
+            let job = (await bookingsAPI.processPayment(booking.id, {
                 payment_method_id: paymentMethod.id
-            });
+            })).data;
+            while (job.status === 'QUEUED' || job.status === 'RUNNING') {
+                await new Promise(resolve => setTimeout(resolve, PAYMENT_POLL_MS));
+                job = (await bookingsAPI.getPaymentJob(job.id)).data;
+            }
             
-            if (response.data.success) {
+            if (job.status === 'REQUIRES_ACTION') {
+                // 3D Secure; the Stripe webhook confirms the booking afterwards
+                const { error: actionError } = await stripe.confirmCardPayment(job.client_secret);
+                if (actionError) {
+                    setError(actionError.message);
+                    setProcessing(false);
+                    return;
+                }
+                onSuccess(booking.id);
+            } else if (job.status === 'SUCCEEDED') {
                 onSuccess(booking.id);
             } else {
-                setError(response.data.error || 'Payment failed');
+                setError(job.error || 'Payment failed');
                 setProcessing(false);
             }
         } catch (err) {
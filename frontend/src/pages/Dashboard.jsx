@@ -23,7 +23,7 @@ const Dashboard = () => {
     
     const loadDashboardData = async () => {
     try {
-        const bookingsResponse = await bookingsAPI.getMyBookings();
+        const bookingsResponse = await bookingsAPI.getHistory({ page_size: 100 });
         const bookingsData = bookingsResponse.data.results || bookingsResponse.data;
         
         //Ensure it's an array
@@ -65,8 +65,8 @@ const Dashboard = () => {
     const now = new Date();
     const upcoming = bookingsData.filter(b => {
         try {
-            return b.showtime?.start_time && 
-                   isFuture(new Date(b.showtime.start_time)) && 
+            return b.start_time && 
+                   isFuture(new Date(b.start_time)) && 
                    b.status === 'CONFIRMED';
         } catch (e) {
             return false;
@@ -75,8 +75,8 @@ const Dashboard = () => {
     
     const past = bookingsData.filter(b => {
         try {
-            return b.showtime?.start_time && 
-                   isPast(new Date(b.showtime.start_time));
+            return b.start_time && 
+                   isPast(new Date(b.start_time));
         } catch (e) {
             return false;
         }
@@ -105,14 +105,14 @@ const getFilteredBookings = () => {
         switch (activeTab) {
             case 'upcoming':
                 return bookings.filter(b => 
-                    b.showtime?.start_time &&
-                    isFuture(new Date(b.showtime.start_time)) && 
+                    b.start_time &&
+                    isFuture(new Date(b.start_time)) && 
                     b.status === 'CONFIRMED'
                 );
             case 'past':
                 return bookings.filter(b => 
-                    b.showtime?.start_time &&
-                    isPast(new Date(b.showtime.start_time))
+                    b.start_time &&
+                    isPast(new Date(b.start_time))
                 );
             case 'all':
             default:
@@ -248,25 +248,23 @@ const getFilteredBookings = () => {
                                 <div key={booking.id} className="booking-card">
                                     <div className="booking-poster">
                                         <img 
-                                            src={booking.showtime.movie.poster_url} 
-                                            alt={booking.showtime.movie.title} 
+                                            src={booking.poster_image} 
+                                            alt={booking.movie_title} 
                                         />
                                     </div>
                                     
                                     <div className="booking-details">
-                                        <h3>{booking.showtime.movie.title}</h3>
+                                        <h3>{booking.movie_title}</h3>
                                         <p className="booking-cinema">
-                                            {booking.showtime.screen.cinema.name}
+                                            {booking.cinema_name}
                                         </p>
                                         <p className="booking-datetime">
-                                            📅 {format(new Date(booking.showtime.start_time), 'EEEE, MMMM d, yyyy')}
+                                            📅 {format(new Date(booking.start_time), 'EEEE, MMMM d, yyyy')}
                                             <br />
-                                            🕐 {format(new Date(booking.showtime.start_time), 'h:mm a')}
+                                            🕐 {format(new Date(booking.start_time), 'h:mm a')}
                                         </p>
                                         <p className="booking-seats">
-                                            🪑 Seats: {booking.booked_seats.map(bs => 
-                                                `${bs.seat.row}${bs.seat.number}`
-                                            ).join(', ')}
+                                            🪑 Seats: {booking.seats.join(', ')}
                                         </p>
                                     </div>
                                     
@@ -278,7 +276,7 @@ const getFilteredBookings = () => {
                                         </div>
                                         
                                         {booking.status === 'CONFIRMED' && 
-                                         isFuture(new Date(booking.showtime.start_time)) && (
+                                         isFuture(new Date(booking.start_time)) && (
                                             <div className="action-buttons">
                                                 <Link 
                                                     to={`/booking/confirmation/${booking.id}`}
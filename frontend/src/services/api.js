@@ -70,21 +70,35 @@ export const cinemasAPI = {
     
     getAll: () => api.get('/movies/cinemas/'),
     getById: (id) => api.get(`/movies/cinemas/${id}/`),
+    // Every showtime at the cinema on date (YYYY-MM-DD), grouped by movie and screen
+    getSchedule: (id, date) => api.get(`/movies/cinemas/${id}/schedule/`, { params: { date } }),
 };
 
 export const showtimesAPI = {
     
     getById: (id) => api.get(`/movies/showtimes/${id}/`),
     getSeats: (id) => api.get(`/movies/showtimes/${id}/seats/`),
+    // Compact availability bitset; pass the last ETag to get a 304 when nothing changed
+    getSeatMap: (id, etag) => api.get(`/movies/showtimes/${id}/seat_map/`, {
+        headers: etag ? { 'If-None-Match': etag } : {},
+        validateStatus: (status) => status === 200 || status === 304,
+    }),
+    // Server-sent events: a snapshot, then seat deltas as bookings change
+    seatEventsUrl: (id) => `${API_URL}/movies/showtimes/${id}/seat_events/`,
 };
 
 export const bookingsAPI = {
     
     create: (data) => api.post('/bookings/bookings/', data),
+    createBatch: (bookings) => api.post('/bookings/bookings/batch/', { bookings }),
     getMyBookings: () => api.get('/bookings/bookings/'),
+    // Flat history; params.when is 'upcoming' or 'past'
+    getHistory: (params) => api.get('/bookings/bookings/history/', { params }),
     getById: (id) => api.get(`/bookings/bookings/${id}/`),
     cancel: (id) => api.post(`/bookings/bookings/${id}/cancel/`),
+    // Queues a payment job (202); poll getPaymentJob until it leaves QUEUED/RUNNING
     processPayment: (id, data) => api.post(`/bookings/bookings/${id}/process_payment/`, data),
+    getPaymentJob: (jobId) => api.get(`/bookings/bookings/payment_jobs/${jobId}/`),
 };
 
 export const authAPI = {